@@ -1,181 +1,413 @@
 import os
 import json
-import sqlite3
-from datetime import datetime, timedelta, timezone
-from flask import Flask, request, jsonify, redirect, session, send_from_directory, make_response
+import base64
+import hashlib
+import secrets
+import threading
+import time
+from datetime import datetime, timezone
+from flask import Flask, request, jsonify, redirect, session, send_from_directory, make_response, g
 from flask_cors import CORS
 import requests
-import base64
 from urllib.parse import urlencode
+from db import (RUN_TYPES, database, init_db, parse_timestamp, save_song, save_songs,
+                get_songs_page, get_sole_athlete_id, get_athlete_by_api_token, get_api_token, save_user,
+                songs_last_modified, mark_activity_processed, is_activity_processed, upsert_activities,
+                delete_activity, list_runs, activities_last_modified, get_activity_sync, set_activity_sync,
+                newest_activity_start, get_run_songs, get_songs_for_runs, top_tracks, to_epoch_ms,
+                get_cache_generation, save_activity_streams, get_activity_streams, get_run_plays,
+                get_user_tokens, get_backfill, storage_stats)
+from backfill import DescriptionBackfill, StravaRateBudget, description_hash
+from http_client import HttpClient
+from jobs import JobQueue, PermanentJobError, RetryLaterError
+from maintenance import Maintenance
+from metrics import REGISTRY
+from response_cache import CachedResponse, ResponseCache
+from run_analytics import fastest_songs, pack_streams, song_splits, unpack_streams
+from enrichment import SpotifyLookupError, SpotifyRateLimited, lookup_concurrently
+from spotify_auth import SpotifyTokenManager
+from static_assets import StaticAssets
+from strava_auth import StravaTokenError, StravaTokenManager
+from track_cache import MISSING, TrackMetadataCache, normalize_key
 
-app = Flask(__name__)
-CORS(app, origins=["https://runningtunes-frontend.onrender.com"])
+# static_folder=None: Flask's own /static route would shadow the React bundles
+app = Flask(__name__, static_folder=None)
+# Set SECRET_KEY in production so login sessions survive restarts and are
+# shared between gunicorn workers
+app.secret_key = os.getenv('SECRET_KEY') or secrets.token_hex(32)
+# The frontend is served from another site, so the session cookie has to
+# be SameSite=None (and therefore Secure) to ride along on its API calls
+app.config.update(
+    SESSION_COOKIE_SAMESITE='None',
+    SESSION_COOKIE_SECURE=os.getenv('SESSION_COOKIE_SECURE', 'true').lower() == 'true'
+)
+CORS(app, origins=["https://runningtunes-frontend.onrender.com"], supports_credentials=True)
 
 # Serve React App
+# Indexed and precompressed once here; a redeploy restarts the workers
+static_assets = StaticAssets(os.path.join(app.root_path, 'build'))
+
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
 def serve_react(path):
-    if path != "" and os.path.exists(f"build/{path}"):
-        return send_from_directory('build', path)
-    else:
-        return send_from_directory('build', 'index.html')
+    asset = static_assets.find(path)
+    if asset is None:
+        return jsonify({'error': 'Not found'}), 404
+    if asset.body is None:
+        response = send_from_directory('build', asset.path, etag=asset.etag, conditional=True)
+        response.headers['Cache-Control'] = asset.cache_control
+        return response
+
+    encodings = request.accept_encodings
+    encoding = next((e for e in ('br', 'gzip') if e in asset.variants and encodings[e]), None)
+    response = make_response(asset.variants[encoding] if encoding else asset.body)
+    response.content_type = asset.mimetype
+    response.set_etag(f'{asset.etag}-{encoding}' if encoding else asset.etag)
+    response.headers['Cache-Control'] = asset.cache_control
+    if asset.variants:
+        response.vary.add('Accept-Encoding')
+    if encoding:
+        response.content_encoding = encoding
+    return response.make_conditional(request)
 
 # ============ CONFIGURATION ============
 CLIENT_ID = os.getenv('STRAVA_CLIENT_ID')
 CLIENT_SECRET = os.getenv('STRAVA_CLIENT_SECRET')
 STRAVA_VERIFY_TOKEN = "gopherrunclub"
+STRAVA_URL = os.getenv('STRAVA_URL', 'https://www.strava.com')
 SPOTIFY_CLIENT_ID = os.getenv('SPOTIFY_CLIENT_ID')
 SPOTIFY_CLIENT_SECRET = os.getenv('SPOTIFY_CLIENT_SECRET')
+SPOTIFY_API_URL = os.getenv('SPOTIFY_API_URL', 'https://api.spotify.com')
+SPOTIFY_ACCOUNTS_URL = os.getenv('SPOTIFY_ACCOUNTS_URL', 'https://accounts.spotify.com')
+# Max parallel Spotify searches when enriching a run's songs
+SPOTIFY_SEARCH_CONCURRENCY = int(os.getenv('SPOTIFY_SEARCH_CONCURRENCY', '8'))
 
-DB_PATH = 'spotify_strava.db'
+# Background threads per process that work through queued webhook events
+WEBHOOK_WORKERS = int(os.getenv('WEBHOOK_WORKERS', '2'))
+# Read APIs trigger a background Strava sync when the local copy is older than this
+ACTIVITY_SYNC_INTERVAL = int(os.getenv('ACTIVITY_SYNC_INTERVAL', '900'))
+# Runs with songs whose streams each background sync fetches, newest first,
+# so synced history reaches /api/fastest-songs a batch at a time
+STREAM_FETCHES_PER_SYNC = int(os.getenv('STREAM_FETCHES_PER_SYNC', '50'))
+# Strava tokens of active athletes are refreshed this long before they expire
+STRAVA_TOKEN_REFRESH_LEAD = int(os.getenv('STRAVA_TOKEN_REFRESH_LEAD', '600'))
+# Upper bound on records accepted by a single /log-spotify/batch request,
+# and on its body: a record is a track name, an artist and a timestamp
+MAX_BATCH_SIZE = 1000
+MAX_BATCH_BYTES = MAX_BATCH_SIZE * 1024
+# Runs per /api/runs page unless the client asks for ?limit=, and the cap on it
+RUNS_PAGE_SIZE = int(os.getenv('RUNS_PAGE_SIZE', '10'))
+MAX_RUNS_PAGE_SIZE = 200
+# Rendered read-API responses kept per process, and an optional SQLite file
+# that shares them between the gunicorn workers on one machine
+RESPONSE_CACHE_ENTRIES = int(os.getenv('RESPONSE_CACHE_ENTRIES', '1024'))
+RESPONSE_CACHE_PATH = os.getenv('RESPONSE_CACHE_PATH')
+# Total body bytes the in-process response cache holds per worker
+RESPONSE_CACHE_BYTES = int(os.getenv('RESPONSE_CACHE_BYTES', str(32 * 1024 * 1024)))
+# Bearer token for the /admin endpoints; they are disabled when unset
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')
+# Parallel description PUTs per backfill, and Strava's app limits (per 15 min, per day)
+BACKFILL_WORKERS = int(os.getenv('BACKFILL_WORKERS', '4'))
+STRAVA_RATE_LIMIT_15MIN = int(os.getenv('STRAVA_RATE_LIMIT_15MIN', '200'))
+STRAVA_RATE_LIMIT_DAILY = int(os.getenv('STRAVA_RATE_LIMIT_DAILY', '2000'))
+# Raw song samples are kept this long once folded into plays, plays this
+# long before moving to the month archive; one worker checks every interval
+SAMPLE_RETENTION_DAYS = int(os.getenv('SAMPLE_RETENTION_DAYS', '30'))
+ARCHIVE_AFTER_DAYS = int(os.getenv('ARCHIVE_AFTER_DAYS', '180'))
+MAINTENANCE_INTERVAL = int(os.getenv('MAINTENANCE_INTERVAL', str(6 * 3600)))
+# Samples per /debug/songs page unless the client asks for ?limit=, and the cap on it
+SONGS_PAGE_SIZE = 1000
+MAX_SONGS_PAGE_SIZE = 10000
 # Frontend URL for redirecting users after auth
 FRONTEND_URL = os.getenv('FRONTEND_URL', 'https://runningtunes-frontend.onrender.com')
 # Backend URL for Strava callback
 BACKEND_URL = os.getenv('BACKEND_URL', 'https://runningtunes-backend.onrender.com')
 
-# ============ DB SETUP ============
-def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY,
-            athlete_id INTEGER UNIQUE,
-            access_token TEXT,
-            refresh_token TEXT,
-            expires_at INTEGER
-        )
-    ''')
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS spotify_songs (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            artist TEXT NOT NULL,
-            played_at TEXT NOT NULL UNIQUE
-        )
-    ''')
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS processed_activities (
-            id INTEGER PRIMARY KEY,
-            updated_at TEXT NOT NULL
-        )
-    ''')
-    conn.commit()
-    conn.close()
+# Larger request bodies get a 413 before they are read; the batch upload
+# is the largest body any route takes
+app.config['MAX_CONTENT_LENGTH'] = MAX_BATCH_BYTES
 
+# ============ DB SETUP ============
 init_db()
 
+track_cache = TrackMetadataCache(database)
+response_cache = ResponseCache(RESPONSE_CACHE_PATH, max_entries=RESPONSE_CACHE_ENTRIES,
+                               max_bytes=RESPONSE_CACHE_BYTES)
+upstream = HttpClient()
+webhook_queue = JobQueue(database)
+spotify_tokens = SpotifyTokenManager(SPOTIFY_CLIENT_ID, SPOTIFY_CLIENT_SECRET, upstream,
+                                     token_url=f'{SPOTIFY_ACCOUNTS_URL}/api/token')
+strava_tokens = StravaTokenManager(CLIENT_ID, CLIENT_SECRET, upstream, token_url=f'{STRAVA_URL}/oauth/token')
+strava_budget = StravaRateBudget(STRAVA_RATE_LIMIT_15MIN, STRAVA_RATE_LIMIT_DAILY)
+maintenance = Maintenance(MAINTENANCE_INTERVAL, SAMPLE_RETENTION_DAYS, ARCHIVE_AFTER_DAYS)
+
+# ============ METRICS ============
+REQUEST_SECONDS = REGISTRY.histogram('http_request_seconds', 'Request latency by route; streamed bodies excluded',
+                                     ['route', 'method', 'status'])
+STAGE_SECONDS = REGISTRY.histogram('stage_seconds', 'Time spent in each stage of webhook processing and enrichment',
+                                   ['stage'])
+
+REGISTRY.collected('webhook_jobs', 'Webhook jobs by status',
+                   lambda: {(k,): v for k, v in webhook_queue.stats().items() if k != 'oldest_pending_age'},
+                   labels=['status'])
+REGISTRY.collected('webhook_oldest_pending_age_seconds', 'Age of the oldest webhook job that is due',
+                   lambda: webhook_queue.stats()['oldest_pending_age'])
+REGISTRY.collected('track_cache_lookups_total', 'Track metadata cache lookups by result',
+                   lambda: {(k,): v for k, v in track_cache.snapshot().items()
+                            if k in ('memory_hits', 'db_hits', 'negative_hits', 'misses')},
+                   labels=['result'], kind='counter')
+REGISTRY.collected('track_cache_hit_ratio', 'Share of track metadata lookups answered from cache',
+                   lambda: track_cache.snapshot()['hit_rate'])
+REGISTRY.collected('response_cache_lookups_total', 'Read API response cache lookups by result',
+                   lambda: {(k,): v for k, v in response_cache.snapshot().items()
+                            if k in ('memory_hits', 'shared_hits', 'misses')},
+                   labels=['result'], kind='counter')
+REGISTRY.collected('token_refreshes_total', 'Upstream OAuth token refreshes by provider',
+                   lambda: {('strava',): strava_tokens.refresh_count, ('spotify',): spotify_tokens.refresh_count},
+                   labels=['provider'], kind='counter')
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_time(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        REQUEST_SECONDS.observe(time.perf_counter() - started, route=route, method=request.method,
+                                status=response.status_code)
+    return response
+
 # ============ Helper Functions ============
 
-def save_song(name, artist, played_at):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+def current_athlete_id():
+    """The athlete a request acts for, or None.
+
+    A tracker authenticates with `Authorization: Bearer <api_token>`, the
+    browser with the session cookie set by the Strava callback. Without
+    either, a deployment with exactly one connected user keeps working the
+    way it did before there were several. g.signed_in records whether the
+    identity was proven; the fallback must not hand out credentials.
+    """
+    g.signed_in = False
+    auth = request.headers.get('Authorization', '')
+    if auth.startswith('Bearer '):
+        athlete_id = get_athlete_by_api_token(auth[len('Bearer '):].strip())
+        g.signed_in = athlete_id is not None
+        return athlete_id
+    athlete_id = session.get('athlete_id')
+    if athlete_id:
+        g.signed_in = True
+        return athlete_id
+    return get_sole_athlete_id()
+
+def not_signed_in():
+    return jsonify({'error': 'Not signed in'}), 401
+
+def validate_song(record):
+    """Return an error message for a bad song record, or None if it is valid"""
+    if not isinstance(record, dict):
+        return 'Record must be an object'
+    for field in ('name', 'artist', 'played_at'):
+        value = record.get(field)
+        if not isinstance(value, str) or not value.strip():
+            return f'Missing or empty field: {field}'
     try:
-        c.execute('INSERT INTO spotify_songs (name, artist, played_at) VALUES (?, ?, ?)',
-                  (name, artist, played_at))
-        conn.commit()
-    except sqlite3.IntegrityError:
-        pass
-    finally:
-        conn.close()
-
-def get_songs_in_range(start_time, end_time):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute('''
-        SELECT name, artist, played_at FROM spotify_songs
-        WHERE played_at BETWEEN ? AND ?
-        ORDER BY played_at ASC
-    ''', (start_time, end_time))
-    rows = c.fetchall()
-    conn.close()
-    return [{'name': r[0], 'artist': r[1], 'played_at': r[2]} for r in rows]
+        parse_timestamp(record['played_at'])
+    except ValueError:
+        return 'played_at is not an ISO 8601 timestamp'
+    return None
+
+def parse_song_batch(body, content_type):
+    """Parse a batch body: NDJSON (one object per line) when the Content-Type says so, else a JSON array"""
+    text = body.decode('utf-8')
+    if 'ndjson' in (content_type or ''):
+        records = []
+        for line in text.splitlines():
+            if line.strip():
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    records.append(None)
+        return records
+    records = json.loads(text)
+    if not isinstance(records, list):
+        raise ValueError('Batch body must be a JSON array')
+    return records
 
 def get_user_access_token(athlete_id):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute('SELECT access_token, refresh_token, expires_at FROM users WHERE athlete_id=?', (athlete_id,))
-    row = c.fetchone()
-    conn.close()
+    """The athlete's Strava token from strava_tokens, refreshed only if the scheduler fell behind"""
+    return strava_tokens.get_token(athlete_id)
 
-    if not row:
-        return None
+def strava_retry_after(response):
+    """Seconds to wait after a Strava 429: Retry-After if sent, else until the 15-minute window resets"""
+    try:
+        return float(response.headers['Retry-After'])
+    except (KeyError, ValueError):
+        now = time.time()
+        return 15 * 60 - now % (15 * 60) + 1
 
-    access_token, refresh_token, expires_at = row
-
-    if datetime.now(timezone.utc).timestamp() > expires_at:
-        resp = requests.post('https://www.strava.com/oauth/token', data={
-            'client_id': CLIENT_ID,
-            'client_secret': CLIENT_SECRET,
-            'grant_type': 'refresh_token',
-            'refresh_token': refresh_token
-        })
-        new_data = resp.json()
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        c.execute('''
-            UPDATE users SET access_token=?, refresh_token=?, expires_at=? WHERE athlete_id=?
-        ''', (
-            new_data['access_token'],
-            new_data['refresh_token'],
-            new_data['expires_at'],
-            athlete_id
-        ))
-        conn.commit()
-        conn.close()
-        return new_data['access_token']
-
-    return access_token
+def check_strava_response(response, what):
+    """Raise a retryable error for anything but a 200 from a webhook job's Strava call"""
+    strava_budget.observe(response)
+    if response.status_code == 429:
+        raise RetryLaterError(f'Strava rate limited the {what}', strava_retry_after(response))
+    if response.status_code != 200:
+        raise RuntimeError(f'Strava answered {response.status_code} to the {what}')
 
 def get_strava_activity(activity_id, access_token):
     headers = {'Authorization': f'Bearer {access_token}'}
-    response = requests.get(f'https://www.strava.com/api/v3/activities/{activity_id}', headers=headers)
+    response = upstream.get(f'{STRAVA_URL}/api/v3/activities/{activity_id}',
+                            endpoint='strava.activity.get', headers=headers)
+    check_strava_response(response, 'activity fetch')
     return response.json()
 
-def update_strava_description(activity_id, access_token, description):
+def get_strava_streams(activity_id, access_token):
+    """Time, distance and heart-rate streams keyed by type, {} if the activity has none, None on failure"""
     headers = {'Authorization': f'Bearer {access_token}'}
-    response = requests.put(f'https://www.strava.com/api/v3/activities/{activity_id}',
-                            headers=headers, data={'description': description})
-    return response.status_code == 200
-
-def mark_activity_processed(activity_id):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute('INSERT OR REPLACE INTO processed_activities (id, updated_at) VALUES (?, ?)',
-              (activity_id, datetime.now(timezone.utc).isoformat()))
-    conn.commit()
-    conn.close()
-
-def is_activity_processed(activity_id):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute('SELECT id FROM processed_activities WHERE id=?', (activity_id,))
-    result = c.fetchone()
-    conn.close()
-    return result is not None
+    try:
+        response = upstream.get(f'{STRAVA_URL}/api/v3/activities/{activity_id}/streams',
+                                endpoint='strava.activity.streams', headers=headers,
+                                params={'keys': 'time,distance,heartrate', 'key_by_type': 'true'})
+    except requests.RequestException:
+        return None
+    strava_budget.observe(response)
+    if response.status_code == 404:
+        return {}
+    if response.status_code != 200:
+        return None
+    return response.json()
+
+def load_activity_streams(athlete_id, activity_id):
+    """Unpacked streams for an activity, fetched from Strava the first time.
+
+    Returns None when the activity has no streams, and sets g.uncacheable
+    when Strava could not be asked.
+    """
+    cached = get_activity_streams([activity_id]).get(activity_id)
+    if cached is None:
+        try:
+            access_token = get_user_access_token(athlete_id)
+        except StravaTokenError as e:
+            print(f"Could not get a Strava token for {athlete_id}: {e}")
+            g.uncacheable = True
+            return None
+        data = get_strava_streams(activity_id, access_token) if access_token else None
+        if data is None:
+            g.uncacheable = True
+            return None
+        cached = pack_streams(data)
+        save_activity_streams(athlete_id, activity_id, cached)
+    return unpack_streams(cached)
+
+def put_strava_description(activity_id, access_token, description):
+    headers = {'Authorization': f'Bearer {access_token}'}
+    return upstream.put(f'{STRAVA_URL}/api/v3/activities/{activity_id}',
+                        endpoint='strava.activity.put', headers=headers, data={'description': description})
 
 def format_description(songs):
-    """Format description with unique songs only"""
+    """Format description from the plays in a run"""
     if not songs:
         return "🏃 Great run! No Spotify songs logged."
     
-    # Additional deduplication in case database query didn't catch everything
-    unique_songs = {}
-    for song in songs:
-        key = f"{song['name']}|{song['artist']}"  # Use name+artist as unique key
-        if key not in unique_songs:
-            unique_songs[key] = song
-    
-    unique_song_list = list(unique_songs.values())
-    
     desc = "🏃 Great run!\n🎶 Songs listened to:\n"
-    for s in unique_song_list:
+    for s in songs:
         desc += f"- {s['name']} – {s['artist']}\n"
     
     return desc.strip()
 
 # ============ Routes ============
 
+def is_admin():
+    auth = request.headers.get('Authorization', '')
+    return bool(ADMIN_TOKEN) and secrets.compare_digest(auth, f'Bearer {ADMIN_TOKEN}')
+
+def describe_run(activity_id):
+    """The description the webhook would write for a run, or None when it has no songs"""
+    songs = get_run_songs(activity_id)
+    return format_description(songs) if songs else None
+
+_backfills = set()
+_backfills_lock = threading.Lock()
+
+@app.route('/admin/backfill/<int:athlete_id>', methods=['GET', 'POST'])
+def admin_backfill(athlete_id):
+    """Re-describe an athlete's whole run history on Strava.
+
+    POST syncs their activities and starts (or resumes) a backfill in the
+    background; ?dry_run=1 instead answers right away with what would
+    change, ?restart=1 ignores the checkpoint, and ?force=1 resumes one that
+    looks like it is still running elsewhere (after a crash). GET reports
+    progress.
+    """
+    if not is_admin():
+        return jsonify({'error': 'Forbidden'}), 403
+    if request.method == 'GET':
+        return jsonify({'backfill': get_backfill(athlete_id), 'running': athlete_id in _backfills,
+                        'budget': strava_budget.snapshot()})
+    if not get_user_tokens(athlete_id):
+        return jsonify({'error': 'Unknown athlete'}), 404
+
+    backfill = DescriptionBackfill(
+        athlete_id, describe_run,
+        lambda activity_id, description: put_strava_description(activity_id, get_user_access_token(athlete_id),
+                                                                description),
+        strava_budget, workers=BACKFILL_WORKERS, dry_run=request.args.get('dry_run') == '1'
+    )
+    restart = request.args.get('restart') == '1'
+    if backfill.dry_run:
+        ensure_activities_synced(athlete_id)
+        return jsonify(backfill.run(restart))
+
+    with _backfills_lock:
+        # Another worker process may be running it too; its checkpoint is fresh then
+        checkpoint = get_backfill(athlete_id)
+        running_elsewhere = (checkpoint and checkpoint['status'] == 'running'
+                             and time.time() - checkpoint['updated_at'] < 20 * 60)
+        if athlete_id in _backfills or (running_elsewhere and request.args.get('force') != '1'):
+            return jsonify({'error': 'Backfill already running', 'backfill': checkpoint}), 409
+        _backfills.add(athlete_id)
+
+    def run():
+        try:
+            sync_activities(athlete_id)
+            stats = backfill.run(restart)
+            print(f"Backfill for {athlete_id} finished: {stats}")
+        except Exception as e:
+            print(f"Backfill for {athlete_id} stopped: {e}")
+        finally:
+            with _backfills_lock:
+                _backfills.discard(athlete_id)
+
+    threading.Thread(target=run, name=f'backfill-{athlete_id}', daemon=True).start()
+    return jsonify({'status': 'started', 'backfill': get_backfill(athlete_id)}), 202
+
+_maintenance_running = threading.Event()
+
+@app.route('/admin/maintenance', methods=['GET', 'POST'])
+def admin_maintenance():
+    """Storage sizes and the last retention run; POST starts a run now in the background"""
+    if not is_admin():
+        return jsonify({'error': 'Forbidden'}), 403
+    if request.method == 'GET':
+        return jsonify({'last_run': maintenance.last_run(), 'running': _maintenance_running.is_set(),
+                        'storage': storage_stats()})
+    if _maintenance_running.is_set():
+        return jsonify({'error': 'Maintenance already running'}), 409
+    _maintenance_running.set()
+
+    def run():
+        try:
+            maintenance.run_once(force=True)
+        except Exception as e:
+            print(f"Maintenance stopped: {e}")
+        finally:
+            _maintenance_running.clear()
+
+    threading.Thread(target=run, name='maintenance-now', daemon=True).start()
+    return jsonify({'status': 'started'}), 202
+
 @app.route('/debug/config')
 def debug_config():
     return jsonify({
@@ -185,17 +417,51 @@ def debug_config():
 
 @app.route('/log-spotify', methods=['POST'])
 def log_spotify():
-    data = request.json
-    if not data or 'name' not in data or 'artist' not in data or 'played_at' not in data:
-        return jsonify({'error': 'Invalid data'}), 400
-    save_song(data['name'], data['artist'], data['played_at'])
+    athlete_id = current_athlete_id()
+    if not athlete_id:
+        return not_signed_in()
+    data = request.get_json(silent=True)
+    error = validate_song(data)
+    if error:
+        return jsonify({'error': f'Invalid data: {error}'}), 400
+    save_song(athlete_id, data['name'], data['artist'], data['played_at'])
     return jsonify({'status': 'logged'})
 
+@app.route('/log-spotify/batch', methods=['POST'])
+def log_spotify_batch():
+    athlete_id = current_athlete_id()
+    if not athlete_id:
+        return not_signed_in()
+    try:
+        records = parse_song_batch(request.get_data(), request.content_type)
+    except ValueError as e:
+        return jsonify({'error': f'Invalid batch: {e}'}), 400
+
+    if len(records) > MAX_BATCH_SIZE:
+        return jsonify({'error': f'Batch too large (max {MAX_BATCH_SIZE} records)'}), 413
+
+    valid = []
+    errors = []
+    for index, record in enumerate(records):
+        error = validate_song(record)
+        if error:
+            errors.append({'index': index, 'error': error})
+        else:
+            valid.append(record)
+
+    accepted = save_songs(athlete_id, valid) if valid else 0
+    return jsonify({
+        'accepted': accepted,
+        'duplicates': len(valid) - accepted,
+        'invalid': len(errors),
+        'errors': errors
+    })
+
 @app.route('/strava/auth')
 def strava_auth():
     redirect_uri = f'{BACKEND_URL}/strava/callback'
     print(f"Auth redirect_uri: {redirect_uri}")  # Debug log
-    return redirect(f'https://www.strava.com/oauth/authorize?client_id={CLIENT_ID}'
+    return redirect(f'{STRAVA_URL}/oauth/authorize?client_id={CLIENT_ID}'
                     f'&redirect_uri={redirect_uri}&response_type=code'
                     f'&scope=activity:read_all,activity:write')
 
@@ -210,7 +476,7 @@ def strava_callback():
     # Use the same redirect_uri that was used in the auth request
     redirect_uri = f'{BACKEND_URL}/strava/callback'
     
-    response = requests.post('https://www.strava.com/oauth/token', data={
+    response = upstream.post(f'{STRAVA_URL}/oauth/token', endpoint='strava.oauth.token', data={
         'client_id': CLIENT_ID,
         'client_secret': CLIENT_SECRET,
         'code': code,
@@ -223,19 +489,11 @@ def strava_callback():
         print(f"Strava auth error: {data}")  # Debug logging
         return f'Failed to authenticate: {data}', 400
 
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute('''
-        INSERT OR REPLACE INTO users (athlete_id, access_token, refresh_token, expires_at)
-        VALUES (?, ?, ?, ?)
-    ''', (
-        data['athlete']['id'],
-        data['access_token'],
-        data['refresh_token'],
-        data['expires_at']
-    ))
-    conn.commit()
-    conn.close()
+    save_user(data['athlete']['id'], data['access_token'], data['refresh_token'], data['expires_at'])
+    strava_tokens.remember(data['athlete']['id'], data['access_token'], data['expires_at'])
+    session['athlete_id'] = data['athlete']['id']
+    session.permanent = True
+    start_background_sync(data['athlete']['id'])
 
     # Redirect to frontend after successful auth
     return redirect(f"{FRONTEND_URL}")
@@ -266,58 +524,77 @@ def webhook():
             return 'No data', 400
 
         if event.get('object_type') == 'activity':
-            activity_id = event.get('object_id')
-            athlete_id = event.get('owner_id')
-            aspect_type = event.get('aspect_type')
-
-            if is_activity_processed(activity_id):
-                return 'Already processed', 200
+            # Strava wants an answer within 2 seconds, so only queue the
+            # event here; webhook workers do the Strava round trips
+            if not event.get('object_id') or not event.get('aspect_type'):
+                return 'Invalid event', 400
+            webhook_queue.enqueue(event['object_id'], event.get('owner_id'), event['aspect_type'])
+            return 'Queued', 200
 
-            access_token = get_user_access_token(athlete_id)
-            if not access_token:
-                return 'User not authorized', 403
+        return 'Ignored event', 200
 
-            activity = get_strava_activity(activity_id, access_token)
-            if 'start_date' not in activity or 'elapsed_time' not in activity:
-                return 'Invalid activity data', 400
+def process_activity_event(job):
+    """Webhook job handler: keep the local activity copy current and write
+    the run's songs into the Strava description"""
+    activity_id = job['activity_id']
+    if job['aspect_type'] == 'delete':
+        delete_activity(activity_id)
+        return
 
-            start_time = activity['start_date']
-            elapsed = activity['elapsed_time']
-            start_dt = datetime.strptime(start_time, '%Y-%m-%dT%H:%M:%SZ')
-            end_dt = start_dt + timedelta(seconds=elapsed)
+    with STAGE_SECONDS.time(stage='webhook.token'):
+        access_token = get_user_access_token(job['athlete_id'])
+    if not access_token:
+        raise PermanentJobError('User not authorized')
 
-            songs = get_songs_in_range(start_time, end_dt.strftime('%Y-%m-%dT%H:%M:%SZ'))
-            description = format_description(songs)
+    with STAGE_SECONDS.time(stage='webhook.fetch'):
+        activity = get_strava_activity(activity_id, access_token)
+    if 'start_date' not in activity or 'elapsed_time' not in activity:
+        raise PermanentJobError('Invalid activity data')
+    with STAGE_SECONDS.time(stage='webhook.store'):
+        upsert_activities(job['athlete_id'], [activity])
+    # upsert_activities drops cached streams when the run's window changed,
+    # so an edit that only touched the title or description fetches nothing
+    if activity.get('type') in RUN_TYPES and not get_activity_streams([activity_id]):
+        # Cached now so per-song splits never wait on Strava; a failure
+        # here is retried by the next read instead of failing the job
+        with STAGE_SECONDS.time(stage='webhook.streams'):
+            streams = get_strava_streams(activity_id, access_token)
+            if streams is not None:
+                save_activity_streams(job['athlete_id'], activity_id, pack_streams(streams))
 
-            if update_strava_description(activity_id, access_token, description):
-                mark_activity_processed(activity_id)
-                return 'Updated', 200
-            else:
-                return 'Failed to update Strava', 500
+    if is_activity_processed(activity_id):
+        return
 
-        return 'Ignored event', 200
+    with STAGE_SECONDS.time(stage='webhook.describe'):
+        description = format_description(get_run_songs(activity_id))
+        check_strava_response(put_strava_description(activity_id, access_token, description), 'description update')
+    mark_activity_processed(activity_id, description_hash(description))
 
 @app.route('/api/user')
 def api_user():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute('SELECT athlete_id FROM users LIMIT 1')
-    row = c.fetchone()
-    conn.close()
-    
-    if not row:
-        return jsonify({'error': 'No user connected'}), 404
+    athlete_id = current_athlete_id()
+    if not athlete_id:
+        return not_signed_in()
+    signed_in = g.signed_in
+    # Signed-in and fallback answers differ, so they are cached apart
+    key = request.full_path if signed_in else f'{request.full_path}#unauthenticated'
+    return cached_response(athlete_id, lambda: render_user(athlete_id, signed_in), key=key)
 
-    athlete_id = row[0]
-    
+def render_user(athlete_id, signed_in):
     # Get additional user info from Strava
     access_token = get_user_access_token(athlete_id)
     user_info = {'athlete_id': athlete_id}
+    # The API token is what this runner's tracker sends to /log-spotify; only
+    # a caller that proved who they are gets it, never the sole-user fallback
+    if signed_in:
+        user_info['api_token'] = get_api_token(athlete_id)
     
+    # Without the Strava profile the answer is incomplete, so it is not cached
+    g.uncacheable = True
     if access_token:
         headers = {'Authorization': f'Bearer {access_token}'}
         try:
-            response = requests.get('https://www.strava.com/api/v3/athlete', headers=headers)
+            response = upstream.get(f'{STRAVA_URL}/api/v3/athlete', endpoint='strava.athlete.get', headers=headers)
             if response.status_code == 200:
                 athlete_data = response.json()
                 user_info.update({
@@ -327,6 +604,7 @@ def api_user():
                     'state': athlete_data.get('state'),
                     'country': athlete_data.get('country')
                 })
+                g.uncacheable = False
         except:
             pass
     
@@ -335,41 +613,35 @@ def api_user():
 # Add this new route for getting the last run with songs
 @app.route('/api/last-run')
 def api_last_run():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute('SELECT athlete_id FROM users LIMIT 1')
-    row = c.fetchone()
-    conn.close()
-    
-    if not row:
-        return jsonify({'error': 'No user connected'}), 404
+    athlete_id = current_athlete_id()
+    if not athlete_id:
+        return not_signed_in()
+    ensure_activities_synced(athlete_id)
+    return cached_response(athlete_id, lambda: render_last_run(athlete_id))
 
-    athlete_id = row[0]
+def render_last_run(athlete_id):
     last_run = get_user_last_run(athlete_id)
     
     if not last_run:
         return jsonify({'error': 'No runs found'}), 404
     
-    # Get songs for this run
-    start_time = last_run['start_date']
-    elapsed = last_run['elapsed_time']
-    start_dt = datetime.strptime(start_time, '%Y-%m-%dT%H:%M:%SZ')
-    end_dt = start_dt + timedelta(seconds=elapsed)
-    
-    songs = get_songs_in_range(start_time, end_dt.strftime('%Y-%m-%dT%H:%M:%SZ'))
+    # Songs for this run were matched when the activity was stored
+    songs = get_run_songs(last_run['id'])
     
     # Enrich songs with Spotify metadata
     enriched_songs = enrich_songs_with_spotify_data(songs)
 
-    # Deduplicate songs using name+artist as unique key
-    unique_songs = {}
-    for song in enriched_songs:
-        key = f"{song.get('name', '')}|{song.get('artist', '')}"
-        if key not in unique_songs:
-            unique_songs[key] = song
-    
-    # Convert back to list
-    deduplicated_songs = list(unique_songs.values())
+    # Distance, pace and heart rate while each song played
+    streams = load_activity_streams(athlete_id, last_run['id'])
+    if streams is not None:
+        plays = [row[2:] for row in get_run_plays(athlete_id, last_run['id'])]
+        start_ms = to_epoch_ms(last_run['start_date'])
+        splits = {(s['name'], s['artist']): s for s in song_splits(streams, start_ms, plays)}
+        for song in enriched_songs:
+            split = splits.get((song['name'], song['artist']))
+            if split:
+                song.update(distance=split['distance'], pace=split['pace'],
+                            average_heartrate=split['average_heartrate'])
     
     # Add songs to the run data
     run_data = {
@@ -385,95 +657,159 @@ def api_last_run():
         'max_speed': last_run.get('max_speed'),
         'average_heartrate': last_run.get('average_heartrate'),
         'max_heartrate': last_run.get('max_heartrate'),
-        'songs': deduplicated_songs
+        'songs': enriched_songs
     }
     
-    return jsonify(run_data)
+    return conditional_json(run_data, athlete_id)
 
-# Add this route for getting all runs (optional, for future expansion)
 @app.route('/api/runs')
 def api_runs():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute('SELECT athlete_id FROM users LIMIT 1')
-    row = c.fetchone()
-    conn.close()
-    
-    if not row:
-        return jsonify({'error': 'No user connected'}), 404
+    """One page of the athlete's run history, newest first, songs included.
 
-    athlete_id = row[0]
-    access_token = get_user_access_token(athlete_id)
-    
-    if not access_token:
-        return jsonify({'error': 'No access token'}), 401
-    
-    headers = {'Authorization': f'Bearer {access_token}'}
-    params = {'per_page': 10, 'page': 1}
-    
+    ?limit= sets the page size; ?cursor= takes the next_cursor returned by
+    the previous page, which is null on the last one.
+    """
+    athlete_id = current_athlete_id()
+    if not athlete_id:
+        return not_signed_in()
+
+    limit = max(1, min(request.args.get('limit', RUNS_PAGE_SIZE, type=int), MAX_RUNS_PAGE_SIZE))
     try:
-        response = requests.get('https://www.strava.com/api/v3/athlete/activities', 
-                              headers=headers, params=params)
-        if response.status_code == 200:
-            activities = response.json()
-            # Filter for running activities only
-            runs = [activity for activity in activities 
-                   if activity.get('type') in ['Run', 'TrailRun', 'VirtualRun']]
-            
-            # Add songs to each run (this might be expensive for many runs)
-            for run in runs[:3]:  # Limit to first 3 runs to avoid too many API calls
-                start_time = run['start_date']
-                elapsed = run['elapsed_time']
-                start_dt = datetime.strptime(start_time, '%Y-%m-%dT%H:%M:%SZ')
-                end_dt = start_dt + timedelta(seconds=elapsed)
-                
-                songs = get_songs_in_range(start_time, end_dt.strftime('%Y-%m-%dT%H:%M:%SZ'))
-                run['songs'] = enrich_songs_with_spotify_data(songs)
-            
-            return jsonify({'runs': runs})
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-    
-    return jsonify({'runs': []})
+        before = decode_cursor(request.args.get('cursor'))
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
+
+    ensure_activities_synced(athlete_id)
+    return cached_response(athlete_id, lambda: render_runs_page(athlete_id, limit, before))
+
+def render_runs_page(athlete_id, limit, before):
+    runs = list_runs(athlete_id, limit + 1, before)
+    next_cursor = encode_run_cursor(runs[limit - 1]) if len(runs) > limit else None
+    runs = runs[:limit]
+
+    # One query for the page's soundtracks and one enrichment pass over all
+    # of its songs, so repeated tracks are only looked up once
+    songs_by_run = get_songs_for_runs([run['id'] for run in runs])
+    enriched = iter(enrich_songs_with_spotify_data([song for run in runs for song in songs_by_run[run['id']]]))
+    for run in runs:
+        run['songs'] = [next(enriched) for _ in songs_by_run[run['id']]]
+
+    return streamed_runs_page(runs, next_cursor, athlete_id)
+
+@app.route('/api/top-tracks')
+def api_top_tracks():
+    """Tracks heard on the most runs, from the precomputed run_songs table"""
+    athlete_id = current_athlete_id()
+    if not athlete_id:
+        return not_signed_in()
+
+    ensure_activities_synced(athlete_id)
+    limit = max(1, min(request.args.get('limit', 10, type=int), 100))
+    return cached_response(athlete_id,
+                           lambda: conditional_json({'tracks': top_tracks(athlete_id, limit)}, athlete_id))
+
+@app.route('/api/fastest-songs')
+def api_fastest_songs():
+    """Tracks with the quickest pace across every run that has cached streams.
+
+    Streams of synced history are fetched in the background a batch per
+    sync (fetch_missing_streams), so older runs join the ranking over the
+    first syncs; runs_analyzed says how many are in it so far.
+    """
+    athlete_id = current_athlete_id()
+    if not athlete_id:
+        return not_signed_in()
+
+    ensure_activities_synced(athlete_id)
+    limit = max(1, min(request.args.get('limit', 10, type=int), 100))
+    return cached_response(athlete_id, lambda: render_fastest_songs(athlete_id, limit))
+
+def render_fastest_songs(athlete_id, limit):
+    plays_by_run = {}
+    for activity_id, start_ms, *play in get_run_plays(athlete_id):
+        plays_by_run.setdefault(activity_id, (start_ms, []))[1].append(play)
+    streams = get_activity_streams(list(plays_by_run))
+
+    runs = []
+    for activity_id, (start_ms, plays) in plays_by_run.items():
+        unpacked = unpack_streams(streams.get(activity_id))
+        if unpacked is not None:
+            runs.append((unpacked, start_ms, plays))
+    with STAGE_SECONDS.time(stage='analytics.fastest'):
+        tracks = fastest_songs(runs, limit)
+    return jsonify({'tracks': enrich_songs_with_spotify_data(tracks), 'runs_analyzed': len(runs)})
 
 @app.route('/spotify/callback')
 def spotify_callback():
     return "✅ Spotify OAuth successful!"
 
+@app.route('/metrics')
+def metrics():
+    return app.response_class(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/debug/cache')
+def debug_cache():
+    return jsonify({
+        'track_metadata': track_cache.snapshot(),
+        'responses': response_cache.snapshot(),
+        'static_assets': static_assets.snapshot()
+    })
+
+@app.route('/debug/jobs')
+def debug_jobs():
+    return jsonify(webhook_queue.stats())
+
+@app.route('/debug/http')
+def debug_http():
+    return jsonify(upstream.snapshot())
+
 @app.route('/debug/songs')
 def debug_songs():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute('SELECT * FROM spotify_songs ORDER BY played_at DESC')
-    rows = c.fetchall()
-    conn.close()
-    return jsonify(rows)
+    """The athlete's raw song samples, newest first, one page per request.
+
+    ?limit= sets the page size; ?cursor= takes the next_cursor returned by
+    the previous page, which is null on the last one. Samples older than
+    SAMPLE_RETENTION_DAYS only survive as plays (see maintenance.py).
+    """
+    athlete_id = current_athlete_id()
+    if not athlete_id:
+        return not_signed_in()
+
+    limit = max(1, min(request.args.get('limit', SONGS_PAGE_SIZE, type=int), MAX_SONGS_PAGE_SIZE))
+    try:
+        before = decode_cursor(request.args.get('cursor'))
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
+
+    songs = get_songs_page(athlete_id, limit + 1, before)
+    last = songs[limit - 1] if len(songs) > limit else None
+    next_cursor = encode_cursor(last['played_at_ms'], last['id']) if last else None
+
+    def generate():
+        yield '{"songs": ['
+        for i, song in enumerate(songs[:limit]):
+            yield (', ' if i else '') + json.dumps(song)
+        yield f'], "next_cursor": {json.dumps(next_cursor)}}}'
+
+    return app.response_class(generate(), mimetype='application/json')
 
 def get_spotify_access_token():
     """Get Spotify app-only access token for track metadata"""
-    if not SPOTIFY_CLIENT_ID or not SPOTIFY_CLIENT_SECRET:
-        return None
-    
-    auth_string = f"{SPOTIFY_CLIENT_ID}:{SPOTIFY_CLIENT_SECRET}"
-    auth_base64 = base64.b64encode(auth_string.encode()).decode()
-    
-    headers = {
-        'Authorization': f'Basic {auth_base64}',
-        'Content-Type': 'application/x-www-form-urlencoded'
-    }
-    
-    data = {'grant_type': 'client_credentials'}
-    
+    return spotify_tokens.get_token()
+
+def spotify_retry_after(response):
+    """Seconds to wait after a Spotify 429: Retry-After if it is a number, else one second"""
     try:
-        response = requests.post('https://accounts.spotify.com/api/token', headers=headers, data=data)
-        if response.status_code == 200:
-            return response.json().get('access_token')
-    except:
-        pass
-    return None
+        return float(response.headers['Retry-After'])
+    except (KeyError, ValueError):
+        return 1
 
 def search_spotify_track(track_name, artist_name, spotify_token):
-    """Search for track on Spotify to get metadata"""
+    """Search for track on Spotify to get metadata.
+
+    Returns None when Spotify has no match and raises SpotifyLookupError
+    when the request itself failed, so failures are never cached as misses.
+    """
     if not spotify_token:
         return None
     
@@ -487,55 +823,278 @@ def search_spotify_track(track_name, artist_name, spotify_token):
     headers = {'Authorization': f'Bearer {spotify_token}'}
     
     try:
-        response = requests.get('https://api.spotify.com/v1/search', headers=headers, params=params)
-        if response.status_code == 200:
-            data = response.json()
-            tracks = data.get('tracks', {}).get('items', [])
-            if tracks:
-                track = tracks[0]
-                return {
-                    'name': track['name'],
-                    'artist': ', '.join([artist['name'] for artist in track['artists']]),
-                    'cover_art': track['album']['images'][0]['url'] if track['album']['images'] else None,
-                    'spotify_url': track['external_urls']['spotify'],
-                    'preview_url': track.get('preview_url')
-                }
-    except:
-        pass
-    return None
+        response = upstream.get(f'{SPOTIFY_API_URL}/v1/search', endpoint='spotify.search',
+                                headers=headers, params=params)
+    except requests.RequestException as e:
+        raise SpotifyLookupError(str(e))
+    if response.status_code == 429:
+        raise SpotifyRateLimited(spotify_retry_after(response))
+    if response.status_code == 401:
+        spotify_tokens.invalidate()
+    if response.status_code != 200:
+        raise SpotifyLookupError(f'Spotify search returned {response.status_code}')
+
+    tracks = response.json().get('tracks', {}).get('items', [])
+    if not tracks:
+        return None
+    track = tracks[0]
+    return {
+        'name': track['name'],
+        'artist': ', '.join([artist['name'] for artist in track['artists']]),
+        'cover_art': track['album']['images'][0]['url'] if track['album']['images'] else None,
+        'spotify_url': track['external_urls']['spotify'],
+        'preview_url': track.get('preview_url')
+    }
 
 def get_user_last_run(athlete_id):
-    """Get the user's most recent run from Strava"""
+    """Get the user's most recent run from the local activity store"""
+    ensure_activities_synced(athlete_id)
+    runs = list_runs(athlete_id, 1)
+    return runs[0] if runs else None
+
+def sync_activities(athlete_id):
+    """Incrementally copy the athlete's Strava activities into SQLite.
+
+    Pages through /athlete/activities with an `after=` cursor, so each sync
+    only fetches activities that started after the newest one stored.
+    """
     access_token = get_user_access_token(athlete_id)
     if not access_token:
-        return None
-    
+        return 0
+
+    cursor = get_activity_sync(athlete_id)
+    after = cursor[0] if cursor else 0
     headers = {'Authorization': f'Bearer {access_token}'}
-    params = {'per_page': 1, 'page': 1}
-    
-    try:
-        response = requests.get('https://www.strava.com/api/v3/athlete/activities', 
-                              headers=headers, params=params)
-        if response.status_code == 200:
-            activities = response.json()
-            if activities:
-                activity = activities[0]
-                # Only return running activities
-                if activity.get('type') in ['Run', 'TrailRun', 'VirtualRun']:
-                    return activity
-    except:
-        pass
-    return None
+    stored = 0
+    page = 1
+    while True:
+        response = upstream.get(f'{STRAVA_URL}/api/v3/athlete/activities', endpoint='strava.activities.list',
+                                headers=headers, params={'after': after, 'per_page': 100, 'page': page})
+        if response.status_code != 200:
+            break
+        activities = response.json()
+        if not activities:
+            break
+        upsert_activities(athlete_id, activities)
+        stored += len(activities)
+        page += 1
+
+    set_activity_sync(athlete_id, max(after, newest_activity_start(athlete_id)))
+    return stored
+
+def fetch_missing_streams(athlete_id, limit=STREAM_FETCHES_PER_SYNC):
+    """Fetch streams for up to `limit` of the athlete's runs with songs that have none, newest first.
+
+    The activity sync copies runs without their streams, and only the
+    webhook and /api/last-run fetch them one at a time. Calls come out of
+    strava_budget; when it is spent this stops, and the next sync goes on.
+    """
+    starts = {}
+    for activity_id, start_ms, *_ in get_run_plays(athlete_id):
+        starts[activity_id] = start_ms
+    cached = get_activity_streams(list(starts))
+    missing = sorted((i for i in starts if i not in cached), key=starts.get, reverse=True)[:limit]
+
+    fetched = 0
+    for activity_id in missing:
+        access_token = get_user_access_token(athlete_id)
+        if not access_token or not strava_budget.acquire(block=False):
+            break
+        data = get_strava_streams(activity_id, access_token)
+        if data is None:
+            break
+        save_activity_streams(athlete_id, activity_id, pack_streams(data))
+        fetched += 1
+    return fetched
+
+_syncing = set()
+_syncing_lock = threading.Lock()
+
+def start_background_sync(athlete_id, sync=True):
+    """Run sync_activities, then fetch_missing_streams, on a thread unless one is already running for this athlete"""
+    with _syncing_lock:
+        if athlete_id in _syncing:
+            return
+        _syncing.add(athlete_id)
+
+    def run():
+        try:
+            if sync:
+                sync_activities(athlete_id)
+            fetch_missing_streams(athlete_id)
+        except Exception as e:
+            print(f"Activity sync failed for {athlete_id}: {e}")
+        finally:
+            with _syncing_lock:
+                _syncing.discard(athlete_id)
+
+    threading.Thread(target=run, daemon=True).start()
+
+def ensure_activities_synced(athlete_id):
+    """Sync inline the first time, afterwards refresh stale copies in the background.
+
+    A first sync that fails leaves no cursor, so the next request tries again.
+    """
+    cursor = get_activity_sync(athlete_id)
+    if cursor is None:
+        try:
+            sync_activities(athlete_id)
+        except (StravaTokenError, requests.RequestException) as e:
+            print(f"Activity sync failed for {athlete_id}: {e}")
+            return
+        start_background_sync(athlete_id, sync=False)
+    elif datetime.now(timezone.utc).timestamp() - cursor[1] > ACTIVITY_SYNC_INTERVAL:
+        start_background_sync(athlete_id)
+
+def last_changed(athlete_id):
+    """Unix time of the newest change to the athlete's runs or to logged songs, or None"""
+    changed = [t for t in (activities_last_modified(athlete_id), songs_last_modified(athlete_id)) if t]
+    return max(changed) if changed else None
+
+def conditional_json(payload, athlete_id):
+    """JSON response with ETag and Last-Modified, answering 304 when the client copy is current"""
+    response = jsonify(payload)
+    response.add_etag()
+    changed = last_changed(athlete_id)
+    if changed:
+        response.last_modified = datetime.fromtimestamp(changed, timezone.utc)
+    response.cache_control.no_cache = True
+    response.cache_control.private = True
+    return response.make_conditional(request)
+
+def cached_response(athlete_id, render, key=None):
+    """Answer from response_cache while the athlete's data is unchanged, else render() and cache it.
+
+    The generation is read before rendering, so a write that lands while
+    the response is being built leaves it already stale. Only complete 200
+    answers are stored; render sets g.uncacheable when part of the data
+    could not be fetched (Strava or Spotify unavailable). `key` defaults to
+    the request path and query.
+    """
+    key = key or request.full_path
+    generation = get_cache_generation(athlete_id)
+    entry = response_cache.get(athlete_id, key, generation)
+    if entry is not None:
+        response = app.response_class(entry.body, mimetype=entry.mimetype)
+        if entry.etag:
+            response.set_etag(entry.etag, weak=entry.weak)
+        if entry.last_modified:
+            response.last_modified = datetime.fromtimestamp(entry.last_modified, timezone.utc)
+        response.cache_control.no_cache = True
+        response.cache_control.private = True
+        return response.make_conditional(request)
+
+    g.uncacheable = False
+    response = make_response(render())
+    if response.status_code != 200 or g.uncacheable:
+        return response
+
+    etag, weak = response.get_etag()
+    weak = bool(weak)
+    last_modified = response.last_modified.timestamp() if response.last_modified else None
+
+    def store(body):
+        response_cache.put(athlete_id, key, CachedResponse(generation, body, response.mimetype, etag, weak,
+                                                           last_modified))
+
+    if not response.is_streamed:
+        store(response.get_data())
+        return response
+
+    # Streamed pages are cached once the last chunk went out
+    def tee(chunks):
+        parts = []
+        for chunk in chunks:
+            parts.append(chunk)
+            yield chunk
+        store(b''.join(parts))
+
+    response.response = tee(response.iter_encoded())
+    return response
+
+def encode_cursor(sort_ms, row_id):
+    """Opaque keyset cursor pointing just past the row with this (time, id)"""
+    raw = f"{sort_ms}:{row_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def encode_run_cursor(run):
+    """Opaque /api/runs cursor pointing just past `run`"""
+    return encode_cursor(to_epoch_ms(run['start_date']), run['id'])
+
+def decode_cursor(cursor):
+    """(time_ms, id) from an encoded cursor, None for the first page; ValueError if malformed"""
+    if not cursor:
+        return None
+    # binascii.Error and UnicodeDecodeError are both ValueErrors
+    raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+    sort_ms, row_id = raw.split(':')
+    return int(sort_ms), int(row_id)
+
+def streamed_runs_page(runs, next_cursor, athlete_id):
+    """Serialize a runs page one run at a time instead of building the whole body.
+
+    The body is never held in memory, so the ETag is a weak one built from
+    what the page depends on: the request, the data's last change, and how
+    many songs already carry Spotify metadata.
+    """
+    def generate():
+        yield '{"runs": ['
+        for i, run in enumerate(runs):
+            yield (', ' if i else '') + json.dumps(run)
+        yield f'], "next_cursor": {json.dumps(next_cursor)}}}'
+
+    changed = last_changed(athlete_id)
+    enriched = sum(1 for run in runs for song in run['songs'] if 'spotify_url' in song)
+    version = f'{athlete_id}|{request.full_path}|{changed}|{len(runs)}|{enriched}'
+
+    response = app.response_class(generate(), mimetype='application/json')
+    response.set_etag(hashlib.sha1(version.encode()).hexdigest(), weak=True)
+    if changed:
+        response.last_modified = datetime.fromtimestamp(changed, timezone.utc)
+    response.cache_control.no_cache = True
+    response.cache_control.private = True
+    return response.make_conditional(request)
 
 def enrich_songs_with_spotify_data(songs):
-    """Add Spotify metadata to songs"""
-    spotify_token = get_spotify_access_token()
-    if not spotify_token:
-        return songs
-    
+    """Add Spotify metadata to songs, answering from track_cache where possible"""
+    with STAGE_SECONDS.time(stage='enrich'):
+        return _enrich_songs(songs)
+
+def _enrich_songs(songs):
+    metadata = {}
+    pending = {}
+    for song in songs:
+        key = normalize_key(song['name'], song['artist'])
+        if key in metadata or key in pending:
+            continue
+        cached = track_cache.get(song['name'], song['artist'])
+        if cached is MISSING:
+            pending[key] = song
+        else:
+            metadata[key] = cached
+
+    # Only ask Spotify (and only fetch a token) for tracks not cached yet,
+    # fanning the searches out over a bounded pool
+    if pending:
+        spotify_token = get_spotify_access_token()
+        if spotify_token:
+            fetched = lookup_concurrently(
+                pending,
+                lambda song: search_spotify_track(song['name'], song['artist'], spotify_token),
+                max_workers=SPOTIFY_SEARCH_CONCURRENCY
+            )
+            for key, spotify_data in fetched.items():
+                song = pending[key]
+                track_cache.put(song['name'], song['artist'], spotify_data)
+                metadata[key] = spotify_data
+        # Songs still missing metadata get it on a later request, so the
+        # response must not be cached without it
+        if any(key not in metadata for key in pending):
+            g.uncacheable = True
+
     enriched_songs = []
     for song in songs:
-        spotify_data = search_spotify_track(song['name'], song['artist'], spotify_token)
+        spotify_data = metadata.get(normalize_key(song['name'], song['artist']))
         if spotify_data:
             enriched_song = {
                 **song,
@@ -549,5 +1108,10 @@ def enrich_songs_with_spotify_data(songs):
     
     return enriched_songs
 
+# Started last so workers never run against a half-imported module
+webhook_queue.start_workers(process_activity_event, WEBHOOK_WORKERS)
+strava_tokens.start_scheduler(lead_seconds=STRAVA_TOKEN_REFRESH_LEAD)
+maintenance.start_scheduler()
+
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
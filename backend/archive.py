@@ -0,0 +1,122 @@
+"""Cold play history, one compressed file per calendar month.
+
+Plays older than the retention horizon are moved out of the plays table
+into gzip-compressed JSON files under the archive directory, one per UTC
+month and shared by every athlete (plays-2024-03.json.gz). The database
+keeps a small index of which athletes have plays in which archived month,
+so a run-window lookup only opens the one or two files its window falls
+in, and decoded months are kept in a small LRU per process.
+
+Each play is stored as [athlete_id, name, artist, started_at,
+last_seen_at, duration, started_ms, last_seen_ms], grouped by athlete
+and ordered by started_ms.
+"""
+import bisect
+import gzip
+import json
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+COLUMNS = ['athlete_id', 'name', 'artist', 'started_at', 'last_seen_at', 'duration', 'started_ms', 'last_seen_ms']
+
+
+def month_of(ms):
+    """'YYYY-MM' of the UTC month an epoch-millisecond time falls in"""
+    return datetime.fromtimestamp(ms / 1000, timezone.utc).strftime('%Y-%m')
+
+
+def month_bounds(month):
+    """(start_ms, end_ms) of a 'YYYY-MM' month, end exclusive"""
+    year, number = (int(part) for part in month.split('-'))
+    start = datetime(year, number, 1, tzinfo=timezone.utc)
+    end = datetime(year + number // 12, number % 12 + 1, 1, tzinfo=timezone.utc)
+    return int(start.timestamp() * 1000), int(end.timestamp() * 1000)
+
+
+def months_between(start_ms, end_ms):
+    """Every 'YYYY-MM' from the month of start_ms through the month of end_ms"""
+    months = []
+    month = month_of(start_ms)
+    last = month_of(end_ms)
+    while month <= last:
+        months.append(month)
+        month = month_of(month_bounds(month)[1])
+    return months
+
+
+class PlayArchive:
+    """Reads and writes the month files of one archive directory"""
+
+    def __init__(self, directory, cache_months=24):
+        self.directory = directory
+        self.cache_months = cache_months
+        # month -> (version, {athlete_id: (started_ms list, rows)})
+        self._months = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'reads': 0, 'cache_hits': 0, 'writes': 0}
+
+    def path(self, month):
+        return os.path.join(self.directory, f'plays-{month}.json.gz')
+
+    def read_rows(self, month):
+        """All plays of a month as row lists; [] if the month was never archived"""
+        try:
+            with open(self.path(month), 'rb') as f:
+                data = json.loads(gzip.decompress(f.read()))
+        except FileNotFoundError:
+            return []
+        return data['plays']
+
+    def write_month(self, month, rows):
+        """Replace a month's file with `rows`; returns its size in bytes.
+
+        Written to a temporary file and renamed over the old one, so a
+        reader in another process sees either the old or the new month.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        rows = sorted(rows, key=lambda r: (r[0], r[6]))
+        body = gzip.compress(json.dumps({'month': month, 'columns': COLUMNS, 'plays': rows},
+                                        separators=(',', ':')).encode(), compresslevel=9, mtime=0)
+        path = self.path(month)
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(body)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        with self._lock:
+            self._months.pop(month, None)
+            self.stats['writes'] += 1
+        return len(body)
+
+    def _load(self, month, version):
+        with self._lock:
+            cached = self._months.get(month)
+            if cached and cached[0] == version:
+                self._months.move_to_end(month)
+                self.stats['cache_hits'] += 1
+                return cached[1]
+
+        by_athlete = {}
+        for row in self.read_rows(month):
+            starts, rows = by_athlete.setdefault(row[0], ([], []))
+            starts.append(row[6])
+            rows.append(row)
+        with self._lock:
+            self.stats['reads'] += 1
+            self._months[month] = (version, by_athlete)
+            self._months.move_to_end(month)
+            while len(self._months) > self.cache_months:
+                self._months.popitem(last=False)
+        return by_athlete
+
+    def plays_between(self, month, version, athlete_id, start_ms, end_ms):
+        """The athlete's archived plays of `month` that started within [start_ms, end_ms]"""
+        starts, rows = self._load(month, version).get(athlete_id, ((), ()))
+        return rows[bisect.bisect_left(starts, start_ms):bisect.bisect_right(starts, end_ms)]
+
+    def snapshot(self):
+        with self._lock:
+            return {**self.stats, 'cached_months': len(self._months), 'directory': self.directory}
@@ -0,0 +1,201 @@
+import hashlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from db import get_backfill, get_description_hashes, list_runs, mark_activity_processed, save_backfill, to_epoch_ms
+
+# Strava's default app-wide limits, per 15 minutes and per UTC day
+STRAVA_SHORT_LIMIT = 200
+STRAVA_DAILY_LIMIT = 2000
+SHORT_WINDOW = 15 * 60
+DAY = 24 * 3600
+# PUT attempts per activity before it counts as failed
+MAX_ATTEMPTS = 3
+# Pause after a 429 that Strava's usage headers do not explain
+RETRY_SECONDS = 30
+# Activity ids listed in a dry run's report
+MAX_REPORTED_CHANGES = 100
+
+
+def description_hash(description):
+    return hashlib.sha1(description.encode()).hexdigest()
+
+
+class StravaRateBudget:
+    """Process-wide allowance of Strava requests for bulk jobs.
+
+    Strava counts every request the app makes against a limit per quarter
+    hour (windows start at :00, :15, :30 and :45) and one per UTC day. Bulk
+    jobs only spend `share` of each, leaving the rest for webhooks and
+    dashboard reads. The local count is replaced by Strava's own from the
+    X-RateLimit-Usage header, which includes requests made by every worker,
+    and a 429 parks bulk work until the window resets.
+    """
+
+    def __init__(self, short_limit=STRAVA_SHORT_LIMIT, daily_limit=STRAVA_DAILY_LIMIT, share=0.8):
+        self.limits = [short_limit, daily_limit]
+        self.share = share
+        self._usage = [0, 0]
+        self._windows = self._window_starts(time.time())
+        self._blocked_until = 0
+        self._lock = threading.Lock()
+        self.waits = 0
+
+    @staticmethod
+    def _window_starts(now):
+        return [now - now % SHORT_WINDOW, now - now % DAY]
+
+    def _roll(self, now):
+        windows = self._window_starts(now)
+        for i in (0, 1):
+            if windows[i] != self._windows[i]:
+                self._usage[i] = 0
+        self._windows = windows
+
+    def _wait_seconds(self, now):
+        if now < self._blocked_until:
+            return self._blocked_until - now
+        if self._usage[1] >= self.limits[1] * self.share:
+            return self._windows[1] + DAY - now
+        if self._usage[0] >= self.limits[0] * self.share:
+            return self._windows[0] + SHORT_WINDOW - now
+        return 0
+
+    def acquire(self, block=True):
+        """Block until one more request fits the budget, then count it.
+
+        With block=False, returns False right away instead of waiting.
+        """
+        while True:
+            with self._lock:
+                now = time.time()
+                self._roll(now)
+                wait = self._wait_seconds(now)
+                if wait <= 0:
+                    self._usage[0] += 1
+                    self._usage[1] += 1
+                    return True
+                if not block:
+                    return False
+                self.waits += 1
+            # A second past the reset, so clocks a little apart still agree
+            time.sleep(wait + 1)
+
+    def observe(self, response):
+        """Take Strava's view of the limits and usage from a response"""
+        limit = response.headers.get('X-RateLimit-Limit')
+        usage = response.headers.get('X-RateLimit-Usage')
+        with self._lock:
+            now = time.time()
+            self._roll(now)
+            try:
+                if limit:
+                    self.limits = [int(v) for v in limit.split(',')[:2]]
+                if usage:
+                    self._usage = [int(v) for v in usage.split(',')[:2]]
+            except ValueError:
+                pass
+            if response.status_code == 429:
+                if usage and self._usage[0] < self.limits[0] and self._usage[1] < self.limits[1]:
+                    # Limited below the published limits (e.g. a read limit): back off briefly
+                    self._blocked_until = now + RETRY_SECONDS
+                elif self._usage[1] >= self.limits[1]:
+                    self._blocked_until = self._windows[1] + DAY
+                else:
+                    self._blocked_until = self._windows[0] + SHORT_WINDOW
+
+    def snapshot(self):
+        with self._lock:
+            self._roll(time.time())
+            return {
+                'limits': list(self.limits),
+                'usage': list(self._usage),
+                'share': self.share,
+                'blocked_until': self._blocked_until or None,
+                'waits': self.waits
+            }
+
+
+class DescriptionBackfill:
+    """Re-describe an athlete's stored runs on Strava, newest first.
+
+    Descriptions are built locally with `describe(activity_id)` (None for
+    runs without songs, which are left alone) and compared against the
+    hash stored in processed_activities; only changed ones are sent with
+    `put(activity_id, description)`, which returns Strava's response. Pages
+    of runs are worked on by a thread pool, every PUT waits for the shared
+    rate budget, and the keyset cursor is checkpointed after each page so
+    an interrupted backfill resumes where it stopped.
+
+    A dry run makes no Strava calls and writes nothing; it reports which
+    runs would change.
+    """
+
+    def __init__(self, athlete_id, describe, put, budget, workers=4, dry_run=False, page_size=100):
+        self.athlete_id = athlete_id
+        self.describe = describe
+        self.put = put
+        self.budget = budget
+        self.workers = workers
+        self.dry_run = dry_run
+        self.page_size = page_size
+
+    def run(self, restart=False):
+        """Walk the history and return the stats; resumes an unfinished backfill unless restart"""
+        checkpoint = None if restart or self.dry_run else get_backfill(self.athlete_id)
+        if checkpoint and checkpoint['status'] == 'done':
+            checkpoint = None
+        cursor = checkpoint['cursor'] if checkpoint else None
+        stats = checkpoint['stats'] if checkpoint else {
+            'scanned': 0, 'updated': 0, 'unchanged': 0, 'no_songs': 0, 'failed': 0, 'would_update': 0
+        }
+        stats['resumed'] = cursor is not None
+        changes = []
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            while True:
+                runs = list_runs(self.athlete_id, self.page_size, cursor)
+                if not runs:
+                    break
+                hashes = get_description_hashes([run['id'] for run in runs])
+                outcomes = list(pool.map(lambda run: self._process(run['id'], hashes.get(run['id'])), runs))
+                for run, outcome in zip(runs, outcomes):
+                    stats['scanned'] += 1
+                    stats[outcome] += 1
+                    if outcome == 'would_update' and len(changes) < MAX_REPORTED_CHANGES:
+                        changes.append(run['id'])
+                cursor = (to_epoch_ms(runs[-1]['start_date']), runs[-1]['id'])
+                if not self.dry_run:
+                    save_backfill(self.athlete_id, 'running', cursor, stats)
+
+        if self.dry_run:
+            stats['changes'] = changes
+        else:
+            save_backfill(self.athlete_id, 'done', None, stats)
+        return stats
+
+    def _process(self, activity_id, stored_hash):
+        description = self.describe(activity_id)
+        if description is None:
+            return 'no_songs'
+        digest = description_hash(description)
+        if digest == stored_hash:
+            return 'unchanged'
+        if self.dry_run:
+            return 'would_update'
+
+        for _ in range(MAX_ATTEMPTS):
+            self.budget.acquire()
+            try:
+                response = self.put(activity_id, description)
+            except Exception as e:
+                print(f"Backfill PUT failed for activity {activity_id}: {e}")
+                continue
+            self.budget.observe(response)
+            if response.status_code == 200:
+                mark_activity_processed(activity_id, digest)
+                return 'updated'
+            if response.status_code != 429 and response.status_code < 500:
+                break
+        return 'failed'
@@ -0,0 +1,112 @@
+"""Concurrent readers and writers: connection-per-call vs the db module's pooled WAL connections.
+
+Usage: python benchmarks/bench_db_concurrency.py [--writers 4] [--readers 8] [--seconds 5]
+"""
+import argparse
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from common import load_app
+
+SCHEMA = '''
+    CREATE TABLE spotify_songs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        athlete_id INTEGER,
+        name TEXT NOT NULL,
+        artist TEXT NOT NULL,
+        played_at TEXT NOT NULL,
+        played_at_ms INTEGER,
+        UNIQUE (athlete_id, played_at)
+    );
+    CREATE INDEX idx_spotify_songs_athlete_played ON spotify_songs (athlete_id, played_at_ms);
+'''
+INSERT = 'INSERT OR IGNORE INTO spotify_songs (athlete_id, name, artist, played_at, played_at_ms) VALUES (1, ?, ?, ?, ?)'
+SELECT = '''
+    SELECT name, artist FROM spotify_songs WHERE athlete_id = 1 AND played_at_ms BETWEEN ? AND ? ORDER BY played_at_ms
+'''
+
+
+def legacy_ops(path):
+    """The old pattern: open, run one statement, close, default rollback journal"""
+    def write(i):
+        conn = sqlite3.connect(path)
+        conn.execute(INSERT, ('Track', 'Artist', f'w{i}', i))
+        conn.commit()
+        conn.close()
+
+    def read(i):
+        conn = sqlite3.connect(path)
+        conn.execute(SELECT, (i - 1000, i)).fetchall()
+        conn.close()
+    return write, read
+
+
+def pooled_ops(path):
+    import db
+    database = db.Database(path)
+
+    def write(i):
+        with database.transaction() as conn:
+            conn.execute(INSERT, ('Track', 'Artist', f'w{i}', i))
+
+    def read(i):
+        database.connection().execute(SELECT, (i - 1000, i)).fetchall()
+    return write, read
+
+
+def run(ops, writers, readers, seconds):
+    write, read = ops
+    stop = time.monotonic() + seconds
+    counts = {'writes': 0, 'reads': 0, 'locked_errors': 0}
+    lock = threading.Lock()
+    seq = iter(range(10 ** 12))
+
+    def loop(fn, stat):
+        while time.monotonic() < stop:
+            with lock:
+                i = next(seq)
+            try:
+                fn(i)
+            except sqlite3.OperationalError:
+                with lock:
+                    counts['locked_errors'] += 1
+                continue
+            with lock:
+                counts[stat] += 1
+
+    threads = [threading.Thread(target=loop, args=(write, 'writes')) for _ in range(writers)]
+    threads += [threading.Thread(target=loop, args=(read, 'reads')) for _ in range(readers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return {k: (round(v / seconds, 1) if k != 'locked_errors' else v) for k, v in counts.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=5)
+    args = parser.parse_args()
+
+    load_app()
+    results = {}
+    for label, make_ops in (('connection_per_call', legacy_ops), ('pooled_wal', pooled_ops)):
+        fd, path = tempfile.mkstemp(suffix='.db', prefix='bench_')
+        os.close(fd)
+        conn = sqlite3.connect(path)
+        conn.executescript(SCHEMA)
+        conn.close()
+        results[label] = run(make_ops(path), args.writers, args.readers, args.seconds)
+
+    print(json.dumps({'writers': args.writers, 'readers': args.readers, 'seconds': args.seconds,
+                      'ops_per_sec': results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
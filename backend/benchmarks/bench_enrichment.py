@@ -0,0 +1,48 @@
+"""Wall time of song enrichment against a stub Spotify, sequential vs concurrent.
+
+Usage: python benchmarks/bench_enrichment.py [--latency 0.05] [--concurrency 8]
+"""
+import argparse
+import json
+import os
+
+from common import Timer, load_app
+from stubs import SpotifyHandler, StubServer
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--counts', default='5,10,20,40,80')
+    parser.add_argument('--rate-limit-every', type=int, default=0)
+    args = parser.parse_args()
+
+    with StubServer(SpotifyHandler, latency=args.latency, rate_limit_every=args.rate_limit_every) as stub:
+        os.environ.update({
+            'SPOTIFY_API_URL': stub.url,
+            'SPOTIFY_ACCOUNTS_URL': stub.url,
+            'SPOTIFY_CLIENT_ID': 'bench',
+            'SPOTIFY_CLIENT_SECRET': 'bench'
+        })
+        app = load_app()
+
+        results = []
+        for count in [int(c) for c in args.counts.split(',')]:
+            row = {'songs': count}
+            for label, workers in (('sequential', 1), ('concurrent', args.concurrency)):
+                # Fresh track names each round so the metadata cache never answers
+                songs = [{'name': f'{label} {count} track {i}', 'artist': 'Stub Artist'} for i in range(count)]
+                app.SPOTIFY_SEARCH_CONCURRENCY = workers
+                with Timer() as t:
+                    enriched = app.enrich_songs_with_spotify_data(songs)
+                assert [s['name'] for s in enriched] == [s['name'] for s in songs]
+                row[f'{label}_seconds'] = round(t.elapsed, 3)
+            results.append(row)
+
+    print(json.dumps({'latency': args.latency, 'concurrency': args.concurrency,
+                      'stub_requests': stub.stats['requests'], 'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
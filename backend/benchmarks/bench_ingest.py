@@ -0,0 +1,50 @@
+"""Compare rows/sec for single-song and batch ingestion.
+
+Usage: python benchmarks/bench_ingest.py [--songs 2000] [--batch-size 500]
+"""
+import argparse
+import json
+
+from common import Timer, load_app, synthetic_songs
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--songs', type=int, default=2000)
+    parser.add_argument('--batch-size', type=int, default=500)
+    args = parser.parse_args()
+
+    app = load_app()
+    client = app.app.test_client()
+    import db
+    db.save_user(1, 'access', 'refresh', 0)
+    client.environ_base['HTTP_AUTHORIZATION'] = f'Bearer {db.get_api_token(1)}'
+
+    songs = synthetic_songs(args.songs)
+    with Timer() as single:
+        for song in songs:
+            client.post('/log-spotify', json=song)
+
+    # Shift the batch run to a new time range so nothing is a duplicate
+    batch_songs = synthetic_songs(args.songs, step_seconds=47)
+    for song in batch_songs:
+        song['played_at'] = song['played_at'].replace('2025', '2024', 1)
+
+    accepted = 0
+    with Timer() as batch:
+        for i in range(0, len(batch_songs), args.batch_size):
+            chunk = batch_songs[i:i + args.batch_size]
+            resp = client.post('/log-spotify/batch', json=chunk)
+            accepted += resp.get_json()['accepted']
+
+    print(json.dumps({
+        'songs': args.songs,
+        'batch_size': args.batch_size,
+        'single_rows_per_sec': round(args.songs / single.elapsed, 1),
+        'batch_rows_per_sec': round(accepted / batch.elapsed, 1),
+        'batch_accepted': accepted
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
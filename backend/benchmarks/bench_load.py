@@ -0,0 +1,232 @@
+"""End-to-end load test against stubbed Strava and Spotify servers.
+
+The database is seeded with a synthetic song history and grown through
+each --sizes tier (raw sample rows). At every tier a pool of clients
+drives a weighted mix of /log-spotify, /webhook, /api/last-run and
+/api/runs against the app on a threaded werkzeug server for --duration
+seconds. Results are JSON (stdout, and --output if given), tagged with the
+git commit so runs can be compared between commits.
+
+Usage: python benchmarks/bench_load.py [--sizes 10000,100000,1000000] [--duration 10] [--clients 16]
+           [--strava-latency 0.05] [--spotify-latency 0.05] [--rate-limit-every 0] [--output results.json]
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import requests
+
+from common import Timer, git_commit, latency_summary, load_app, serve_app
+from stubs import STUB_ID_WRAP, STUB_NEWEST_RUN, SpotifyHandler, StravaHandler, StubServer
+
+ATHLETE_ID = 1
+# Seconds between tracker samples, and samples per synthetic play
+SAMPLE_SECONDS = 45
+SAMPLES_PER_PLAY = 4
+# Relative weights of the request mix
+MIX = {'log_spotify': 5, 'webhook': 1, 'last_run': 2, 'runs': 2}
+# Listening history ends an hour after the newest stub run and goes back from there
+HISTORY_END = STUB_NEWEST_RUN + timedelta(hours=1)
+
+
+def seed_history(db_path, first, last, chunk_size=50000):
+    """Insert samples first..last-1 (counting back from HISTORY_END) and their plays.
+
+    Goes straight to SQLite instead of through save_songs so 10M rows seed
+    in minutes; the rows match what the tracker and record_play produce.
+    `last` is rounded down to whole plays; returns the new sample count.
+    """
+    import db
+    last -= last % SAMPLES_PER_PLAY
+    end_ms = db.to_epoch_ms(HISTORY_END)
+    conn = sqlite3.connect(db_path)
+    with conn:
+        for chunk_start in range(first, last, chunk_size):
+            songs, plays = [], []
+            for i in range(chunk_start, min(last, chunk_start + chunk_size)):
+                ts = end_ms - i * SAMPLE_SECONDS * 1000
+                track = i // SAMPLES_PER_PLAY
+                name, artist = f'Track {track % 5000}', f'Artist {track % 300}'
+                played_at = db.format_timestamp(db.EPOCH + timedelta(milliseconds=ts))
+                songs.append((ATHLETE_ID, name, artist, played_at, ts))
+                # Samples count backwards, so the last one of a play is its start
+                if i % SAMPLES_PER_PLAY == SAMPLES_PER_PLAY - 1:
+                    last_seen_ms = end_ms - (track * SAMPLES_PER_PLAY) * SAMPLE_SECONDS * 1000
+                    last_seen_at = db.format_timestamp(db.EPOCH + timedelta(milliseconds=last_seen_ms))
+                    plays.append((ATHLETE_ID, name, artist, played_at, last_seen_at,
+                                  (last_seen_ms - ts) // 1000, ts, last_seen_ms))
+            conn.executemany(db.INSERT_SONG_IGNORE, songs)
+            conn.executemany('''
+                INSERT INTO plays (athlete_id, name, artist, started_at, last_seen_at, duration,
+                                   started_ms, last_seen_ms)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', plays)
+    conn.close()
+    return max(first, last)
+
+
+class LoadGenerator:
+    """Weighted request mix from a pool of client threads, with per-endpoint latency"""
+
+    def __init__(self, base_url, token):
+        self.base_url = base_url
+        self.headers = {'Authorization': f'Bearer {token}'}
+        self.lock = threading.Lock()
+        self.sample_ids = itertools.count()
+        # Fresh activity ids that the Strava stub dates to the newest days again
+        self.event_ids = itertools.count(STUB_ID_WRAP * 1000)
+        self.endpoints = [name for name, weight in MIX.items() for _ in range(weight)]
+        self.local = threading.local()
+
+    def session(self):
+        session = getattr(self.local, 'session', None)
+        if session is None:
+            session = self.local.session = requests.Session()
+            session.headers.update(self.headers)
+        return session
+
+    def request(self, endpoint):
+        session = self.session()
+        if endpoint == 'log_spotify':
+            # Each sample is new: the tracker keeps logging after the seeded history
+            n = next(self.sample_ids)
+            played_at = HISTORY_END + timedelta(seconds=SAMPLE_SECONDS * (n + 1))
+            track = f'Live {n // SAMPLES_PER_PLAY}'
+            return session.post(f'{self.base_url}/log-spotify',
+                                json={'name': track, 'artist': 'Live Artist', 'played_at': played_at.isoformat()})
+        if endpoint == 'webhook':
+            event = {'object_type': 'activity', 'object_id': next(self.event_ids), 'owner_id': ATHLETE_ID,
+                     'aspect_type': 'create', 'event_time': int(time.time())}
+            return session.post(f'{self.base_url}/webhook', json=event)
+        if endpoint == 'last_run':
+            return session.get(f'{self.base_url}/api/last-run')
+        response = session.get(f'{self.base_url}/api/runs')
+        cursor = response.json().get('next_cursor') if response.status_code == 200 else None
+        if cursor:
+            # Browsing past the first page is part of the read path too
+            response = session.get(f'{self.base_url}/api/runs', params={'cursor': cursor})
+        return response
+
+    def run(self, clients, duration):
+        latencies = {name: [] for name in MIX}
+        errors = {name: 0 for name in MIX}
+        deadline = time.monotonic() + duration
+
+        def client(n):
+            rng = random.Random(n)
+            while time.monotonic() < deadline:
+                endpoint = rng.choice(self.endpoints)
+                start = time.perf_counter()
+                try:
+                    response = self.request(endpoint)
+                    ok = response.status_code < 400
+                    response.content
+                except requests.RequestException:
+                    ok = False
+                elapsed = (time.perf_counter() - start) * 1000
+                with self.lock:
+                    latencies[endpoint].append(elapsed)
+                    if not ok:
+                        errors[endpoint] += 1
+
+        with Timer() as total:
+            with ThreadPoolExecutor(max_workers=clients) as pool:
+                list(pool.map(client, range(clients)))
+
+        results = {}
+        for name in MIX:
+            results[name] = {
+                'requests': len(latencies[name]),
+                'errors': errors[name],
+                'throughput_rps': round(len(latencies[name]) / total.elapsed, 1),
+                **latency_summary(latencies[name])
+            }
+        count = sum(len(v) for v in latencies.values())
+        results['total'] = {
+            'requests': count,
+            'errors': sum(errors.values()),
+            'throughput_rps': round(count / total.elapsed, 1),
+            **latency_summary([x for v in latencies.values() for x in v])
+        }
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', default='10000,100000,1000000',
+                        help='comma separated song row counts; up to 10000000 works, seeding takes a while')
+    parser.add_argument('--duration', type=float, default=10, help='seconds of load per size')
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--runs', type=int, default=365, help='activities served by the Strava stub')
+    parser.add_argument('--strava-latency', type=float, default=0.05)
+    parser.add_argument('--spotify-latency', type=float, default=0.05)
+    parser.add_argument('--rate-limit-every', type=int, default=0,
+                        help='every Nth stub request answers 429 (0 disables)')
+    parser.add_argument('--workers', type=int, default=4, help='webhook worker threads')
+    parser.add_argument('--output', help='also write the JSON results to this file')
+    args = parser.parse_args()
+
+    rate_limit = args.rate_limit_every or None
+    with StubServer(StravaHandler, latency=args.strava_latency, activities=args.runs,
+                    rate_limit_every=rate_limit) as strava, \
+            StubServer(SpotifyHandler, latency=args.spotify_latency, rate_limit_every=rate_limit) as spotify:
+        os.environ['STRAVA_URL'] = strava.url
+        os.environ['SPOTIFY_API_URL'] = spotify.url
+        os.environ['SPOTIFY_ACCOUNTS_URL'] = spotify.url
+        os.environ.setdefault('SPOTIFY_CLIENT_ID', 'bench')
+        os.environ.setdefault('SPOTIFY_CLIENT_SECRET', 'bench')
+        os.environ['WEBHOOK_WORKERS'] = str(args.workers)
+        app = load_app()
+        import db
+        db.save_user(ATHLETE_ID, 'stub-access', 'stub-refresh', int(time.time()) + 6 * 3600)
+        server, base_url = serve_app(app.app)
+        load = LoadGenerator(base_url, db.get_api_token(ATHLETE_ID))
+
+        seeded = 0
+        tiers = []
+        for size in [int(s) for s in args.sizes.split(',')]:
+            with Timer() as seed:
+                seeded = seed_history(app.database.path, seeded, size)
+                # Re-match the stored runs against the grown history, as a backfill would
+                with db.database.transaction() as conn:
+                    db.backfill_run_songs(conn)
+            strava_before, spotify_before = strava.stats['requests'], spotify.stats['requests']
+            results = load.run(args.clients, args.duration)
+            with Timer() as drain:
+                while True:
+                    stats = app.webhook_queue.stats()
+                    if stats['pending'] + stats['running'] == 0:
+                        break
+                    time.sleep(0.05)
+            tiers.append({
+                'song_rows': seeded,
+                'seed_seconds': round(seed.elapsed, 2),
+                'endpoints': results,
+                'webhook_drain_seconds': round(drain.elapsed, 2),
+                'webhook_jobs': stats,
+                'strava_stub_requests': strava.stats['requests'] - strava_before,
+                'spotify_stub_requests': spotify.stats['requests'] - spotify_before
+            })
+        server.shutdown()
+
+    report = {
+        'commit': git_commit(),
+        'config': vars(args),
+        'tiers': tiers
+    }
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""Run-window lookups against a large synthetic plays table.
+
+Usage: python benchmarks/bench_range_queries.py [--plays 1000000] [--queries 500]
+"""
+import argparse
+import json
+import random
+import sqlite3
+import statistics
+from datetime import datetime, timedelta, timezone
+
+from common import Timer, load_app
+
+INSERT_PLAY = '''
+    INSERT INTO plays (athlete_id, name, artist, started_at, last_seen_at, duration, started_ms, last_seen_ms)
+    VALUES (1, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+
+def seed_plays(db_path, count, start_ms):
+    conn = sqlite3.connect(db_path)
+    with conn:
+        ts = start_ms
+        rows = []
+        for i in range(count):
+            duration = 150 + (i % 120)
+            rows.append((f'Track {i % 5000}', f'Artist {i % 300}', 't', 't', duration, ts, ts + duration * 1000))
+            ts += (duration + 5) * 1000
+            if len(rows) == 50000:
+                conn.executemany(INSERT_PLAY, rows)
+                rows = []
+        if rows:
+            conn.executemany(INSERT_PLAY, rows)
+    conn.close()
+    return ts
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--plays', type=int, default=1000000)
+    parser.add_argument('--queries', type=int, default=500)
+    args = parser.parse_args()
+
+    app = load_app()
+    import db
+    start = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    start_ms = db.to_epoch_ms(start)
+    with Timer() as seed:
+        end_ms = seed_plays(app.database.path, args.plays, start_ms)
+
+    rng = random.Random(42)
+    latencies = []
+    found = 0
+    for _ in range(args.queries):
+        run_start = start + timedelta(milliseconds=rng.randrange(0, end_ms - start_ms))
+        run_end = run_start + timedelta(minutes=rng.choice([20, 45, 90]))
+        with Timer() as t:
+            songs = db.get_songs_in_range(1, run_start.strftime('%Y-%m-%dT%H:%M:%SZ'),
+                                          run_end.strftime('%Y-%m-%dT%H:%M:%SZ'))
+        latencies.append(t.elapsed * 1000)
+        found += len(songs)
+
+    latencies.sort()
+    print(json.dumps({
+        'plays': args.plays,
+        'queries': args.queries,
+        'seed_seconds': round(seed.elapsed, 2),
+        'avg_songs_per_run': round(found / args.queries, 1),
+        'p50_ms': round(statistics.median(latencies), 3),
+        'p99_ms': round(latencies[int(len(latencies) * 0.99) - 1], 3)
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""Dashboard reads with and without the response cache.
+
+Seeds one athlete with a listening history and the Strava stub's runs,
+then times the four requests a dashboard load makes (/api/user,
+/api/last-run, /api/runs, /api/top-tracks) through the Flask test client:
+
+- cold: right after a logged song invalidated the athlete's entries
+- warm: repeat loads answered from the in-process LRU
+- shared: a fresh LRU in front of the RESPONSE_CACHE_PATH file, i.e. the
+  first load on another gunicorn worker
+
+Usage: python benchmarks/bench_response_cache.py [--loads 200] [--songs 20000] [--runs 60]
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from datetime import timedelta
+
+from common import Timer, latency_summary, load_app, synthetic_songs
+from stubs import STUB_NEWEST_RUN, SpotifyHandler, StravaHandler, StubServer
+
+ROUTES = ('/api/user', '/api/last-run', '/api/runs', '/api/top-tracks')
+
+
+def dashboard_load(client, headers):
+    """Milliseconds per route for one dashboard load"""
+    times = {}
+    for route in ROUTES:
+        with Timer() as t:
+            response = client.get(route, headers=headers)
+            response.get_data()
+        assert response.status_code == 200, (route, response.status_code)
+        times[route] = t.elapsed * 1000
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--loads', type=int, default=200, help='dashboard loads per measurement')
+    parser.add_argument('--songs', type=int, default=20000, help='samples in the seeded history')
+    parser.add_argument('--runs', type=int, default=60, help='activities served by the Strava stub')
+    args = parser.parse_args()
+
+    fd, shared_path = tempfile.mkstemp(suffix='.db', prefix='bench_responses_')
+    os.close(fd)
+    with StubServer(StravaHandler, latency=0.02, activities=args.runs) as strava, \
+            StubServer(SpotifyHandler, latency=0.02) as spotify:
+        os.environ['STRAVA_URL'] = strava.url
+        os.environ['SPOTIFY_API_URL'] = spotify.url
+        os.environ['SPOTIFY_ACCOUNTS_URL'] = spotify.url
+        os.environ.setdefault('SPOTIFY_CLIENT_ID', 'bench')
+        os.environ.setdefault('SPOTIFY_CLIENT_SECRET', 'bench')
+        os.environ['RESPONSE_CACHE_PATH'] = shared_path
+        app = load_app()
+        import db
+        from response_cache import ResponseCache
+
+        db.save_user(1, 'stub-access', 'stub-refresh', int(time.time()) + 6 * 3600)
+        history_start = STUB_NEWEST_RUN - timedelta(seconds=args.songs * 45 - 3600)
+        db.save_songs(1, synthetic_songs(args.songs, start=history_start))
+        headers = {'Authorization': f'Bearer {db.get_api_token(1)}'}
+        client = app.app.test_client()
+        # First load syncs activities and fills the track metadata cache
+        dashboard_load(client, headers)
+
+        def measure(before_each=None):
+            samples = {route: [] for route in ROUTES}
+            for n in range(args.loads):
+                if before_each:
+                    before_each(n)
+                for route, ms in dashboard_load(client, headers).items():
+                    samples[route].append(ms)
+            return {route: latency_summary(ms) for route, ms in samples.items()}
+
+        def log_song(n):
+            played_at = STUB_NEWEST_RUN + timedelta(days=1, seconds=45 * n)
+            client.post('/log-spotify', headers=headers,
+                        json={'name': 'Bench Track', 'artist': 'Bench Artist', 'played_at': played_at.isoformat()})
+
+        def fresh_worker(n):
+            app.response_cache = ResponseCache(shared_path, max_entries=app.RESPONSE_CACHE_ENTRIES,
+                                               max_bytes=app.RESPONSE_CACHE_BYTES)
+
+        results = {
+            'cold': measure(log_song),
+            'warm': measure(),
+            'shared': measure(fresh_worker)
+        }
+        results['response_cache'] = app.response_cache.snapshot()
+
+    print(json.dumps({'loads': args.loads, 'songs': args.songs, 'runs': args.runs, 'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
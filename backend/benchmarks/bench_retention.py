@@ -0,0 +1,111 @@
+"""Hot-table size and lookup latency as the listening history grows, with and without retention.
+
+Grows two databases a year at a time with a daily listening session of
+--samples-per-day samples. One is left alone (everything stays in
+spotify_songs and plays), the other gets a Maintenance run after each
+year, as if the scheduler had kept up. After every year both are timed on:
+
+- recent: get_songs_in_range over random one-hour windows in the last 30
+  days, i.e. the webhook and last-run path
+- history: the same over windows anywhere in the history, which on the
+  maintained database mostly read the month archive
+
+Usage: python benchmarks/bench_retention.py [--years 3] [--samples-per-day 80] [--lookups 500]
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+from common import Timer, latency_summary, load_app
+
+HISTORY_START = datetime(2021, 1, 1, 18, tzinfo=timezone.utc)
+
+
+def day_of_songs(day, samples, rng):
+    start = HISTORY_START + timedelta(days=day, minutes=rng.randint(0, 120))
+    return [
+        {
+            'name': f'Track {(day * 7 + i // 4) % 500}',
+            'artist': f'Artist {(day * 7 + i // 4) % 97}',
+            'played_at': (start + timedelta(seconds=45 * i)).isoformat()
+        }
+        for i in range(samples)
+    ]
+
+
+def time_lookups(db, first_day, last_day, lookups, rng):
+    times = []
+    for _ in range(lookups):
+        start = HISTORY_START + timedelta(days=rng.uniform(first_day, last_day))
+        with Timer() as t:
+            db.get_songs_in_range(1, start, start + timedelta(hours=1))
+        times.append(t.elapsed * 1000)
+    return latency_summary(times)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--years', type=int, default=3)
+    parser.add_argument('--samples-per-day', type=int, default=80)
+    parser.add_argument('--lookups', type=int, default=500)
+    args = parser.parse_args()
+
+    load_app()
+    import db
+    from archive import PlayArchive
+    from maintenance import Maintenance
+
+    stores = {}
+    for name in ('unmaintained', 'maintained'):
+        fd, path = tempfile.mkstemp(suffix='.db', prefix=f'bench_{name}_')
+        os.close(fd)
+        os.remove(path)
+        stores[name] = (db.Database(path), PlayArchive(os.path.splitext(path)[0] + '_archive'))
+
+    def use(name):
+        db.database, db.play_archive = stores[name]
+
+    for name in stores:
+        use(name)
+        db.init_db()
+        db.save_user(1, 'bench-access', 'bench-refresh', 0)
+
+    maintenance = Maintenance()
+    results = []
+    for year in range(1, args.years + 1):
+        days = range((year - 1) * 365, year * 365)
+        for name in stores:
+            use(name)
+            rng = random.Random(year)
+            for day in days:
+                db.save_songs(1, day_of_songs(day, args.samples_per_day, rng))
+
+        now = (HISTORY_START + timedelta(days=year * 365)).timestamp()
+        use('maintained')
+        with Timer() as t:
+            stats = maintenance.run_once(force=True, now=now)
+
+        row = {'years': year, 'maintenance_seconds': round(t.elapsed, 2), 'archived_plays': stats['archived']['plays']}
+        for name in stores:
+            use(name)
+            storage = db.storage_stats()
+            rng = random.Random(0)
+            row[name] = {
+                'song_samples': storage['song_samples'],
+                'plays': storage['plays'],
+                'db_bytes': (storage['page_count'] - storage['free_pages']) * storage['page_size'],
+                'archive_bytes': storage['archive']['bytes'],
+                'recent': time_lookups(db, year * 365 - 30, year * 365 - 1, args.lookups, rng),
+                'history': time_lookups(db, 0, year * 365 - 1, args.lookups, rng)
+            }
+        results.append(row)
+
+    print(json.dumps({'samples_per_day': args.samples_per_day, 'lookups': args.lookups, 'results': results},
+                     indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""Per-song splits from activity streams: NumPy interval joins vs a per-sample loop.
+
+Builds synthetic 1 Hz streams of --hours hours with a play every ~3.5
+minutes, then times:
+
+- single: song_splits for one run, against a plain Python loop that walks
+  the samples of every play (results are checked to match)
+- batch: fastest_songs over --runs such runs, i.e. the /api/fastest-songs
+  computation without the database
+
+Usage: python benchmarks/bench_song_splits.py [--hours 1,4,12] [--runs 500] [--repeat 20]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+
+import numpy as np
+
+from common import Timer, latency_summary
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from run_analytics import fastest_songs, song_splits  # noqa: E402
+
+RUN_START_MS = 1_750_000_000_000
+TRACKS = 400
+
+
+def synthetic_run(hours, rng):
+    """(streams, plays) for a run of `hours` at 1 Hz with a few dropped HR samples"""
+    n = int(hours * 3600) + 1
+    time_s = np.arange(n, dtype=np.float64)
+    speed = 2.8 + 0.4 * np.sin(time_s / 600) + rng.normal(0, 0.05, n)
+    distance = np.concatenate(([0.0], np.cumsum(speed[:-1])))
+    heartrate = 150 + 8 * np.sin(time_s / 600) + rng.normal(0, 2, n)
+    heartrate[rng.random(n) < 0.01] = np.nan
+
+    plays = []
+    t = -60.0
+    while t < n:
+        length = rng.uniform(120, 300)
+        track = int(rng.integers(TRACKS))
+        plays.append((f'Track {track}', f'Artist {track % 50}', RUN_START_MS + int(t * 1000),
+                      RUN_START_MS + int((t + length) * 1000)))
+        t += length + rng.uniform(0, 10)
+    return (time_s, distance, heartrate), plays
+
+
+def loop_splits(streams, run_start_ms, plays):
+    """The straightforward version: visit every sample inside every play"""
+    time_s, distance, heartrate = streams
+    totals = {}
+    for name, artist, started_ms, last_seen_ms in plays:
+        start = min(max((started_ms - run_start_ms) / 1000, time_s[0]), time_s[-1])
+        end = min(max((last_seen_ms - run_start_ms) / 1000, start), time_s[-1])
+        metres = float(np.interp(end, time_s, distance) - np.interp(start, time_s, distance))
+        hr_sum, hr_count = 0.0, 0
+        for i in range(len(time_s)):
+            if start <= time_s[i] <= end and not np.isnan(heartrate[i]):
+                hr_sum += heartrate[i]
+                hr_count += 1
+        t = totals.setdefault((name, artist), [0.0, 0.0, 0.0, 0])
+        t[0] += end - start
+        t[1] += metres
+        t[2] += hr_sum
+        t[3] += hr_count
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--hours', default='1,4,12', help='comma separated run lengths')
+    parser.add_argument('--runs', type=int, default=500, help='runs in the fastest_songs batch')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    rng = np.random.default_rng(42)
+
+    single = []
+    for hours in [float(h) for h in args.hours.split(',')]:
+        streams, plays = synthetic_run(hours, rng)
+        vectorized = []
+        for _ in range(args.repeat):
+            with Timer() as t:
+                splits = song_splits(streams, RUN_START_MS, plays)
+            vectorized.append(t.elapsed * 1000)
+        with Timer() as t:
+            expected = loop_splits(streams, RUN_START_MS, plays)
+        for s in splits:
+            seconds, metres, hr_sum, hr_count = expected[(s['name'], s['artist'])]
+            assert abs(s['distance'] - metres) < 0.5, (s, metres)
+            assert s['average_heartrate'] is None or abs(s['average_heartrate'] - hr_sum / hr_count) < 0.1
+        single.append({
+            'hours': hours,
+            'samples': len(streams[0]),
+            'plays': len(plays),
+            'numpy': latency_summary(vectorized),
+            'python_loop_ms': round(t.elapsed * 1000, 1)
+        })
+
+    runs = []
+    for _ in range(args.runs):
+        streams, plays = synthetic_run(random.Random(len(runs)).uniform(0.5, 2), rng)
+        runs.append((streams, RUN_START_MS, plays))
+    batch = []
+    for _ in range(max(1, args.repeat // 4)):
+        with Timer() as t:
+            top = fastest_songs(runs, limit=10)
+        batch.append(t.elapsed * 1000)
+
+    print(json.dumps({
+        'single_run': single,
+        'fastest_songs': {
+            'runs': args.runs,
+            'samples': sum(len(r[0][0]) for r in runs),
+            'plays': sum(len(r[2]) for r in runs),
+            **latency_summary(batch),
+            'top_3': top[:3]
+        }
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""Frontend page loads: the startup-indexed build vs per-request send_from_directory.
+
+Replays what a browser fetches for one page load (index.html plus the
+entrypoints and chunks from asset-manifest.json) through the Flask test
+client, against:
+
+- baseline: the previous handler, an os.path.exists probe and an
+  uncompressed send_from_directory per file, swapped in as the view
+- indexed: the app's serve_react
+
+Each is measured as a first visit (no validators) and a repeat visit that
+sends back the ETags it was given, like a browser cache revalidating.
+Immutable bundles are not requested at all on a repeat visit to the
+indexed handler, since the browser serves them from cache.
+
+Usage: python benchmarks/bench_static_assets.py [--loads 300]
+"""
+import argparse
+import json
+import os
+
+from flask import send_from_directory
+
+from common import BACKEND_DIR, Timer, latency_summary, load_app
+
+BUILD_DIR = os.path.join(BACKEND_DIR, 'build')
+
+
+def baseline_serve_react(path):
+    if path != "" and os.path.exists(os.path.join(BUILD_DIR, path)):
+        return send_from_directory(BUILD_DIR, path)
+    return send_from_directory(BUILD_DIR, 'index.html')
+
+
+def page_paths():
+    with open(os.path.join(BUILD_DIR, 'asset-manifest.json')) as f:
+        manifest = json.load(f)
+    bundles = [url for url in manifest['files'].values()
+               if url.startswith('/static/') and not url.endswith('.map')]
+    return ['/'] + bundles + ['/manifest.json', '/favicon.ico']
+
+
+def page_load(client, paths, etags):
+    """(milliseconds, bytes on the wire) for one load; fills and sends etags"""
+    sent = 0
+    with Timer() as t:
+        for path in paths:
+            headers = {'Accept-Encoding': 'gzip, br'}
+            cached = etags.get(path)
+            if cached == 'immutable':
+                continue
+            if cached:
+                headers['If-None-Match'] = cached
+            response = client.get(path, headers=headers)
+            body = response.get_data()
+            assert response.status_code in (200, 304), (path, response.status_code)
+            sent += len(body)
+            if 'immutable' in response.headers.get('Cache-Control', ''):
+                etags[path] = 'immutable'
+            elif response.headers.get('ETag'):
+                etags[path] = response.headers['ETag']
+    return t.elapsed * 1000, sent
+
+
+def measure(client, paths, loads):
+    results = {}
+    for visit in ('first', 'repeat'):
+        times, sizes = [], []
+        for _ in range(loads):
+            etags = {}
+            if visit == 'repeat':
+                page_load(client, paths, etags)
+            ms, sent = page_load(client, paths, etags)
+            times.append(ms)
+            sizes.append(sent)
+        results[visit] = {**latency_summary(times), 'bytes': sizes[-1]}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--loads', type=int, default=300, help='page loads per measurement')
+    args = parser.parse_args()
+
+    app = load_app()
+    paths = page_paths()
+    client = app.app.test_client()
+    indexed = measure(client, paths, args.loads)
+    app.app.view_functions['serve_react'] = baseline_serve_react
+    baseline = measure(client, paths, args.loads)
+    print(json.dumps({
+        'loads': args.loads,
+        'paths': paths,
+        'baseline': baseline,
+        'indexed': indexed,
+        'build': app.static_assets.snapshot()
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
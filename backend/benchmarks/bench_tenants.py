@@ -0,0 +1,107 @@
+"""Per-request cost as the number of athletes sharing one database grows.
+
+Every synthetic athlete logs songs over the same hours and runs at the same
+times, the worst case for time-only indexes. After seeding each tier, a
+random sample of athletes fetches /api/runs, uploads a batch of samples and
+has a webhook-style activity upsert matched against their songs. With the
+(athlete_id, time) indexes the latencies should stay flat across tiers.
+
+Usage: python benchmarks/bench_tenants.py [--tiers 10,100,1000,3000] [--songs 160] [--requests 200]
+"""
+import argparse
+import json
+import os
+import random
+from datetime import datetime, timedelta, timezone
+
+from common import Timer, latency_summary, load_app, synthetic_songs
+from stubs import SpotifyHandler, StubServer
+
+DAY_START = datetime(2025, 6, 1, 6, tzinfo=timezone.utc)
+# Runs start this many minutes into the listening session and last 30 minutes
+RUN_OFFSETS = (0, 40, 80)
+
+
+def stub_run(activity_id, start):
+    return {
+        'id': activity_id,
+        'name': f'Run {activity_id}',
+        'type': 'Run',
+        'start_date': start.strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'elapsed_time': 1800,
+        'distance': 5000.0
+    }
+
+
+def seed_athlete(db, athlete_id, songs_per_athlete):
+    db.save_user(athlete_id, 'access', 'refresh', 0)
+    db.save_songs(athlete_id, synthetic_songs(songs_per_athlete, start=DAY_START))
+    db.upsert_activities(athlete_id, [
+        stub_run(athlete_id * 100 + i, DAY_START + timedelta(minutes=offset))
+        for i, offset in enumerate(RUN_OFFSETS)
+    ])
+    # Mark the local copy fresh so reads never call Strava
+    db.set_activity_sync(athlete_id, db.newest_activity_start(athlete_id))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tiers', default='10,100,1000,3000')
+    parser.add_argument('--songs', type=int, default=160, help='samples logged per athlete')
+    parser.add_argument('--requests', type=int, default=200, help='requests per operation per tier')
+    args = parser.parse_args()
+
+    with StubServer(SpotifyHandler, latency=0) as spotify:
+        os.environ['SPOTIFY_API_URL'] = spotify.url
+        os.environ['SPOTIFY_ACCOUNTS_URL'] = spotify.url
+        os.environ.setdefault('SPOTIFY_CLIENT_ID', 'bench')
+        os.environ.setdefault('SPOTIFY_CLIENT_SECRET', 'bench')
+        app = load_app()
+        import db
+        client = app.app.test_client()
+
+        rng = random.Random(42)
+        seeded = 0
+        results = []
+        for tier in [int(t) for t in args.tiers.split(',')]:
+            with Timer() as seed:
+                while seeded < tier:
+                    seeded += 1
+                    seed_athlete(db, seeded, args.songs)
+            tokens = {}
+            reads, writes, matches = [], [], []
+            for n in range(args.requests):
+                athlete_id = rng.randint(1, seeded)
+                token = tokens.setdefault(athlete_id, db.get_api_token(athlete_id))
+                headers = {'Authorization': f'Bearer {token}'}
+
+                with Timer() as t:
+                    client.get('/api/runs', headers=headers).get_data()
+                reads.append(t.elapsed * 1000)
+
+                batch = synthetic_songs(20, start=DAY_START + timedelta(days=1, minutes=n))
+                with Timer() as t:
+                    client.post('/log-spotify/batch', json=batch, headers=headers)
+                writes.append(t.elapsed * 1000)
+
+                # A Strava update to one of the athlete's runs, as the webhook worker applies it
+                run = stub_run(athlete_id * 100, DAY_START + timedelta(minutes=n % 30))
+                with Timer() as t:
+                    db.upsert_activities(athlete_id, [run])
+                matches.append(t.elapsed * 1000)
+
+            songs_total = db.database.connection().execute('SELECT COUNT(*) FROM spotify_songs').fetchone()[0]
+            results.append({
+                'athletes': seeded,
+                'song_rows': songs_total,
+                'seed_seconds': round(seed.elapsed, 2),
+                'api_runs': latency_summary(reads),
+                'log_batch_20': latency_summary(writes),
+                'activity_upsert': latency_summary(matches)
+            })
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
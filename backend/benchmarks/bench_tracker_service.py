@@ -0,0 +1,118 @@
+"""Cost of each extra account in the multi-account tracker service.
+
+For every --tiers count, accounts are created against the Spotify stub
+(which plays back-to-back tracks of --track-seconds) and the real backend on
+a local server. Two measurements per tier:
+
+- memory: tracemalloc growth from creating the accounts and their parked
+  polling tasks, per account
+- polling: the service runs for --duration seconds; event-loop CPU time,
+  Spotify calls and samples are reported per account and per poll, and the
+  uploaded samples are checked against what reached the database
+
+Usage: python benchmarks/bench_tracker_service.py [--tiers 10,100,1000] [--duration 20] [--track-seconds 10]
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+from common import git_commit, load_app, serve_app
+from stubs import SpotifyHandler, StubServer
+
+
+def make_service(tracker_service, tracker_journal, names, tokens, backend_url, spotify_url, calls_per_second):
+    fd, journal_path = tempfile.mkstemp(suffix='.db', prefix='bench_journal_')
+    os.close(fd)
+    accounts = [tracker_service.Account(name, 'refresh', tokens[name]) for name in names]
+    return tracker_service.TrackerService(
+        accounts, tracker_journal.TrackJournal(journal_path), backend_url, 'bench', 'bench',
+        budget=tracker_service.RateBudget(calls_per_second, calls_per_second),
+        api_url=spotify_url, accounts_url=spotify_url, start_jitter=1)
+
+
+async def measure_memory(tracker_service, tracker_journal, names, tokens, backend_url, spotify_url):
+    """Bytes held per account by the Account objects and their sleeping tasks"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    service = make_service(tracker_service, tracker_journal, names, tokens, backend_url, spotify_url, 1000)
+    service.start_jitter = 3600
+    tasks = [asyncio.create_task(service.run_account(a)) for a in service.accounts.values()]
+    await asyncio.sleep(0)
+    grown = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    service.close()
+    return grown / len(names)
+
+
+async def measure_polling(service, duration):
+    cpu_start = time.thread_time()
+    runner = asyncio.create_task(service.run(upload_interval=2))
+    await asyncio.sleep(duration)
+    runner.cancel()
+    await asyncio.gather(runner, return_exceptions=True)
+    await service.upload_once()
+    service.close()
+    return time.thread_time() - cpu_start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tiers', default='10,100,1000')
+    parser.add_argument('--duration', type=float, default=20, help='seconds of polling per tier')
+    parser.add_argument('--track-seconds', type=float, default=10, help='length of the stub tracks')
+    parser.add_argument('--calls-per-second', type=float, default=500, help='shared Spotify rate budget')
+    args = parser.parse_args()
+
+    with StubServer(SpotifyHandler, latency=0.02, track_seconds=args.track_seconds) as spotify:
+        app = load_app()
+        import db
+        import tracker_journal
+        import tracker_service
+        server, backend_url = serve_app(app.app)
+
+        tiers = []
+        created = 0
+        tokens = {}
+        for tier in [int(t) for t in args.tiers.split(',')]:
+            while created < tier:
+                created += 1
+                db.save_user(created, 'access', 'refresh', 0)
+                tokens[f'runner{created}'] = db.get_api_token(created)
+            names = [f'runner{i}' for i in range(1, tier + 1)]
+
+            per_account_bytes = asyncio.run(measure_memory(tracker_service, tracker_journal, names, tokens,
+                                                           backend_url, spotify.url))
+            service = make_service(tracker_service, tracker_journal, names, tokens, backend_url, spotify.url,
+                                   args.calls_per_second)
+            songs_before = db.database.connection().execute('SELECT COUNT(*) FROM spotify_songs').fetchone()[0]
+            loop_cpu = asyncio.run(measure_polling(service, args.duration))
+            songs_after = db.database.connection().execute('SELECT COUNT(*) FROM spotify_songs').fetchone()[0]
+
+            stats = service.stats()
+            calls = stats['api_calls']
+            tiers.append({
+                'accounts': tier,
+                'bytes_per_account': round(per_account_bytes),
+                'spotify_calls': calls,
+                'spotify_calls_per_account_hour': round(calls / tier * 3600 / args.duration, 1),
+                'loop_cpu_seconds': round(loop_cpu, 3),
+                'loop_cpu_ms_per_poll': round(loop_cpu * 1000 / max(calls, 1), 3),
+                'samples': stats['samples'],
+                'uploaded': stats['uploaded'],
+                'new_song_rows': songs_after - songs_before,
+                'pending_after_run': stats['pending']
+            })
+        server.shutdown()
+
+    print(json.dumps({'commit': git_commit(), 'config': vars(args), 'tiers': tiers}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
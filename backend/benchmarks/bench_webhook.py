@@ -0,0 +1,103 @@
+"""Fire a burst of Strava webhooks at the backend and measure how fast they are acknowledged.
+
+The backend runs in a threaded werkzeug server, Strava is a local stub with
+injected latency. Reports acknowledgement latency and how long the worker
+pool takes to drain the queue, and checks that an edit arriving while its
+activity's job is running gets the job run again rather than dropped.
+
+Usage: python benchmarks/bench_webhook.py [--events 300] [--clients 16] [--latency 0.2]
+"""
+import argparse
+import json
+import os
+import sqlite3
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from common import Timer, load_app, percentile, serve_app
+from stubs import StravaHandler, StubServer
+
+
+def mid_job_update(app):
+    """Handler runs for a job whose activity is edited again while it runs; 2 means the edit was kept"""
+    from db import Database
+    from jobs import JobQueue
+
+    # A queue of its own, so the app's workers do not claim the job
+    queue = JobQueue(Database(tempfile.mkstemp(suffix='.db', prefix='bench_jobs_')[1]))
+    runs = []
+
+    def handler(job):
+        runs.append(job['activity_id'])
+        if len(runs) == 1:
+            queue.enqueue(job['activity_id'], job['athlete_id'], 'update')
+        app.process_activity_event(job)
+
+    queue.enqueue(900000, 1, 'update')
+    while queue.run_once(handler):
+        pass
+    return {'handler_runs': len(runs), 'jobs': queue.stats()}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--events', type=int, default=300)
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--latency', type=float, default=0.2)
+    parser.add_argument('--workers', type=int, default=8)
+    args = parser.parse_args()
+
+    with StubServer(StravaHandler, latency=args.latency) as strava:
+        os.environ['STRAVA_URL'] = strava.url
+        os.environ['WEBHOOK_WORKERS'] = str(args.workers)
+        app = load_app()
+        conn = sqlite3.connect(app.database.path)
+        conn.execute('INSERT INTO users (athlete_id, access_token, refresh_token, expires_at) VALUES (1, ?, ?, ?)',
+                     ('stub-access', 'stub-refresh', int(time.time()) + 6 * 3600))
+        conn.commit()
+        conn.close()
+
+        server, base_url = serve_app(app.app)
+        url = f'{base_url}/webhook'
+
+        session = requests.Session()
+
+        def fire(i):
+            event = {'object_type': 'activity', 'object_id': 1000 + i, 'owner_id': 1,
+                     'aspect_type': 'create', 'event_time': int(time.time())}
+            start = time.perf_counter()
+            resp = session.post(url, json=event)
+            return (time.perf_counter() - start) * 1000, resp.status_code
+
+        with Timer() as total:
+            with ThreadPoolExecutor(max_workers=args.clients) as pool:
+                acks = list(pool.map(fire, range(args.events)))
+            while True:
+                stats = app.webhook_queue.stats()
+                if stats['pending'] + stats['running'] == 0:
+                    break
+                time.sleep(0.05)
+
+        server.shutdown()
+        rerun = mid_job_update(app)
+        latencies = [a[0] for a in acks]
+        print(json.dumps({
+            'events': args.events,
+            'strava_latency': args.latency,
+            'workers': args.workers,
+            'ack_p50_ms': round(statistics.median(latencies), 2),
+            'ack_p99_ms': round(percentile(latencies, 99), 2),
+            'ack_max_ms': round(max(latencies), 2),
+            'non_200_acks': sum(1 for a in acks if a[1] != 200),
+            'drain_seconds': round(total.elapsed, 2),
+            'jobs': stats,
+            'mid_job_update': rerun
+        }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""Shared helpers for the backend benchmarks.
+
+Each benchmark points DB_PATH at a throwaway SQLite file before importing
+app, so runs never touch the real spotify_strava.db.
+"""
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_app(db_path=None):
+    """Import the Flask app against a fresh temporary database"""
+    if db_path is None:
+        fd, db_path = tempfile.mkstemp(suffix='.db', prefix='bench_')
+        os.close(fd)
+        os.remove(db_path)
+    os.environ['DB_PATH'] = db_path
+    if BACKEND_DIR not in sys.path:
+        sys.path.insert(0, BACKEND_DIR)
+    import app
+    return app
+
+
+def synthetic_songs(count, start=None, step_seconds=45):
+    """Generate `count` song samples spaced `step_seconds` apart"""
+    start = start or datetime(2025, 1, 1, tzinfo=timezone.utc)
+    return [
+        {
+            'name': f'Track {i % 500}',
+            'artist': f'Artist {i % 97}',
+            'played_at': (start + timedelta(seconds=i * step_seconds)).isoformat()
+        }
+        for i in range(count)
+    ]
+
+
+def serve_app(flask_app):
+    """Serve the app on a threaded werkzeug server; returns (server, base_url)"""
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server('127.0.0.1', 0, flask_app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def latency_summary(latencies_ms):
+    """p50/p99/max of a list of millisecond latencies, rounded for JSON output"""
+    if not latencies_ms:
+        return {'p50_ms': None, 'p99_ms': None, 'max_ms': None}
+    return {
+        'p50_ms': round(statistics.median(latencies_ms), 3),
+        'p99_ms': round(percentile(latencies_ms, 99), 3),
+        'max_ms': round(max(latencies_ms), 3)
+    }
+
+
+def git_commit():
+    """Short hash of the checked-out commit, so results can be compared across commits"""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Timer:
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
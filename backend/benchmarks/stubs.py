@@ -0,0 +1,206 @@
+"""Local stand-ins for the Strava and Spotify APIs used by the benchmarks.
+
+Each stub is a ThreadingHTTPServer on 127.0.0.1 with an injected per-request
+latency, so benchmarks measure our code's concurrency rather than the
+internet's.
+"""
+import json
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class StubServer:
+    """Run a handler class on a background thread; use as a context manager"""
+
+    def __init__(self, handler, **config):
+        handler_cls = type(handler.__name__, (handler,), {'config': config, 'stats': {'requests': 0}})
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), handler_cls)
+        self.server.daemon_threads = True
+        self.stats = handler_cls.stats
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}'
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class JSONHandler(BaseHTTPRequestHandler):
+    config = {}
+    stats = {}
+    _lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def count(self):
+        with self._lock:
+            self.stats['requests'] += 1
+            return self.stats['requests']
+
+    def send_json(self, status, body, headers=None):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+class SpotifyHandler(JSONHandler):
+    """Serves /api/token, /v1/search and the playback endpoints the trackers poll.
+
+    config: latency (seconds per request), rate_limit_every (every Nth
+    GET answers 429), retry_after (seconds sent with the 429),
+    track_seconds (length of the tracks /v1/me/player cycles through).
+    """
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.send_json(200, {'access_token': 'stub-token', 'token_type': 'Bearer', 'expires_in': 3600})
+
+    def do_GET(self):
+        n = self.count()
+        time.sleep(self.config.get('latency', 0.05))
+        every = self.config.get('rate_limit_every')
+        if every and n % every == 0:
+            self.send_json(429, {'error': 'rate limited'},
+                           {'Retry-After': str(self.config.get('retry_after', 1))})
+            return
+
+        path = urlparse(self.path).path
+        if path == '/v1/me/player':
+            self.send_json(200, self.playback())
+            return
+        if path == '/v1/me/player/recently-played':
+            self.send_json(200, {'items': []})
+            return
+
+        query = parse_qs(urlparse(self.path).query).get('q', [''])[0]
+        self.send_json(200, {'tracks': {'items': [{
+            'name': query,
+            'artists': [{'name': 'Stub Artist'}],
+            'album': {'images': [{'url': 'https://example.invalid/cover.jpg'}]},
+            'external_urls': {'spotify': 'https://open.spotify.com/track/stub'},
+            'preview_url': None
+        }]}})
+
+
+    def playback(self):
+        """Every listener hears the same back-to-back tracks of track_seconds each"""
+        duration_ms = int(self.config.get('track_seconds', 180) * 1000)
+        now_ms = int(time.time() * 1000)
+        track = now_ms // duration_ms
+        return {
+            'is_playing': True,
+            'progress_ms': now_ms % duration_ms,
+            'item': {'id': f'stub{track}', 'name': f'Track {track % 500}', 'artists': [{'name': 'Stub Artist'}],
+                     'duration_ms': duration_ms}
+        }
+
+
+class StravaHandler(JSONHandler):
+    """Serves the Strava endpoints the backend uses.
+
+    config: latency (seconds per request), rate_limit_every (every Nth
+    request answers 429), activities (count returned by the list endpoint).
+    """
+
+    def _limited(self):
+        n = self.count()
+        time.sleep(self.config.get('latency', 0.05))
+        every = self.config.get('rate_limit_every')
+        if every and n % every == 0:
+            self.send_json(429, {'message': 'Rate Limit Exceeded'})
+            return True
+        return False
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self._limited():
+            return
+        self.send_json(200, {'access_token': 'stub-access', 'refresh_token': 'stub-refresh',
+                             'expires_at': int(time.time()) + 6 * 3600, 'athlete': {'id': 1}})
+
+    def do_PUT(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self._limited():
+            return
+        activity_id = self.path.rstrip('/').rsplit('/', 1)[-1]
+        self.send_json(200, {'id': int(activity_id)})
+
+    def do_GET(self):
+        if self._limited():
+            return
+        path = urlparse(self.path).path
+        if path == '/api/v3/athlete':
+            self.send_json(200, {'id': 1, 'firstname': 'Stub', 'lastname': 'Runner'})
+        elif path == '/api/v3/athlete/activities':
+            self.send_json(200, self.list_activities())
+        elif path.startswith('/api/v3/activities/') and path.endswith('/streams'):
+            self.send_json(200, stub_streams(int(path.split('/')[-2])))
+        elif path.startswith('/api/v3/activities/'):
+            self.send_json(200, stub_activity(int(path.rsplit('/', 1)[-1])))
+        else:
+            self.send_json(404, {'message': 'Record Not Found'})
+
+
+    def list_activities(self):
+        """Mimics Strava: `after` returns oldest first, otherwise newest first, paged"""
+        params = parse_qs(urlparse(self.path).query)
+        per_page = int(params.get('per_page', ['30'])[0])
+        page = int(params.get('page', ['1'])[0])
+        ids = range(self.config.get('activities', 10))
+        if 'after' in params:
+            after = int(params['after'][0])
+            ids = sorted((i for i in ids if stub_start(i) > after), key=stub_start)
+        else:
+            ids = sorted(ids, key=stub_start, reverse=True)
+        return [stub_activity(i) for i in ids[(page - 1) * per_page:page * per_page]]
+
+
+STUB_NEWEST_RUN = datetime(2025, 6, 30, 7, tzinfo=timezone.utc)
+# Activity dates repeat every this many ids, so any id maps to a valid date
+STUB_ID_WRAP = 3650
+
+
+def stub_start(activity_id):
+    """Epoch start of a stub activity; id 0 is the newest, one run per day before it"""
+    return int((STUB_NEWEST_RUN - timedelta(days=activity_id % STUB_ID_WRAP)).timestamp())
+
+
+def stub_streams(activity_id, elapsed=1800):
+    """1 Hz time/distance/heartrate streams for a stub run, with the pace drifting every few minutes"""
+    speed = [2.86 + 0.3 * ((t // 240 + activity_id) % 3 - 1) for t in range(elapsed + 1)]
+    distance, total = [], 0.0
+    for v in speed:
+        distance.append(round(total, 1))
+        total += v
+    return {
+        'time': {'data': list(range(elapsed + 1))},
+        'distance': {'data': distance},
+        'heartrate': {'data': [int(140 + 10 * v) for v in speed]}
+    }
+
+
+def stub_activity(activity_id):
+    """A 30 minute run"""
+    return {
+        'id': activity_id,
+        'name': f'Run {activity_id}',
+        'type': 'Run',
+        'start_date': datetime.fromtimestamp(stub_start(activity_id), timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'elapsed_time': 1800,
+        'moving_time': 1750,
+        'distance': 5000.0,
+        'average_speed': 2.86
+    }
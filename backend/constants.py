@@ -0,0 +1,8 @@
+"""How the backend folds playback samples into plays.
+
+Kept apart from db.py so the trackers can import it and build their
+polling schedule around the same numbers without importing the database.
+"""
+
+# Samples of the same track closer together than this extend a single play
+PLAY_GAP_SECONDS = 120
@@ -0,0 +1,1111 @@
+"""SQLite data access for the backend.
+
+Connections are opened once per thread and kept for the life of the
+thread, in WAL mode with the pragmas below. Reusing the connection also
+reuses sqlite3's per-connection statement cache, so the SQL in this
+module is compiled once per thread rather than on every call.
+"""
+import functools
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+from archive import PlayArchive, month_bounds, month_of, months_between
+from constants import PLAY_GAP_SECONDS
+from metrics import REGISTRY
+
+DB_PATH = os.getenv('DB_PATH', 'spotify_strava.db')
+# Month files of archived plays (see archive.py), next to the database by default
+ARCHIVE_DIR = os.getenv('ARCHIVE_DIR', os.path.splitext(DB_PATH)[0] + '_archive')
+# How long a writer waits on a locked database before giving up, in ms
+BUSY_TIMEOUT_MS = int(os.getenv('DB_BUSY_TIMEOUT_MS', '5000'))
+# Plays are split once they span this long, which also bounds the range lookup
+MAX_PLAY_SECONDS = 30 * 60
+# Strava activity types shown as runs
+RUN_TYPES = ('Run', 'TrailRun', 'VirtualRun')
+# Longest activity considered when matching new songs to runs
+MAX_RUN_SECONDS = 24 * 3600
+
+PRAGMAS = (
+    # Has to come before WAL to apply to a new file; optimize_storage converts old ones
+    'PRAGMA auto_vacuum=INCREMENTAL',
+    'PRAGMA journal_mode=WAL',
+    # Durable across application crashes; only an OS crash can lose the last commits
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA cache_size=-16000',
+    'PRAGMA mmap_size=134217728',
+    'PRAGMA temp_store=MEMORY',
+)
+
+
+class Database:
+    """Hands out one long-lived connection per thread"""
+
+    def __init__(self, path, busy_timeout_ms=BUSY_TIMEOUT_MS):
+        self.path = path
+        self.busy_timeout_ms = busy_timeout_ms
+        self._local = threading.local()
+
+    def connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout_ms / 1000,
+                                   cached_statements=256)
+            for pragma in PRAGMAS:
+                conn.execute(pragma)
+            conn.execute(f'PRAGMA busy_timeout={self.busy_timeout_ms}')
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def transaction(self, immediate=False):
+        """Commit on success, roll back on error.
+
+        immediate=True takes the write lock up front (BEGIN IMMEDIATE), for
+        read-then-write sequences that must not interleave with other writers.
+        """
+        conn = self.connection()
+        if immediate:
+            conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        else:
+            conn.commit()
+
+    def close(self):
+        """Close this thread's connection, if it has one"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+database = Database(DB_PATH)
+play_archive = PlayArchive(ARCHIVE_DIR)
+
+DB_QUERY_SECONDS = REGISTRY.histogram('db_query_seconds', 'Time spent in db functions on the request and webhook paths',
+                                      ['query'])
+
+
+def timed_query(func):
+    """Record each call's duration in db_query_seconds under the function's name"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with DB_QUERY_SECONDS.time(query=func.__name__):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+INSERT_SONG = '''
+    INSERT INTO spotify_songs (athlete_id, name, artist, played_at, played_at_ms) VALUES (?, ?, ?, ?, ?)
+'''
+INSERT_SONG_IGNORE = '''
+    INSERT OR IGNORE INTO spotify_songs (athlete_id, name, artist, played_at, played_at_ms) VALUES (?, ?, ?, ?, ?)
+'''
+
+# Raw samples are unique per athlete, not globally, so two runners can log
+# the same second, and keyed on the instant rather than the text, so
+# '...:45Z' and '...:45+00:00' are one sample. Also used to rebuild older tables.
+SPOTIFY_SONGS_TABLE = '''
+    CREATE TABLE IF NOT EXISTS {name} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        athlete_id INTEGER,
+        name TEXT NOT NULL,
+        artist TEXT NOT NULL,
+        played_at TEXT NOT NULL,
+        played_at_ms INTEGER,
+        UNIQUE (athlete_id, played_at_ms)
+    )
+'''
+
+
+# ============ Schema ============
+
+def init_db():
+    conn = database.connection()
+    c = conn.cursor()
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY,
+            athlete_id INTEGER UNIQUE,
+            access_token TEXT,
+            refresh_token TEXT,
+            expires_at INTEGER,
+            api_token TEXT
+        )
+    ''')
+    c.execute(SPOTIFY_SONGS_TABLE.format(name='spotify_songs'))
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS processed_activities (
+            id INTEGER PRIMARY KEY,
+            updated_at TEXT NOT NULL
+        )
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS plays (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            athlete_id INTEGER,
+            name TEXT NOT NULL,
+            artist TEXT NOT NULL,
+            started_at TEXT NOT NULL,
+            last_seen_at TEXT NOT NULL,
+            duration INTEGER NOT NULL DEFAULT 0,
+            started_ms INTEGER,
+            last_seen_ms INTEGER
+        )
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS activities (
+            id INTEGER PRIMARY KEY,
+            athlete_id INTEGER NOT NULL,
+            type TEXT,
+            start_date TEXT NOT NULL,
+            start_ms INTEGER NOT NULL,
+            end_ms INTEGER,
+            data TEXT NOT NULL,
+            updated_at REAL NOT NULL
+        )
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS run_songs (
+            activity_id INTEGER NOT NULL,
+            position INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            artist TEXT NOT NULL,
+            first_played_at TEXT NOT NULL,
+            seconds_in_run INTEGER NOT NULL,
+            PRIMARY KEY (activity_id, position)
+        ) WITHOUT ROWID
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_run_songs_track ON run_songs (name, artist)')
+    # Packed float32 arrays from Strava's streams endpoint (see run_analytics);
+    # NULL time means Strava has no streams for the activity
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS activity_streams (
+            activity_id INTEGER PRIMARY KEY,
+            athlete_id INTEGER NOT NULL,
+            time BLOB,
+            distance BLOB,
+            heartrate BLOB,
+            fetched_at REAL NOT NULL
+        )
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS last_modified (
+            name TEXT PRIMARY KEY,
+            updated_at REAL NOT NULL
+        )
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS cache_generations (
+            athlete_id INTEGER PRIMARY KEY,
+            generation INTEGER NOT NULL
+        )
+    ''')
+    # Where a description backfill got to, so an interrupted one resumes
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS backfills (
+            athlete_id INTEGER PRIMARY KEY,
+            status TEXT NOT NULL,
+            cursor_start_ms INTEGER,
+            cursor_id INTEGER,
+            stats TEXT NOT NULL,
+            updated_at REAL NOT NULL
+        )
+    ''')
+    # Which months of plays live in the archive, and which athletes have plays in each
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS archive_months (
+            month TEXT PRIMARY KEY,
+            plays INTEGER NOT NULL,
+            bytes INTEGER NOT NULL,
+            version INTEGER NOT NULL,
+            archived_at REAL NOT NULL
+        )
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS archived_plays (
+            athlete_id INTEGER NOT NULL,
+            month TEXT NOT NULL,
+            plays INTEGER NOT NULL,
+            PRIMARY KEY (athlete_id, month)
+        ) WITHOUT ROWID
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS maintenance_runs (
+            name TEXT PRIMARY KEY,
+            started_at REAL NOT NULL,
+            finished_at REAL,
+            stats TEXT
+        )
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS activity_sync (
+            athlete_id INTEGER PRIMARY KEY,
+            after_epoch INTEGER NOT NULL DEFAULT 0,
+            synced_at REAL NOT NULL
+        )
+    ''')
+    add_column_if_missing(conn, 'spotify_songs', 'played_at_ms', 'INTEGER')
+    add_column_if_missing(conn, 'plays', 'started_ms', 'INTEGER')
+    add_column_if_missing(conn, 'plays', 'last_seen_ms', 'INTEGER')
+    add_column_if_missing(conn, 'activities', 'end_ms', 'INTEGER')
+    add_column_if_missing(conn, 'plays', 'athlete_id', 'INTEGER')
+    add_column_if_missing(conn, 'users', 'api_token', 'TEXT')
+    add_column_if_missing(conn, 'processed_activities', 'description_hash', 'TEXT')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_activities_athlete_start ON activities (athlete_id, start_ms)')
+    c.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_users_api_token ON users (api_token)')
+    # Every lookup is scoped to one athlete, so the single-column time
+    # indexes are replaced by (athlete_id, time) ones below
+    for index in ('idx_plays_started_at', 'idx_plays_started_ms', 'idx_spotify_songs_played_at_ms',
+                  'idx_activities_start'):
+        c.execute(f'DROP INDEX IF EXISTS {index}')
+    conn.commit()
+
+    version = c.execute('PRAGMA user_version').fetchone()[0]
+    if version < 1:
+        migrate_songs_to_plays(conn)
+        c.execute('PRAGMA user_version = 1')
+    if version < 2:
+        backfill_epoch_ms(conn)
+        c.execute('PRAGMA user_version = 2')
+    if version < 3:
+        backfill_run_songs(conn)
+        c.execute('PRAGMA user_version = 3')
+    if version < 4:
+        partition_by_athlete(conn)
+        c.execute('PRAGMA user_version = 4')
+    if version < 5:
+        key_samples_by_instant(conn)
+        c.execute('PRAGMA user_version = 5')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_plays_athlete_started ON plays (athlete_id, started_ms)')
+    conn.commit()
+
+
+def add_column_if_missing(conn, table, column, decl):
+    columns = [r[1] for r in conn.execute(f'PRAGMA table_info({table})')]
+    if column not in columns:
+        conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {decl}')
+
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def parse_timestamp(value):
+    """Parse an ISO 8601 timestamp (with 'Z' or an offset) into an aware UTC datetime"""
+    if isinstance(value, datetime):
+        dt = value
+    else:
+        dt = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc)
+
+
+def format_timestamp(dt):
+    """Fixed-width UTC format used for the human readable timestamp columns"""
+    return dt.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f+00:00')
+
+
+def to_epoch_ms(value):
+    """Normalize a timestamp string or datetime to integer epoch milliseconds"""
+    return (parse_timestamp(value) - EPOCH) // timedelta(milliseconds=1)
+
+
+def migrate_songs_to_plays(conn):
+    """Collapse existing per-poll rows in spotify_songs into play intervals"""
+    rows = conn.execute('SELECT name, artist, played_at FROM spotify_songs').fetchall()
+    samples = sorted((to_epoch_ms(r[2]), r[0], r[1], r[2]) for r in rows)
+
+    plays = []
+    for ts, name, artist, played_at in samples:
+        current = plays[-1] if plays else None
+        if (current and current['name'] == name and current['artist'] == artist
+                and ts - current['last_seen_ms'] <= PLAY_GAP_SECONDS * 1000
+                and ts - current['started_ms'] <= MAX_PLAY_SECONDS * 1000):
+            current['last_seen_ms'] = ts
+            current['last_seen_at'] = played_at
+        else:
+            plays.append({'name': name, 'artist': artist, 'started_ms': ts, 'last_seen_ms': ts,
+                          'started_at': played_at, 'last_seen_at': played_at})
+
+    conn.executemany('''
+        INSERT INTO plays (name, artist, started_at, last_seen_at, duration, started_ms, last_seen_ms)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', [(p['name'], p['artist'],
+           format_timestamp(parse_timestamp(p['started_at'])),
+           format_timestamp(parse_timestamp(p['last_seen_at'])),
+           (p['last_seen_ms'] - p['started_ms']) // 1000,
+           p['started_ms'], p['last_seen_ms']) for p in plays])
+
+
+def backfill_epoch_ms(conn, chunk_size=10000):
+    """Fill the epoch-millisecond columns for rows written before they existed"""
+    while True:
+        rows = conn.execute('SELECT id, played_at FROM spotify_songs WHERE played_at_ms IS NULL LIMIT ?',
+                            (chunk_size,)).fetchall()
+        if not rows:
+            break
+        conn.executemany('UPDATE spotify_songs SET played_at_ms=? WHERE id=?',
+                         [(to_epoch_ms(r[1]), r[0]) for r in rows])
+    while True:
+        rows = conn.execute('SELECT id, started_at, last_seen_at FROM plays WHERE started_ms IS NULL LIMIT ?',
+                            (chunk_size,)).fetchall()
+        if not rows:
+            break
+        conn.executemany('UPDATE plays SET started_ms=?, last_seen_ms=? WHERE id=?',
+                         [(to_epoch_ms(r[1]), to_epoch_ms(r[2]), r[0]) for r in rows])
+
+
+def partition_by_athlete(conn):
+    """Give songs and plays an owner.
+
+    Databases from before multi-user support only ever had one runner, so
+    their songs and plays are assigned to the first connected user (or,
+    with no user yet, to whoever connects first; see save_user).
+    """
+    columns = [r[1] for r in conn.execute('PRAGMA table_info(spotify_songs)')]
+    if 'athlete_id' not in columns:
+        conn.execute(SPOTIFY_SONGS_TABLE.format(name='spotify_songs_v4'))
+        # Samples written with another offset for the same instant collapse into the first
+        conn.execute('''
+            INSERT OR IGNORE INTO spotify_songs_v4 (id, name, artist, played_at, played_at_ms)
+            SELECT id, name, artist, played_at, played_at_ms FROM spotify_songs ORDER BY id
+        ''')
+        conn.execute('DROP TABLE spotify_songs')
+        conn.execute('ALTER TABLE spotify_songs_v4 RENAME TO spotify_songs')
+
+    owner = conn.execute('SELECT athlete_id FROM users ORDER BY id LIMIT 1').fetchone()
+    if owner:
+        conn.execute('UPDATE spotify_songs SET athlete_id=? WHERE athlete_id IS NULL', owner)
+        conn.execute('UPDATE plays SET athlete_id=? WHERE athlete_id IS NULL', owner)
+    for (athlete_id,) in conn.execute('SELECT athlete_id FROM users WHERE api_token IS NULL').fetchall():
+        conn.execute('UPDATE users SET api_token=? WHERE athlete_id=?', (new_api_token(), athlete_id))
+    backfill_run_songs(conn)
+
+
+def key_samples_by_instant(conn):
+    """Rebuild spotify_songs unique on (athlete_id, played_at_ms) instead of the timestamp text.
+
+    Samples of the same instant written with different offsets are
+    duplicates; the first is kept. The plays are unaffected, since folding
+    a sample at a time already seen changes nothing. The UNIQUE key also
+    replaces idx_spotify_songs_athlete_played.
+    """
+    conn.execute(SPOTIFY_SONGS_TABLE.format(name='spotify_songs_v5'))
+    conn.execute('''
+        INSERT OR IGNORE INTO spotify_songs_v5 (id, athlete_id, name, artist, played_at, played_at_ms)
+        SELECT id, athlete_id, name, artist, played_at, played_at_ms FROM spotify_songs ORDER BY id
+    ''')
+    conn.execute('DROP TABLE spotify_songs')
+    conn.execute('ALTER TABLE spotify_songs_v5 RENAME TO spotify_songs')
+
+
+# ============ Songs and plays ============
+
+def record_play(conn, athlete_id, name, artist, played_at):
+    """Fold one playback sample into the athlete's plays.
+
+    A sample of the same track within PLAY_GAP_SECONDS of an existing play
+    extends that play instead of adding a row. Returns the changed play's
+    [started_ms, last_seen_ms], or None when the sample changed nothing.
+    """
+    ts = to_epoch_ms(played_at)
+    ts_text = format_timestamp(parse_timestamp(played_at))
+    gap_ms = PLAY_GAP_SECONDS * 1000
+    max_ms = MAX_PLAY_SECONDS * 1000
+    c = conn.cursor()
+
+    c.execute('''
+        SELECT id, name, artist, started_ms, last_seen_ms FROM plays
+        WHERE athlete_id = ? AND started_ms <= ? ORDER BY started_ms DESC LIMIT 1
+    ''', (athlete_id, ts))
+    prev = c.fetchone()
+    if prev and prev[1] == name and prev[2] == artist:
+        started, last_seen = prev[3], prev[4]
+        if ts <= last_seen:
+            return None
+        if ts - last_seen <= gap_ms and ts - started <= max_ms:
+            c.execute('UPDATE plays SET last_seen_at=?, last_seen_ms=?, duration=? WHERE id=?',
+                      (ts_text, ts, (ts - started) // 1000, prev[0]))
+            return [started, ts]
+
+    # Samples can arrive out of order from batch uploads, so also check
+    # whether this one extends the following play backwards
+    c.execute('''
+        SELECT id, name, artist, started_ms, last_seen_ms FROM plays
+        WHERE athlete_id = ? AND started_ms > ? ORDER BY started_ms ASC LIMIT 1
+    ''', (athlete_id, ts))
+    nxt = c.fetchone()
+    if nxt and nxt[1] == name and nxt[2] == artist:
+        started, last_seen = nxt[3], nxt[4]
+        if started - ts <= gap_ms and last_seen - ts <= max_ms:
+            c.execute('UPDATE plays SET started_at=?, started_ms=?, duration=? WHERE id=?',
+                      (ts_text, ts, (last_seen - ts) // 1000, nxt[0]))
+            return [ts, last_seen]
+
+    c.execute('''
+        INSERT INTO plays (athlete_id, name, artist, started_at, last_seen_at, duration, started_ms, last_seen_ms)
+        VALUES (?, ?, ?, ?, ?, 0, ?, ?)
+    ''', (athlete_id, name, artist, ts_text, ts_text, ts, ts))
+    return [ts, ts]
+
+
+def touch(conn, name):
+    """Record that a dataset changed, for Last-Modified headers"""
+    conn.execute('INSERT OR REPLACE INTO last_modified (name, updated_at) VALUES (?, ?)', (name, time.time()))
+
+
+def get_last_modified(name):
+    row = database.connection().execute('SELECT updated_at FROM last_modified WHERE name=?', (name,)).fetchone()
+    return row[0] if row else None
+
+
+def songs_last_modified(athlete_id):
+    """Unix time the athlete last logged a new song, or None"""
+    return get_last_modified(f'songs:{athlete_id}')
+
+
+def bump_cache_generation(conn, athlete_id):
+    """Invalidate the athlete's cached API responses (see response_cache.py)"""
+    conn.execute('''
+        INSERT INTO cache_generations (athlete_id, generation) VALUES (?, 1)
+        ON CONFLICT (athlete_id) DO UPDATE SET generation = generation + 1
+    ''', (athlete_id,))
+
+
+def get_cache_generation(athlete_id):
+    """Counter bumped by every write that can change the athlete's API responses"""
+    row = database.connection().execute(
+        'SELECT generation FROM cache_generations WHERE athlete_id=?', (athlete_id,)
+    ).fetchone()
+    return row[0] if row else 0
+
+
+def save_song(athlete_id, name, artist, played_at):
+    try:
+        with database.transaction() as conn:
+            if not unarchived(conn, athlete_id, [{'played_at': played_at}]):
+                return
+            conn.execute(INSERT_SONG, (athlete_id, name, artist, played_at, to_epoch_ms(played_at)))
+            changed = record_play(conn, athlete_id, name, artist, played_at)
+            refresh_run_songs_between(conn, athlete_id, [changed] if changed else [])
+            touch(conn, f'songs:{athlete_id}')
+            bump_cache_generation(conn, athlete_id)
+    except sqlite3.IntegrityError:
+        pass
+
+
+@timed_query
+def save_songs(athlete_id, songs):
+    """Insert many of an athlete's songs in a single transaction, returns how many rows were new"""
+    with database.transaction() as conn:
+        songs = unarchived(conn, athlete_id, songs)
+        before = conn.total_changes
+        conn.executemany(INSERT_SONG_IGNORE, [(athlete_id, s['name'], s['artist'], s['played_at'],
+                                               to_epoch_ms(s['played_at'])) for s in songs])
+        inserted = conn.total_changes - before
+        # Folding is idempotent, so re-sent samples leave the plays untouched
+        changed = []
+        for s in sorted(songs, key=lambda s: to_epoch_ms(s['played_at'])):
+            span = record_play(conn, athlete_id, s['name'], s['artist'], s['played_at'])
+            if span:
+                changed.append(span)
+        refresh_run_songs_between(conn, athlete_id, changed)
+        if inserted:
+            touch(conn, f'songs:{athlete_id}')
+            bump_cache_generation(conn, athlete_id)
+        return inserted
+
+
+def unarchived(conn, athlete_id, songs):
+    """The songs that do not fall in a month already archived for the athlete.
+
+    Archived months are read-only: their raw samples are gone, so a sample
+    sent again could no longer be recognised and its play would count twice.
+    """
+    if not songs:
+        return songs
+    months = {month_of(to_epoch_ms(s['played_at'])) for s in songs}
+    archived = {r[0] for r in conn.execute(f'''
+        SELECT month FROM archived_plays WHERE athlete_id = ? AND month IN ({','.join('?' * len(months))})
+    ''', (athlete_id, *months))}
+    if not archived:
+        return songs
+    return [s for s in songs if month_of(to_epoch_ms(s['played_at'])) not in archived]
+
+
+def archived_plays_between(conn, athlete_id, start_ms, end_ms):
+    """Archived plays of the athlete that started within [start_ms, end_ms], as archive.COLUMNS rows"""
+    months = conn.execute('''
+        SELECT m.month, m.version FROM archived_plays a JOIN archive_months m ON m.month = a.month
+        WHERE a.athlete_id = ? AND a.month BETWEEN ? AND ?
+    ''', (athlete_id, month_of(start_ms), month_of(end_ms))).fetchall()
+    rows = []
+    for month, version in months:
+        rows += play_archive.plays_between(month, version, athlete_id, start_ms, end_ms)
+    return rows
+
+
+def plays_overlapping(conn, athlete_id, start_ms, end_ms):
+    """The athlete's plays overlapping [start_ms, end_ms] in the order they started, archived ones included.
+
+    Rows are (name, artist, started_at, last_seen_at, duration, started_ms, last_seen_ms).
+    """
+    # Plays never span more than MAX_PLAY_SECONDS, so bounding started_ms
+    # keeps this an index range seek on idx_plays_athlete_started
+    from_ms = start_ms - MAX_PLAY_SECONDS * 1000
+    rows = conn.execute('''
+        SELECT name, artist, started_at, last_seen_at, duration, started_ms, last_seen_ms FROM plays
+        WHERE athlete_id = ? AND started_ms BETWEEN ? AND ? AND last_seen_ms >= ?
+        ORDER BY started_ms ASC
+    ''', (athlete_id, from_ms, end_ms, start_ms)).fetchall()
+    archived = [tuple(r[1:]) for r in archived_plays_between(conn, athlete_id, from_ms, end_ms) if r[7] >= start_ms]
+    if archived:
+        # A month being archived is briefly in both places
+        seen = {(r[0], r[1], r[5]) for r in rows}
+        rows += [r for r in archived if (r[0], r[1], r[5]) not in seen]
+        rows.sort(key=lambda r: r[5])
+    return rows
+
+
+@timed_query
+def get_songs_in_range(athlete_id, start_time, end_time):
+    """The athlete's plays overlapping the window, one entry per play in the order they started"""
+    rows = plays_overlapping(database.connection(), athlete_id, to_epoch_ms(start_time), to_epoch_ms(end_time))
+    return [{'name': r[0], 'artist': r[1], 'played_at': r[2], 'duration': r[4]} for r in rows]
+
+
+@timed_query
+def get_songs_page(athlete_id, limit, before=None):
+    """The athlete's raw samples, newest first.
+
+    `before` is a (played_at_ms, id) keyset cursor, like list_runs'. Samples
+    older than the retention period are pruned once folded into plays.
+    """
+    where = ''
+    params = [athlete_id]
+    if before is not None:
+        where = 'AND (played_at_ms < ? OR (played_at_ms = ? AND id < ?))'
+        params += [before[0], before[0], before[1]]
+    rows = database.connection().execute(f'''
+        SELECT id, name, artist, played_at, played_at_ms FROM spotify_songs
+        WHERE athlete_id = ? {where}
+        ORDER BY played_at_ms DESC, id DESC LIMIT ?
+    ''', (*params, limit)).fetchall()
+    return [{'id': r[0], 'name': r[1], 'artist': r[2], 'played_at': r[3], 'played_at_ms': r[4]} for r in rows]
+
+
+# ============ Users ============
+
+def new_api_token():
+    return secrets.token_urlsafe(32)
+
+
+def get_sole_athlete_id():
+    """The athlete id when exactly one user is connected, else None"""
+    rows = database.connection().execute('SELECT athlete_id FROM users LIMIT 2').fetchall()
+    return rows[0][0] if len(rows) == 1 else None
+
+
+def get_athlete_by_api_token(api_token):
+    row = database.connection().execute('SELECT athlete_id FROM users WHERE api_token=?', (api_token,)).fetchone()
+    return row[0] if row else None
+
+
+def get_api_token(athlete_id):
+    row = database.connection().execute('SELECT api_token FROM users WHERE athlete_id=?', (athlete_id,)).fetchone()
+    return row[0] if row else None
+
+
+def get_athlete_ids():
+    return [r[0] for r in database.connection().execute('SELECT athlete_id FROM users')]
+
+
+def get_user_tokens(athlete_id):
+    """(access_token, refresh_token, expires_at) for an athlete, or None"""
+    return database.connection().execute(
+        'SELECT access_token, refresh_token, expires_at FROM users WHERE athlete_id=?', (athlete_id,)
+    ).fetchone()
+
+
+def update_user_tokens(athlete_id, access_token, refresh_token, expires_at):
+    with database.transaction() as conn:
+        conn.execute('UPDATE users SET access_token=?, refresh_token=?, expires_at=? WHERE athlete_id=?',
+                     (access_token, refresh_token, expires_at, athlete_id))
+
+
+def save_user(athlete_id, access_token, refresh_token, expires_at):
+    """Store a user's Strava tokens; a new user also gets an API token for the tracker"""
+    with database.transaction() as conn:
+        conn.execute('''
+            INSERT INTO users (athlete_id, access_token, refresh_token, expires_at, api_token)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (athlete_id) DO UPDATE SET
+                access_token=excluded.access_token,
+                refresh_token=excluded.refresh_token,
+                expires_at=excluded.expires_at,
+                api_token=COALESCE(users.api_token, excluded.api_token)
+        ''', (athlete_id, access_token, refresh_token, expires_at, new_api_token()))
+        # Songs logged before anyone connected (see partition_by_athlete)
+        conn.execute('UPDATE spotify_songs SET athlete_id=? WHERE athlete_id IS NULL', (athlete_id,))
+        conn.execute('UPDATE plays SET athlete_id=? WHERE athlete_id IS NULL', (athlete_id,))
+        bump_cache_generation(conn, athlete_id)
+
+
+# ============ Activities ============
+
+def activity_window(activity):
+    """(start_ms, end_ms) of an activity from its start_date and elapsed_time"""
+    start_ms = to_epoch_ms(activity['start_date'])
+    return start_ms, start_ms + int(activity.get('elapsed_time') or 0) * 1000
+
+
+@timed_query
+def upsert_activities(athlete_id, activities):
+    """Store Strava activity summaries or details, replacing older copies.
+
+    Each new or changed activity also gets its run_songs rebuilt, so reads
+    never have to work out a run's soundtrack again.
+    """
+    now = time.time()
+    with database.transaction() as conn:
+        for a in activities:
+            start_ms, end_ms = activity_window(a)
+            previous = conn.execute('SELECT start_ms, end_ms FROM activities WHERE id=?', (a['id'],)).fetchone()
+            conn.execute('''
+                INSERT OR REPLACE INTO activities (id, athlete_id, type, start_date, start_ms, end_ms, data, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (a['id'], athlete_id, a.get('type'), a['start_date'], start_ms, end_ms, json.dumps(a), now))
+            if previous != (start_ms, end_ms):
+                materialize_run_songs(conn, athlete_id, a['id'], start_ms, end_ms)
+                # A cropped or re-uploaded activity has new streams too
+                conn.execute('DELETE FROM activity_streams WHERE activity_id=?', (a['id'],))
+        if activities:
+            bump_cache_generation(conn, athlete_id)
+
+
+def delete_activity(activity_id):
+    with database.transaction() as conn:
+        owner = conn.execute('SELECT athlete_id FROM activities WHERE id=?', (activity_id,)).fetchone()
+        if owner:
+            bump_cache_generation(conn, owner[0])
+        conn.execute('DELETE FROM activities WHERE id=?', (activity_id,))
+        conn.execute('DELETE FROM run_songs WHERE activity_id=?', (activity_id,))
+        conn.execute('DELETE FROM activity_streams WHERE activity_id=?', (activity_id,))
+        conn.execute('DELETE FROM processed_activities WHERE id=?', (activity_id,))
+
+
+# ============ Run soundtracks ============
+
+@timed_query
+def materialize_run_songs(conn, athlete_id, activity_id, start_ms, end_ms):
+    """Rebuild an activity's run_songs rows from its athlete's plays overlapping it.
+
+    Tracks are deduplicated by (name, artist), ordered by first play, and
+    carry the total seconds they were playing inside the run window.
+    """
+    tracks = {}
+    for name, artist, started_at, _, _, play_start, play_end in plays_overlapping(conn, athlete_id, start_ms, end_ms):
+        overlap = max(0, min(play_end, end_ms) - max(play_start, start_ms)) // 1000
+        track = tracks.get((name, artist))
+        if track is None:
+            tracks[(name, artist)] = [len(tracks), name, artist, started_at, overlap]
+        else:
+            track[4] += overlap
+
+    conn.execute('DELETE FROM run_songs WHERE activity_id=?', (activity_id,))
+    conn.executemany('''
+        INSERT INTO run_songs (activity_id, position, name, artist, first_played_at, seconds_in_run)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', [(activity_id, *track) for track in tracks.values()])
+
+
+def refresh_run_songs_between(conn, athlete_id, spans):
+    """Rebuild run_songs for the athlete's activities overlapping any [start_ms, end_ms] of changed plays.
+
+    A sample outside a run can still move the edges of a play that overlaps
+    it, so the spans are those of the plays, not of the samples. Overlapping
+    spans are merged first and each run is rebuilt once.
+    """
+    merged = []
+    for start_ms, end_ms in sorted(spans):
+        if merged and start_ms <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end_ms)
+        else:
+            merged.append([start_ms, end_ms])
+    runs = {}
+    for start_ms, end_ms in merged:
+        for activity_id, run_start, run_end in conn.execute('''
+            SELECT id, start_ms, end_ms FROM activities
+            WHERE athlete_id = ? AND start_ms BETWEEN ? AND ? AND end_ms >= ?
+        ''', (athlete_id, start_ms - MAX_RUN_SECONDS * 1000, end_ms, start_ms)):
+            runs[activity_id] = (run_start, run_end)
+    for activity_id, (run_start, run_end) in runs.items():
+        materialize_run_songs(conn, athlete_id, activity_id, run_start, run_end)
+
+
+def backfill_run_songs(conn):
+    """Fill end_ms and run_songs for activities stored before they existed"""
+    rows = conn.execute('SELECT id, athlete_id, data FROM activities').fetchall()
+    for activity_id, athlete_id, data in rows:
+        start_ms, end_ms = activity_window(json.loads(data))
+        conn.execute('UPDATE activities SET end_ms=? WHERE id=?', (end_ms, activity_id))
+        materialize_run_songs(conn, athlete_id, activity_id, start_ms, end_ms)
+
+
+@timed_query
+def get_run_songs(activity_id):
+    """A run's soundtrack in play order; duration is the seconds heard during the run"""
+    rows = database.connection().execute('''
+        SELECT name, artist, first_played_at, seconds_in_run FROM run_songs
+        WHERE activity_id=? ORDER BY position
+    ''', (activity_id,)).fetchall()
+    return [{'name': r[0], 'artist': r[1], 'played_at': r[2], 'duration': r[3]} for r in rows]
+
+
+@timed_query
+def get_songs_for_runs(activity_ids):
+    """Soundtracks for several runs in one query, as {activity_id: [song, ...]}"""
+    songs = {activity_id: [] for activity_id in activity_ids}
+    if not songs:
+        return songs
+    rows = database.connection().execute(f'''
+        SELECT activity_id, name, artist, first_played_at, seconds_in_run FROM run_songs
+        WHERE activity_id IN ({','.join('?' * len(songs))}) ORDER BY activity_id, position
+    ''', list(songs)).fetchall()
+    for r in rows:
+        songs[r[0]].append({'name': r[1], 'artist': r[2], 'played_at': r[3], 'duration': r[4]})
+    return songs
+
+
+@timed_query
+def top_tracks(athlete_id, limit=10):
+    """Tracks heard on the most of the athlete's runs"""
+    rows = database.connection().execute(f'''
+        SELECT rs.name, rs.artist, COUNT(*) AS runs, SUM(rs.seconds_in_run) AS seconds
+        FROM run_songs rs JOIN activities a ON a.id = rs.activity_id
+        WHERE a.athlete_id=? AND a.type IN ({','.join('?' * len(RUN_TYPES))})
+        GROUP BY rs.name, rs.artist
+        ORDER BY runs DESC, seconds DESC
+        LIMIT ?
+    ''', (athlete_id, *RUN_TYPES, limit)).fetchall()
+    return [{'name': r[0], 'artist': r[1], 'runs': r[2], 'seconds': r[3]} for r in rows]
+
+
+@timed_query
+def list_runs(athlete_id, limit, before=None):
+    """The athlete's runs, newest first.
+
+    `before` is a (start_ms, id) keyset cursor: only runs strictly older than
+    it are returned, so every page is an index range scan no matter how deep.
+    """
+    where = ''
+    params = [athlete_id, *RUN_TYPES]
+    if before is not None:
+        where = 'AND (start_ms < ? OR (start_ms = ? AND id < ?))'
+        params += [before[0], before[0], before[1]]
+    rows = database.connection().execute(f'''
+        SELECT data FROM activities
+        WHERE athlete_id=? AND type IN ({','.join('?' * len(RUN_TYPES))}) {where}
+        ORDER BY start_ms DESC, id DESC LIMIT ?
+    ''', (*params, limit)).fetchall()
+    return [json.loads(r[0]) for r in rows]
+
+
+def activities_last_modified(athlete_id):
+    """Unix time of the newest change to the athlete's stored activities, or None"""
+    return database.connection().execute(
+        'SELECT MAX(updated_at) FROM activities WHERE athlete_id=?', (athlete_id,)
+    ).fetchone()[0]
+
+
+def newest_activity_start(athlete_id):
+    """Start of the athlete's newest stored activity, in epoch seconds (0 if none)"""
+    newest = database.connection().execute(
+        'SELECT MAX(start_ms) FROM activities WHERE athlete_id=?', (athlete_id,)
+    ).fetchone()[0]
+    return newest // 1000 if newest else 0
+
+
+def get_activity_sync(athlete_id):
+    """(after_epoch, synced_at) cursor for the athlete's incremental backfill, or None"""
+    return database.connection().execute(
+        'SELECT after_epoch, synced_at FROM activity_sync WHERE athlete_id=?', (athlete_id,)
+    ).fetchone()
+
+
+def set_activity_sync(athlete_id, after_epoch):
+    with database.transaction() as conn:
+        conn.execute('INSERT OR REPLACE INTO activity_sync (athlete_id, after_epoch, synced_at) VALUES (?, ?, ?)',
+                     (athlete_id, after_epoch, time.time()))
+
+
+# ============ Activity streams ============
+
+def save_activity_streams(athlete_id, activity_id, streams):
+    """Store packed time/distance/heartrate streams, or None when Strava has none"""
+    streams = streams or {}
+    with database.transaction() as conn:
+        conn.execute('''
+            INSERT OR REPLACE INTO activity_streams (activity_id, athlete_id, time, distance, heartrate, fetched_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (activity_id, athlete_id, streams.get('time'), streams.get('distance'), streams.get('heartrate'),
+              time.time()))
+        bump_cache_generation(conn, athlete_id)
+
+
+def get_activity_streams(activity_ids):
+    """Cached streams as {activity_id: {'time': bytes, ...}}; activities never fetched are left out"""
+    if not activity_ids:
+        return {}
+    rows = database.connection().execute(f'''
+        SELECT activity_id, time, distance, heartrate FROM activity_streams
+        WHERE activity_id IN ({','.join('?' * len(activity_ids))})
+    ''', list(activity_ids)).fetchall()
+    return {r[0]: {'time': r[1], 'distance': r[2], 'heartrate': r[3]} for r in rows}
+
+
+@timed_query
+def get_run_plays(athlete_id, activity_id=None):
+    """Plays overlapping the athlete's runs (or one run), for joining against streams.
+
+    Rows are (activity_id, activity start_ms, name, artist, started_ms,
+    last_seen_ms), grouped by activity and in play order.
+    """
+    conn = database.connection()
+    where = 'AND a.id = ?' if activity_id is not None else ''
+    params = [athlete_id, *RUN_TYPES] + ([activity_id] if activity_id is not None else [])
+    rows = conn.execute(f'''
+        SELECT a.id, a.start_ms, p.name, p.artist, p.started_ms, p.last_seen_ms
+        FROM activities a JOIN plays p
+            ON p.athlete_id = a.athlete_id
+            AND p.started_ms BETWEEN a.start_ms - {MAX_PLAY_SECONDS * 1000} AND a.end_ms
+            AND p.last_seen_ms >= a.start_ms
+        WHERE a.athlete_id = ? AND a.type IN ({','.join('?' * len(RUN_TYPES))}) {where}
+        ORDER BY a.id, p.started_ms
+    ''', params).fetchall()
+
+    newest_archived = conn.execute('SELECT MAX(month) FROM archived_plays WHERE athlete_id=?',
+                                   (athlete_id,)).fetchone()[0]
+    if newest_archived is None:
+        return rows
+    # Runs that reach back into archived months get those plays from the archive
+    old_runs = conn.execute(f'''
+        SELECT a.id, a.start_ms, a.end_ms FROM activities a
+        WHERE a.athlete_id = ? AND a.type IN ({','.join('?' * len(RUN_TYPES))}) {where}
+            AND a.start_ms - {MAX_PLAY_SECONDS * 1000} < ?
+    ''', (*params, month_bounds(newest_archived)[1])).fetchall()
+    seen = {(r[0], r[2], r[3], r[4]) for r in rows}
+    for run_id, start_ms, end_ms in old_runs:
+        for p in archived_plays_between(conn, athlete_id, start_ms - MAX_PLAY_SECONDS * 1000, end_ms):
+            if p[7] >= start_ms and (run_id, p[1], p[2], p[6]) not in seen:
+                rows.append((run_id, start_ms, p[1], p[2], p[6], p[7]))
+    rows.sort(key=lambda r: (r[0], r[4]))
+    return rows
+
+
+# ============ Processed activities ============
+
+def mark_activity_processed(activity_id, description_hash=None):
+    """Record that an activity's description was written, and a hash of what was written"""
+    with database.transaction() as conn:
+        conn.execute('INSERT OR REPLACE INTO processed_activities (id, updated_at, description_hash) VALUES (?, ?, ?)',
+                     (activity_id, datetime.now(timezone.utc).isoformat(), description_hash))
+
+
+def get_description_hashes(activity_ids):
+    """{activity_id: hash of the description last written} for processed ones; None if written before hashing"""
+    if not activity_ids:
+        return {}
+    rows = database.connection().execute(f'''
+        SELECT id, description_hash FROM processed_activities WHERE id IN ({','.join('?' * len(activity_ids))})
+    ''', list(activity_ids)).fetchall()
+    return dict(rows)
+
+
+def is_activity_processed(activity_id):
+    row = database.connection().execute('SELECT id FROM processed_activities WHERE id=?', (activity_id,)).fetchone()
+    return row is not None
+
+
+# ============ Backfills ============
+
+def get_backfill(athlete_id):
+    """{'status', 'cursor', 'stats', 'updated_at'} of the athlete's last backfill, or None"""
+    row = database.connection().execute(
+        'SELECT status, cursor_start_ms, cursor_id, stats, updated_at FROM backfills WHERE athlete_id=?',
+        (athlete_id,)
+    ).fetchone()
+    if not row:
+        return None
+    cursor = (row[1], row[2]) if row[1] is not None else None
+    return {'status': row[0], 'cursor': cursor, 'stats': json.loads(row[3]), 'updated_at': row[4]}
+
+
+def save_backfill(athlete_id, status, cursor, stats):
+    """Checkpoint a backfill; `cursor` is the list_runs keyset just past the last finished page"""
+    with database.transaction() as conn:
+        conn.execute('''
+            INSERT OR REPLACE INTO backfills (athlete_id, status, cursor_start_ms, cursor_id, stats, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (athlete_id, status, cursor[0] if cursor else None, cursor[1] if cursor else None,
+              json.dumps(stats), time.time()))
+
+
+# ============ Retention ============
+
+def prune_song_samples(athlete_id, before_ms, chunk_size=5000):
+    """Delete the athlete's raw samples logged before before_ms; returns how many.
+
+    Every sample is folded into plays as it is logged, so old raw rows only
+    served to recognise samples sent twice. Deleted in chunks so song
+    logging never waits long on the write lock.
+    """
+    deleted = 0
+    while True:
+        with database.transaction() as conn:
+            count = conn.execute('''
+                DELETE FROM spotify_songs WHERE id IN (
+                    SELECT id FROM spotify_songs WHERE athlete_id = ? AND played_at_ms < ? LIMIT ?
+                )
+            ''', (athlete_id, before_ms, chunk_size)).rowcount
+        deleted += count
+        if count < chunk_size:
+            return deleted
+
+
+def archive_plays_before(horizon_ms):
+    """Move every athlete's plays that started before horizon_ms into the month archive.
+
+    horizon_ms should be a month boundary. Each month is moved under the
+    write lock: its file is rewritten with the plays already archived plus
+    the hot ones, then the index is updated and the hot rows deleted.
+    Returns {'months', 'plays', 'bytes'} for what was moved.
+    """
+    conn = database.connection()
+    athletes = get_athlete_ids()
+    months = set()
+    for athlete_id in athletes:
+        oldest = conn.execute('SELECT MIN(started_ms) FROM plays WHERE athlete_id=?', (athlete_id,)).fetchone()[0]
+        if oldest is not None and oldest < horizon_ms:
+            months.update(months_between(oldest, horizon_ms - 1))
+
+    stats = {'months': 0, 'plays': 0, 'bytes': 0}
+    for month in sorted(months):
+        start_ms, end_ms = month_bounds(month)
+        with database.transaction(immediate=True) as tx:
+            hot = []
+            for athlete_id in athletes:
+                hot += tx.execute('''
+                    SELECT id, athlete_id, name, artist, started_at, last_seen_at, duration, started_ms, last_seen_ms
+                    FROM plays WHERE athlete_id = ? AND started_ms >= ? AND started_ms < ?
+                ''', (athlete_id, start_ms, end_ms)).fetchall()
+            if not hot:
+                continue
+            rows = play_archive.read_rows(month)
+            # Left over from a move that failed after writing the file
+            archived = {(r[0], r[1], r[2], r[6]) for r in rows}
+            rows += [list(r[1:]) for r in hot if (r[1], r[2], r[3], r[7]) not in archived]
+            size = play_archive.write_month(month, rows)
+
+            tx.execute('''
+                INSERT INTO archive_months (month, plays, bytes, version, archived_at) VALUES (?, ?, ?, 1, ?)
+                ON CONFLICT (month) DO UPDATE SET
+                    plays = excluded.plays, bytes = excluded.bytes, version = version + 1,
+                    archived_at = excluded.archived_at
+            ''', (month, len(rows), size, time.time()))
+            tx.executemany('INSERT OR REPLACE INTO archived_plays (athlete_id, month, plays) VALUES (?, ?, ?)',
+                           [(athlete_id, month, count) for athlete_id, count in Counter(r[0] for r in rows).items()])
+            tx.executemany('DELETE FROM plays WHERE id=?', [(r[0],) for r in hot])
+        stats['months'] += 1
+        stats['plays'] += len(hot)
+        stats['bytes'] += size
+    return stats
+
+
+def optimize_storage(vacuum_pages=2000):
+    """Hand up to vacuum_pages free pages back to the filesystem and refresh planner statistics.
+
+    Databases created before auto_vacuum was enabled get one full VACUUM
+    the first time, after which each call only does a bounded amount of work.
+    """
+    conn = database.connection()
+    converted = False
+    if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+        conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        conn.execute('VACUUM')
+        converted = True
+    free_before = conn.execute('PRAGMA freelist_count').fetchone()[0]
+    # executescript steps the pragma to completion; execute() frees a single page
+    conn.executescript(f'PRAGMA incremental_vacuum({int(vacuum_pages)});')
+    # ANALYZE samples at most this many index rows per index
+    conn.execute('PRAGMA analysis_limit=1000')
+    conn.execute('ANALYZE')
+    conn.commit()
+    # Bulk deletes leave a large WAL behind
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchall()
+    free_after = conn.execute('PRAGMA freelist_count').fetchone()[0]
+    return {
+        'converted_to_incremental': converted,
+        'freed_pages': free_before - free_after,
+        'free_pages': free_after,
+        'page_count': conn.execute('PRAGMA page_count').fetchone()[0]
+    }
+
+
+def claim_maintenance(name, interval):
+    """Start job `name` unless a worker started it less than `interval` seconds ago; True if claimed"""
+    now = time.time()
+    with database.transaction(immediate=True) as conn:
+        row = conn.execute('SELECT started_at FROM maintenance_runs WHERE name=?', (name,)).fetchone()
+        if row and now - row[0] < interval:
+            return False
+        conn.execute('''
+            INSERT INTO maintenance_runs (name, started_at) VALUES (?, ?)
+            ON CONFLICT (name) DO UPDATE SET started_at = excluded.started_at
+        ''', (name, now))
+    return True
+
+
+def finish_maintenance(name, stats):
+    with database.transaction() as conn:
+        conn.execute('UPDATE maintenance_runs SET finished_at=?, stats=? WHERE name=?',
+                     (time.time(), json.dumps(stats), name))
+
+
+def get_maintenance(name):
+    """{'started_at', 'finished_at', 'stats'} of the job's last run, or None"""
+    row = database.connection().execute(
+        'SELECT started_at, finished_at, stats FROM maintenance_runs WHERE name=?', (name,)
+    ).fetchone()
+    if not row:
+        return None
+    return {'started_at': row[0], 'finished_at': row[1], 'stats': json.loads(row[2]) if row[2] else None}
+
+
+def storage_stats():
+    """Sizes of the hot tables, the archive and the database file, for the debug endpoint"""
+    conn = database.connection()
+    archive = conn.execute('''
+        SELECT COUNT(*), COALESCE(SUM(plays), 0), COALESCE(SUM(bytes), 0), MIN(month), MAX(month) FROM archive_months
+    ''').fetchone()
+    return {
+        'song_samples': conn.execute('SELECT COUNT(*) FROM spotify_songs').fetchone()[0],
+        'plays': conn.execute('SELECT COUNT(*) FROM plays').fetchone()[0],
+        'processed_activities': conn.execute('SELECT COUNT(*) FROM processed_activities').fetchone()[0],
+        'page_size': conn.execute('PRAGMA page_size').fetchone()[0],
+        'page_count': conn.execute('PRAGMA page_count').fetchone()[0],
+        'free_pages': conn.execute('PRAGMA freelist_count').fetchone()[0],
+        'archive': {'months': archive[0], 'plays': archive[1], 'bytes': archive[2],
+                    'oldest': archive[3], 'newest': archive[4], **play_archive.snapshot()}
+    }
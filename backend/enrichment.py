@@ -0,0 +1,74 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class SpotifyLookupError(Exception):
+    """A Spotify search failed for a reason other than 'no match'"""
+
+
+class SpotifyRateLimited(SpotifyLookupError):
+    """Spotify answered 429; retry_after is the wait it asked for, in seconds"""
+
+    def __init__(self, retry_after):
+        super().__init__(f'Rate limited by Spotify, retry after {retry_after}s')
+        self.retry_after = retry_after
+
+
+class RateLimitGate:
+    """Pause shared by every lookup worker.
+
+    When one worker gets a 429 all of them hold off until Retry-After has
+    passed, instead of each hammering Spotify and collecting its own 429.
+    """
+
+    def __init__(self):
+        self._resume_at = 0
+        self._lock = threading.Lock()
+
+    def pause(self, seconds):
+        with self._lock:
+            self._resume_at = max(self._resume_at, time.monotonic() + seconds)
+
+    def wait(self):
+        delay = self._resume_at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+
+spotify_gate = RateLimitGate()
+
+
+def lookup_concurrently(pending, lookup, max_workers=8, max_retries=3, max_retry_after=30,
+                        gate=spotify_gate):
+    """Call lookup(item) for every value of `pending` on a bounded thread pool.
+
+    `pending` maps a dedup key to the item to look up. Returns a dict of
+    key -> result for the lookups that succeeded; keys whose lookup kept
+    failing are left out so callers can tell them apart from a None result.
+    """
+    def run(item):
+        for attempt in range(max_retries + 1):
+            gate.wait()
+            try:
+                return True, lookup(item)
+            except SpotifyRateLimited as e:
+                if attempt == max_retries or e.retry_after > max_retry_after:
+                    return False, None
+                gate.pause(e.retry_after)
+            except SpotifyLookupError:
+                return False, None
+        return False, None
+
+    if not pending:
+        return {}
+
+    results = {}
+    workers = max(1, min(max_workers, len(pending)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {key: pool.submit(run, item) for key, item in pending.items()}
+        for key, future in futures.items():
+            ok, value = future.result()
+            if ok:
+                results[key] = value
+    return results
@@ -0,0 +1,106 @@
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from metrics import REGISTRY
+
+# (connect, read) timeouts in seconds applied to every upstream call
+DEFAULT_TIMEOUT = (3.05, 10)
+# Methods that are safe to retry; token POSTs rotate state and are never retried
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS'])
+
+UPSTREAM_SECONDS = REGISTRY.histogram('upstream_request_seconds', 'Outbound HTTP call latency, retries included',
+                                      ['endpoint', 'status'])
+
+
+class HttpClient:
+    """Shared client for all Strava and Spotify calls.
+
+    Keeps one keep-alive Session (and connection pool) per host, applies
+    default timeouts, retries idempotent requests on connection errors and
+    5xx with exponential backoff, and records latency per endpoint label.
+    429s are not retried here; callers decide how to honour Retry-After.
+    """
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, retries=2, backoff_factor=0.3, pool_maxsize=16):
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.pool_maxsize = pool_maxsize
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self.metrics = {}
+
+    def _session(self, url):
+        host = urlsplit(url).netloc
+        session = self._sessions.get(host)
+        if session is None:
+            with self._lock:
+                session = self._sessions.get(host)
+                if session is None:
+                    retry = Retry(
+                        total=self.retries,
+                        backoff_factor=self.backoff_factor,
+                        status_forcelist=(500, 502, 503, 504),
+                        allowed_methods=IDEMPOTENT_METHODS,
+                        raise_on_status=False
+                    )
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_maxsize, max_retries=retry)
+                    session = requests.Session()
+                    session.mount('http://', adapter)
+                    session.mount('https://', adapter)
+                    self._sessions[host] = session
+        return session
+
+    def _record(self, endpoint, elapsed_ms, status):
+        UPSTREAM_SECONDS.observe(elapsed_ms / 1000, endpoint=endpoint, status=status or 'error')
+        with self._lock:
+            m = self.metrics.setdefault(endpoint, {'count': 0, 'errors': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+            m['count'] += 1
+            m['total_ms'] += elapsed_ms
+            m['max_ms'] = max(m['max_ms'], elapsed_ms)
+            if status is None or status >= 500:
+                m['errors'] += 1
+
+    def request(self, method, url, endpoint=None, **kwargs):
+        """Send a request through the pooled session for url's host.
+
+        `endpoint` is a short label such as 'strava.activity.get' used to
+        group latency metrics; it defaults to the method and host.
+        """
+        endpoint = endpoint or f'{method.upper()} {urlsplit(url).netloc}'
+        kwargs.setdefault('timeout', self.timeout)
+        start = time.perf_counter()
+        status = None
+        try:
+            response = self._session(url).request(method, url, **kwargs)
+            status = response.status_code
+            return response
+        finally:
+            self._record(endpoint, (time.perf_counter() - start) * 1000, status)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request('PUT', url, **kwargs)
+
+    def snapshot(self):
+        """Per-endpoint count, error count, mean and max latency in ms"""
+        with self._lock:
+            return {
+                endpoint: {
+                    'count': m['count'],
+                    'errors': m['errors'],
+                    'avg_ms': round(m['total_ms'] / m['count'], 2) if m['count'] else 0,
+                    'max_ms': round(m['max_ms'], 2)
+                }
+                for endpoint, m in self.metrics.items()
+            }
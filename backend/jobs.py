@@ -0,0 +1,202 @@
+import threading
+import time
+import traceback
+
+from metrics import REGISTRY
+
+# Enqueue-to-first-attempt lag can reach minutes when workers fall behind
+LAG_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60, 120, 300, 600)
+
+JOB_LAG_SECONDS = REGISTRY.histogram('webhook_job_lag_seconds', 'Time from enqueue to the first processing attempt',
+                                     buckets=LAG_BUCKETS)
+JOB_SECONDS = REGISTRY.histogram('webhook_job_seconds', 'Webhook job handler duration by outcome', ['outcome'])
+
+
+class PermanentJobError(Exception):
+    """Raised by a job handler when retrying cannot help; the job goes straight to 'dead'"""
+
+
+class RetryLaterError(Exception):
+    """Raised by a job handler when an upstream asked it to wait, e.g. a rate limit; retried after retry_after seconds"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class JobQueue:
+    """Durable SQLite-backed queue for Strava webhook events.
+
+    Jobs are unique on (activity_id, aspect_type). An event for a pending
+    job is ignored, since that run will see the latest activity anyway. One
+    for a running job flags it to run once more when it finishes, because
+    the running handler may already have read the activity. One for a
+    finished job (another edit of the same activity) runs it again. Failed
+    jobs are retried with exponential backoff, or after the delay a
+    RetryLaterError asks for, and end up in the 'dead' state after
+    max_attempts; the defaults keep a job alive for about an hour of
+    upstream outage.
+    Jobs left 'running' by a crashed worker are picked up again once their
+    lease expires.
+    """
+
+    def __init__(self, db, max_attempts=10, base_delay=5, max_delay=900, lease_seconds=300,
+                 poll_interval=1.0):
+        self.db = db
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._workers = []
+        self._init_table()
+
+    def _init_table(self):
+        with self.db.transaction() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS webhook_jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    activity_id INTEGER NOT NULL,
+                    athlete_id INTEGER,
+                    aspect_type TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_run_at REAL NOT NULL,
+                    last_error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    rerun INTEGER NOT NULL DEFAULT 0,
+                    UNIQUE (activity_id, aspect_type)
+                )
+            ''')
+            # Set when an event arrives while the job is running
+            if 'rerun' not in [r[1] for r in conn.execute('PRAGMA table_info(webhook_jobs)')]:
+                conn.execute('ALTER TABLE webhook_jobs ADD COLUMN rerun INTEGER NOT NULL DEFAULT 0')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_webhook_jobs_status_next ON webhook_jobs (status, next_run_at)')
+
+    def enqueue(self, activity_id, athlete_id, aspect_type):
+        """Record an event; returns False if the same (activity, aspect) is already pending"""
+        now = time.time()
+        with self.db.transaction(immediate=True) as conn:
+            cur = conn.execute('''
+                INSERT INTO webhook_jobs
+                    (activity_id, athlete_id, aspect_type, next_run_at, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (activity_id, aspect_type) DO UPDATE SET
+                    athlete_id = excluded.athlete_id, status = 'pending', attempts = 0, last_error = NULL,
+                    next_run_at = excluded.next_run_at, created_at = excluded.created_at,
+                    updated_at = excluded.updated_at
+                WHERE status IN ('done', 'dead')
+            ''', (activity_id, athlete_id, aspect_type, now, now, now))
+            if cur.rowcount == 0:
+                cur = conn.execute('''
+                    UPDATE webhook_jobs SET rerun = 1
+                    WHERE activity_id = ? AND aspect_type = ? AND status = 'running'
+                ''', (activity_id, aspect_type))
+        self._wakeup.set()
+        return cur.rowcount == 1
+
+    def claim(self):
+        """Atomically move the next due job to 'running' and return it, or None"""
+        now = time.time()
+        with self.db.transaction(immediate=True) as conn:
+            row = conn.execute('''
+                SELECT id, activity_id, athlete_id, aspect_type, attempts, created_at FROM webhook_jobs
+                WHERE (status = 'pending' AND next_run_at <= ?)
+                   OR (status = 'running' AND updated_at <= ?)
+                ORDER BY next_run_at ASC LIMIT 1
+            ''', (now, now - self.lease_seconds)).fetchone()
+            if row:
+                conn.execute("UPDATE webhook_jobs SET status='running', attempts=attempts+1, updated_at=? WHERE id=?",
+                             (now, row[0]))
+        if not row:
+            return None
+        return {'id': row[0], 'activity_id': row[1], 'athlete_id': row[2], 'aspect_type': row[3],
+                'attempts': row[4] + 1, 'created_at': row[5]}
+
+    def complete(self, job):
+        self._set(job['id'], 'done', None, time.time())
+
+    def fail(self, job, error, permanent=False, retry_after=None):
+        """Schedule a retry with exponential backoff (or after retry_after seconds), or dead-letter the job"""
+        if permanent or job['attempts'] >= self.max_attempts:
+            self._set(job['id'], 'dead', error, time.time())
+        else:
+            delay = min(self.max_delay, self.base_delay * 2 ** (job['attempts'] - 1))
+            if retry_after is not None:
+                delay = max(delay, retry_after)
+            self._set(job['id'], 'pending', error, time.time() + delay)
+
+    def _set(self, job_id, status, error, next_run_at):
+        """Record a job's outcome; one flagged for a rerun goes back to 'pending' with fresh attempts instead"""
+        with self.db.transaction() as conn:
+            conn.execute('''
+                UPDATE webhook_jobs SET
+                    status = CASE WHEN rerun THEN 'pending' ELSE ? END,
+                    attempts = CASE WHEN rerun THEN 0 ELSE attempts END,
+                    rerun = 0, last_error = ?, next_run_at = ?, updated_at = ?
+                WHERE id = ?
+            ''', (status, error, next_run_at, time.time(), job_id))
+
+    def stats(self):
+        """Job counts per status and the age of the oldest due job, in seconds"""
+        now = time.time()
+        conn = self.db.connection()
+        counts = dict(conn.execute('SELECT status, COUNT(*) FROM webhook_jobs GROUP BY status').fetchall())
+        oldest = conn.execute("SELECT MIN(created_at) FROM webhook_jobs WHERE status = 'pending' AND next_run_at <= ?",
+                              (now,)).fetchone()[0]
+        return {
+            'pending': counts.get('pending', 0),
+            'running': counts.get('running', 0),
+            'done': counts.get('done', 0),
+            'dead': counts.get('dead', 0),
+            'oldest_pending_age': round(now - oldest, 3) if oldest else 0
+        }
+
+    def run_once(self, handler):
+        """Claim and process a single job; returns False when nothing was due"""
+        job = self.claim()
+        if not job:
+            return False
+        if job['attempts'] == 1:
+            JOB_LAG_SECONDS.observe(time.time() - job['created_at'])
+        start = time.perf_counter()
+        try:
+            handler(job)
+        except PermanentJobError as e:
+            outcome = 'dead'
+            self.fail(job, str(e), permanent=True)
+        except RetryLaterError as e:
+            outcome = 'failed'
+            self.fail(job, str(e), retry_after=e.retry_after)
+        except Exception as e:
+            outcome = 'failed'
+            traceback.print_exc()
+            self.fail(job, str(e) or e.__class__.__name__)
+        else:
+            outcome = 'done'
+            self.complete(job)
+        JOB_SECONDS.observe(time.perf_counter() - start, outcome=outcome)
+        return True
+
+    def _work(self, handler):
+        while not self._stop.is_set():
+            if not self.run_once(handler):
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+
+    def start_workers(self, handler, count):
+        """Start `count` daemon threads that process jobs with `handler`"""
+        for i in range(count):
+            worker = threading.Thread(target=self._work, args=(handler,), name=f'webhook-worker-{i}', daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+        for worker in self._workers:
+            worker.join()
+        self._workers = []
@@ -0,0 +1,85 @@
+"""Scheduled retention for the song history.
+
+Each run:
+
+- prunes raw samples older than sample_retention_days; they were folded
+  into plays when they were logged
+- moves whole months of plays older than archive_after_days into the
+  compressed month archive (archive.py), where run-window lookups still
+  find them
+- hands a bounded number of free pages back with incremental VACUUM,
+  refreshes planner statistics with a sampled ANALYZE and truncates
+  the WAL
+
+Every gunicorn worker runs the scheduler, but a run is claimed through
+the maintenance_runs table, so at most one worker does the work per
+interval.
+"""
+import threading
+import time
+
+from archive import month_bounds, month_of
+from db import (archive_plays_before, claim_maintenance, finish_maintenance, get_athlete_ids, get_maintenance,
+                optimize_storage, prune_song_samples)
+
+DAY_MS = 24 * 3600 * 1000
+JOB_NAME = 'retention'
+
+
+class Maintenance:
+    def __init__(self, interval=6 * 3600, sample_retention_days=30, archive_after_days=180, vacuum_pages=2000):
+        self.interval = interval
+        self.sample_retention_days = sample_retention_days
+        self.archive_after_days = archive_after_days
+        self.vacuum_pages = vacuum_pages
+        self._stop = threading.Event()
+        self._scheduler = None
+        # One run at a time within this process, including forced ones
+        self._running = threading.Lock()
+
+    def run_once(self, force=False, now=None):
+        """Run every step unless a worker already did within the interval; returns the stats or None.
+
+        `now` (epoch seconds) moves the retention cutoffs, for benchmarks.
+        """
+        with self._running:
+            if not claim_maintenance(JOB_NAME, 0 if force else self.interval):
+                return None
+            started = time.time()
+            now_ms = int((now or started) * 1000)
+
+            samples_before = now_ms - self.sample_retention_days * DAY_MS
+            # Only whole months are archived
+            horizon_ms = month_bounds(month_of(now_ms - self.archive_after_days * DAY_MS))[0]
+            stats = {
+                'samples_pruned': sum(prune_song_samples(athlete_id, samples_before)
+                                      for athlete_id in get_athlete_ids()),
+                'archived': archive_plays_before(horizon_ms),
+                'storage': optimize_storage(self.vacuum_pages)
+            }
+            stats['seconds'] = round(time.time() - started, 3)
+            finish_maintenance(JOB_NAME, stats)
+            print(f"Maintenance finished: {stats}")
+            return stats
+
+    def last_run(self):
+        return get_maintenance(JOB_NAME)
+
+    def _schedule(self, check_interval):
+        while not self._stop.wait(check_interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Maintenance scheduler error: {e}")
+
+    def start_scheduler(self, check_interval=300):
+        """Start a daemon thread that tries run_once every `check_interval` seconds"""
+        self._scheduler = threading.Thread(target=self._schedule, args=(check_interval,),
+                                           name='maintenance', daemon=True)
+        self._scheduler.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._scheduler:
+            self._scheduler.join()
+            self._scheduler = None
@@ -0,0 +1,168 @@
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class CachedResponse:
+    """A rendered 200 response body and the validators sent with it"""
+
+    __slots__ = ('generation', 'body', 'mimetype', 'etag', 'weak', 'last_modified')
+
+    def __init__(self, generation, body, mimetype, etag, weak, last_modified):
+        self.generation = generation
+        self.body = body
+        self.mimetype = mimetype
+        self.etag = etag
+        self.weak = weak
+        self.last_modified = last_modified
+
+
+class ResponseCache:
+    """Rendered read-API responses per (athlete, request path), without a TTL.
+
+    Every entry is stamped with the athlete's cache generation, a counter
+    in the main database that each write touching their songs, runs or
+    account bumps (db.bump_cache_generation). An entry is only served while
+    its stamp matches the current generation, so a webhook or a logged song
+    invalidates the athlete's responses in every worker at once.
+
+    Lookups go to an in-process LRU first, then, when `path` is set, to a
+    SQLite file shared by the gunicorn workers on the same machine, so a
+    response rendered by one worker is reused by the others. The LRU is
+    bounded by entry count and by the total bytes of the bodies it holds.
+    """
+
+    def __init__(self, path=None, max_entries=1024, max_bytes=32 * 1024 * 1024, max_entry_bytes=512 * 1024,
+                 max_shared_entries=20000):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.max_shared_entries = max_shared_entries
+        self._lru = OrderedDict()
+        # Total body bytes held by _lru
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._puts = 0
+        self.stats = {'memory_hits': 0, 'shared_hits': 0, 'misses': 0, 'stores': 0, 'stale': 0}
+        if path:
+            self._init_store()
+
+    def _store(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')
+        return conn
+
+    def _init_store(self):
+        self._store().execute('''
+            CREATE TABLE IF NOT EXISTS responses (
+                athlete_id INTEGER NOT NULL,
+                cache_key TEXT NOT NULL,
+                generation INTEGER NOT NULL,
+                body BLOB NOT NULL,
+                mimetype TEXT NOT NULL,
+                etag TEXT,
+                weak INTEGER NOT NULL,
+                last_modified REAL,
+                stored_at REAL NOT NULL,
+                PRIMARY KEY (athlete_id, cache_key)
+            )
+        ''')
+
+    def _count(self, stat):
+        with self._lock:
+            self.stats[stat] += 1
+
+    def _forget(self, key):
+        self._bytes -= len(self._lru.pop(key).body)
+
+    def _remember(self, key, entry):
+        if key in self._lru:
+            self._forget(key)
+        self._lru[key] = entry
+        self._bytes += len(entry.body)
+        while len(self._lru) > self.max_entries or self._bytes > self.max_bytes:
+            self._forget(next(iter(self._lru)))
+
+    def get(self, athlete_id, cache_key, generation):
+        """The cached response for this generation, or None"""
+        key = (athlete_id, cache_key)
+        with self._lock:
+            entry = self._lru.get(key)
+            if entry is not None:
+                if entry.generation == generation:
+                    self._lru.move_to_end(key)
+                    self.stats['memory_hits'] += 1
+                    return entry
+                self._forget(key)
+                self.stats['stale'] += 1
+
+        if self.path:
+            try:
+                row = self._store().execute('''
+                    SELECT body, mimetype, etag, weak, last_modified FROM responses
+                    WHERE athlete_id=? AND cache_key=? AND generation=?
+                ''', (athlete_id, cache_key, generation)).fetchone()
+            except sqlite3.Error as e:
+                print(f"Response cache read failed: {e}")
+                row = None
+            if row:
+                entry = CachedResponse(generation, row[0], row[1], row[2], bool(row[3]), row[4])
+                with self._lock:
+                    self._remember(key, entry)
+                    self.stats['shared_hits'] += 1
+                return entry
+
+        self._count('misses')
+        return None
+
+    def put(self, athlete_id, cache_key, entry):
+        """Store a response; bodies over max_entry_bytes are not cached"""
+        if len(entry.body) > self.max_entry_bytes:
+            return
+        with self._lock:
+            self._remember((athlete_id, cache_key), entry)
+            self.stats['stores'] += 1
+            self._puts += 1
+            prune = self._puts % 100 == 0
+
+        if self.path:
+            try:
+                conn = self._store()
+                conn.execute('''
+                    INSERT OR REPLACE INTO responses
+                        (athlete_id, cache_key, generation, body, mimetype, etag, weak, last_modified, stored_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (athlete_id, cache_key, entry.generation, entry.body, entry.mimetype, entry.etag,
+                      int(entry.weak), entry.last_modified, time.time()))
+                # Entries of older generations can never be served again
+                conn.execute('DELETE FROM responses WHERE athlete_id=? AND generation < ?',
+                             (athlete_id, entry.generation))
+                if prune:
+                    conn.execute('''
+                        DELETE FROM responses WHERE rowid IN (
+                            SELECT rowid FROM responses ORDER BY stored_at DESC LIMIT -1 OFFSET ?
+                        )
+                    ''', (self.max_shared_entries,))
+            except sqlite3.Error as e:
+                print(f"Response cache write failed: {e}")
+
+    def snapshot(self):
+        """Counters plus the current LRU size in entries and bytes, for the debug endpoint"""
+        with self._lock:
+            lookups = self.stats['memory_hits'] + self.stats['shared_hits'] + self.stats['misses']
+            hits = self.stats['memory_hits'] + self.stats['shared_hits']
+            return {
+                **self.stats,
+                'lru_size': len(self._lru),
+                'lru_max_entries': self.max_entries,
+                'lru_bytes': self._bytes,
+                'lru_max_bytes': self.max_bytes,
+                'shared_store': self.path,
+                'hit_rate': round(hits / lookups, 4) if lookups else None
+            }
@@ -0,0 +1,120 @@
+"""Per-song distance, pace and heart rate from Strava activity streams.
+
+Streams (seconds since the start, cumulative metres, bpm) are fetched once
+per activity and stored packed as float32 arrays. Song play intervals are
+joined against them with sorted-array lookups: np.searchsorted finds each
+interval's first and last sample, cumulative sums give the heart-rate
+totals in between, and np.interp the distance at both ends. A multi-hour
+1 Hz stream costs a few passes over its arrays instead of a Python loop
+per sample.
+"""
+import numpy as np
+
+STREAM_KEYS = ('time', 'distance', 'heartrate')
+# Tracks heard for less than this in total are left out of fastest_songs
+MIN_FASTEST_SECONDS = 60
+# Splits covering less distance than this get no pace (standing at a light)
+MIN_PACE_METRES = 10
+
+
+def pack_streams(data):
+    """Strava's key_by_type streams response as {key: float32 bytes}, or None without time/distance"""
+    if not data or 'time' not in data or 'distance' not in data:
+        return None
+    return {key: np.asarray(data[key]['data'], dtype=np.float32).tobytes()
+            for key in STREAM_KEYS if key in data}
+
+
+def unpack_streams(packed):
+    """(time, distance, heartrate) arrays from stored streams; heartrate is None without a monitor"""
+    if not packed or packed.get('time') is None:
+        return None
+    heartrate = packed.get('heartrate')
+    return (np.frombuffer(packed['time'], dtype=np.float32).astype(np.float64),
+            np.frombuffer(packed['distance'], dtype=np.float32).astype(np.float64),
+            np.frombuffer(heartrate, dtype=np.float32).astype(np.float64) if heartrate else None)
+
+
+def interval_sums(time_s, distance_m, heartrate, starts, ends):
+    """Seconds, metres, heart-rate sum and sample count for each [start, end] interval.
+
+    starts/ends are seconds since the activity start and are clipped to
+    the stream, so plays that began before the run only count their part
+    inside it.
+    """
+    starts = np.clip(starts, time_s[0], time_s[-1])
+    ends = np.clip(ends, starts, time_s[-1])
+    seconds = ends - starts
+    metres = np.interp(ends, time_s, distance_m) - np.interp(starts, time_s, distance_m)
+
+    if heartrate is None:
+        zeros = np.zeros(len(starts))
+        return seconds, metres, zeros, zeros
+    lo = np.searchsorted(time_s, starts, side='left')
+    hi = np.searchsorted(time_s, ends, side='right')
+    valid = ~np.isnan(heartrate)
+    hr_total = np.concatenate(([0.0], np.cumsum(np.where(valid, heartrate, 0.0))))
+    hr_count = np.concatenate(([0], np.cumsum(valid)))
+    return seconds, metres, hr_total[hi] - hr_total[lo], hr_count[hi] - hr_count[lo]
+
+
+def _split(name, artist, seconds, metres, hr_sum, hr_count):
+    return {
+        'name': name,
+        'artist': artist,
+        'seconds': int(round(seconds)),
+        'distance': round(float(metres), 1),
+        # Seconds per kilometre
+        'pace': round(float(seconds) / (metres / 1000), 1) if metres >= MIN_PACE_METRES else None,
+        'average_heartrate': round(float(hr_sum / hr_count), 1) if hr_count else None
+    }
+
+
+class SplitAccumulator:
+    """Sums play intervals per track, across one run or many"""
+
+    def __init__(self):
+        self.tracks = {}
+        self.codes = []
+        self.columns = []
+
+    def add_run(self, streams, run_start_ms, plays):
+        """plays: (name, artist, started_ms, last_seen_ms) tuples overlapping the run"""
+        if not plays:
+            return
+        codes = [self.tracks.setdefault((p[0], p[1]), len(self.tracks)) for p in plays]
+        bounds = np.array([(p[2], p[3]) for p in plays], dtype=np.float64)
+        bounds = (bounds - run_start_ms) / 1000
+        self.codes.append(np.array(codes))
+        self.columns.append(np.vstack(interval_sums(*streams, bounds[:, 0], bounds[:, 1])))
+
+    def totals(self):
+        """[(name, artist, seconds, metres, hr_sum, hr_count)] per track, in first-heard order"""
+        if not self.tracks:
+            return []
+        codes = np.concatenate(self.codes)
+        columns = np.hstack(self.columns)
+        sums = [np.bincount(codes, weights=column, minlength=len(self.tracks)) for column in columns]
+        return [(name, artist, *(s[code] for s in sums)) for (name, artist), code in self.tracks.items()]
+
+
+def song_splits(streams, run_start_ms, plays):
+    """Distance, pace and average heart rate of each track heard on one run"""
+    acc = SplitAccumulator()
+    acc.add_run(streams, run_start_ms, plays)
+    return [_split(*track) for track in acc.totals()]
+
+
+def fastest_songs(runs, limit=10, min_seconds=MIN_FASTEST_SECONDS):
+    """Tracks with the quickest pace over every run they were heard on.
+
+    runs: (streams, run_start_ms, plays) per run. Each track's pace is its
+    total time over its total distance across all of them.
+    """
+    acc = SplitAccumulator()
+    for streams, run_start_ms, plays in runs:
+        acc.add_run(streams, run_start_ms, plays)
+    splits = [_split(*track) for track in acc.totals() if track[2] >= min_seconds]
+    splits = [s for s in splits if s['pace'] is not None]
+    splits.sort(key=lambda s: s['pace'])
+    return splits[:limit]
@@ -6,6 +6,8 @@ from datetime import datetime, timezone
 from dotenv import load_dotenv
 import spotipy
 from spotipy.oauth2 import SpotifyOAuth
+from tracker_journal import TrackJournal, upload_pending
+from tracker_schedule import POLL_SECONDS, PollSchedule, missed_polls, track_start_sample
 
 # Load environment variables
 load_dotenv()
@@ -14,49 +16,123 @@ SPOTIFY_CLIENT_ID = os.getenv("SPOTIFY_CLIENT_ID")
 SPOTIFY_CLIENT_SECRET = os.getenv("SPOTIFY_CLIENT_SECRET")
 SPOTIFY_REDIRECT_URI = os.getenv("SPOTIFY_REDIRECT_URI")
 BACKEND_URL = os.getenv("BACKEND_URL")  # e.g. https://runningtunes.onrender.com
+BACKEND_API_TOKEN = os.getenv("BACKEND_API_TOKEN")  # shown on the Settings page
+JOURNAL_PATH = os.getenv("TRACKER_JOURNAL", "tracker_journal.db")
+
+# Longest wait between upload retries while the backend is unreachable
+MAX_UPLOAD_BACKOFF = 300
 
 # Set up Spotify auth
 sp = spotipy.Spotify(auth_manager=SpotifyOAuth(
     client_id=SPOTIFY_CLIENT_ID,
     client_secret=SPOTIFY_CLIENT_SECRET,
     redirect_uri=SPOTIFY_REDIRECT_URI,
-    scope="user-read-currently-playing user-read-playback-state"
+    scope="user-read-currently-playing user-read-playback-state user-read-recently-played"
 ))
 
-logged_songs = []
+journal = TrackJournal(JOURNAL_PATH)
+session = requests.Session()
+if BACKEND_API_TOKEN:
+    session.headers['Authorization'] = f"Bearer {BACKEND_API_TOKEN}"
+
+# Only the last track is kept in memory; the journal holds the history
+last_track = None
+upload_backoff = POLL_SECONDS
+next_upload_at = 0
+schedule = PollSchedule()
+api_calls = 0
 
 def log_current_track():
+    """Sample playback once; returns the playback state, or None when nothing is playing"""
+    global last_track, api_calls
+    api_calls += 1
     current = sp.current_playback()
+    now = datetime.now(timezone.utc)
     if current and current['is_playing'] and current['item']:
+        item = current['item']
         song = {
-            'name': current['item']['name'],
-            'artist': current['item']['artists'][0]['name'],
-            'played_at': datetime.now(timezone.utc).isoformat()
+            'name': item['name'],
+            'artist': item['artists'][0]['name'],
+            'played_at': now.isoformat()
         }
 
-        if not logged_songs or song != logged_songs[-1]:
-            logged_songs.append(song)
+        # Local files have no Spotify ID, so fall back to name and artist
+        track = item.get('id') or (song['name'], song['artist'])
+        if track != last_track:
+            last_track = track
+            start = track_start_sample(song, current, now)
+            if start:
+                journal.append(start)
             print(f"🎵 Logged: {song['name']} by {song['artist']} at {song['played_at']}")
 
-            try:
-                # Send to Flask backend
-                response = requests.post(f"{BACKEND_URL}/log-spotify", json=song)
-                if response.ok:
-                    print("✅ Sent to backend.")
-                else:
-                    print("⚠️ Failed to send to backend:", response.text)
-            except Exception as e:
-                print("❌ Error sending to backend:", e)
-    else:
-        print("No music playing.")
+        # Every sample is journaled; the backend folds repeats into one play
+        journal.append(song)
+        return current
+
+    last_track = None
+    print("No music playing.")
+    return None
+
+def fill_gaps(since):
+    """Journal tracks Spotify reports as played after `since` (unix time).
+
+    Used after a long gap between polls (idle backoff, sleep, errors), when
+    whole tracks may have gone unsampled. Each gets one sample at its
+    played_at; repeats of samples already journaled are ignored by the backend.
+    """
+    global api_calls
+    api_calls += 1
+    recent = sp.current_user_recently_played(limit=50, after=int(since * 1000))
+    items = (recent or {}).get('items', [])
+    for item in items:
+        journal.append({
+            'name': item['track']['name'],
+            'artist': item['track']['artists'][0]['name'],
+            'played_at': item['played_at']
+        })
+    if items:
+        print(f"🔁 Filled {len(items)} tracks from recently played.")
+
+def flush_to_backend():
+    """Upload pending journal entries, backing off exponentially while the backend is unreachable"""
+    global upload_backoff, next_upload_at
+    if time.time() < next_upload_at:
+        return
+    try:
+        sent = upload_pending(journal, BACKEND_URL, session)
+        if sent:
+            print(f"✅ Sent {sent} samples to backend.")
+        upload_backoff = POLL_SECONDS
+        next_upload_at = 0
+    except Exception as e:
+        pending = journal.pending_count()
+        print(f"❌ Error sending to backend ({pending} pending, retrying in {upload_backoff}s):", e)
+        next_upload_at = time.time() + upload_backoff
+        upload_backoff = min(upload_backoff * 2, MAX_UPLOAD_BACKOFF)
 
+session_started = time.time()
+last_poll_at = None
 try:
     print("🎧 Starting Spotify track logger...")
+    journal.prune()
     while True:
-        log_current_track()
-        time.sleep(45)  # every 45 secs
+        polled_at = time.time()
+        current = None
+        try:
+            current = log_current_track()
+            if missed_polls(last_poll_at, polled_at):
+                fill_gaps(last_poll_at)
+            last_poll_at = polled_at
+        except Exception as e:
+            print("❌ Error reading playback:", e)
+        flush_to_backend()
+        time.sleep(schedule.next_delay(current))
 except KeyboardInterrupt:
     print("\n🛑 Logging stopped.")
+    hours = max((time.time() - session_started) / 3600, 1 / 60)
+    print(f"📊 {api_calls} Spotify API calls ({api_calls / hours:.0f}/hour)")
+    next_upload_at = 0
+    flush_to_backend()
     with open("spotify_log.json", "w") as f:
-        json.dump(logged_songs, f, indent=2)
+        json.dump(journal.since(session_started), f, indent=2)
     print("💾 Songs saved to spotify_log.json")
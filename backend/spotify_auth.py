@@ -0,0 +1,75 @@
+import base64
+import threading
+import time
+
+import requests
+
+SPOTIFY_TOKEN_URL = 'https://accounts.spotify.com/api/token'
+
+
+class SpotifyTokenManager:
+    """Caches the app-only (client credentials) Spotify token until shortly before it expires.
+
+    Refreshes are single-flight: when the token is stale, one thread does
+    the POST while any others wait on the lock and reuse its result.
+    """
+
+    def __init__(self, client_id, client_secret, http, refresh_margin=60, token_url=SPOTIFY_TOKEN_URL):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.http = http
+        self.refresh_margin = refresh_margin
+        self.token_url = token_url
+        # (token, expires_at) swapped as one tuple so readers never see a torn pair
+        self._cached = (None, 0)
+        self._lock = threading.Lock()
+        self.refresh_count = 0
+
+    def _fresh_token(self):
+        token, expires_at = self._cached
+        if token is not None and time.time() < expires_at - self.refresh_margin:
+            return token
+        return None
+
+    def get_token(self):
+        """Return a valid access token, or None if credentials are missing or Spotify refused"""
+        if not self.client_id or not self.client_secret:
+            return None
+        token = self._fresh_token()
+        if token:
+            return token
+
+        with self._lock:
+            # Another thread may have refreshed while we waited for the lock
+            token = self._fresh_token()
+            if token:
+                return token
+            return self._refresh()
+
+    def invalidate(self):
+        """Drop the cached token, e.g. after Spotify answered 401 with it"""
+        with self._lock:
+            self._cached = (None, 0)
+
+    def _refresh(self):
+        auth_string = f"{self.client_id}:{self.client_secret}"
+        auth_base64 = base64.b64encode(auth_string.encode()).decode()
+
+        headers = {
+            'Authorization': f'Basic {auth_base64}',
+            'Content-Type': 'application/x-www-form-urlencoded'
+        }
+
+        try:
+            response = self.http.post(self.token_url, endpoint='spotify.token', headers=headers,
+                                      data={'grant_type': 'client_credentials'})
+        except requests.RequestException:
+            return None
+        if response.status_code != 200:
+            return None
+
+        data = response.json()
+        token = data.get('access_token')
+        self._cached = (token, time.time() + data.get('expires_in', 3600))
+        self.refresh_count += 1
+        return token
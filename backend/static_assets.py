@@ -0,0 +1,135 @@
+"""The bundled React frontend, indexed and compressed once at startup.
+
+Every file under the build directory is read when the app is imported:
+its bytes, a content hash for the ETag and, for text assets, gzip (and
+brotli, when the optional `brotli` package is installed) variants. A page
+load is then a dictionary lookup and a write of bytes already in memory,
+with no filesystem probes and no per-request compression.
+
+The hashed bundles that asset-manifest.json lists under static/ never
+change for a given URL and are sent as immutable for a year; everything
+else (index.html, manifest.json, icons) is revalidated with its ETag on
+each load, which costs a 304 when nothing was redeployed.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE_CONTROL = 'no-cache'
+# Types worth compressing; images and fonts are already compressed
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml',
+                      'image/x-icon', 'image/vnd.microsoft.icon')
+# Smaller files fit in a packet either way
+MIN_COMPRESS_BYTES = 512
+# Files larger than this are streamed from disk instead of held in memory
+MAX_MEMORY_BYTES = 8 * 1024 * 1024
+
+
+class StaticAsset:
+    """One build file: its body, compressed variants and cache headers"""
+
+    __slots__ = ('path', 'mimetype', 'etag', 'cache_control', 'body', 'variants', 'size')
+
+    def __init__(self, path, mimetype, etag, cache_control, body, variants, size):
+        self.path = path
+        self.mimetype = mimetype
+        self.etag = etag
+        self.cache_control = cache_control
+        # None for files streamed from disk
+        self.body = body
+        # {'br' | 'gzip': bytes}, only where smaller than the body
+        self.variants = variants
+        self.size = size
+
+
+def _compressible(mimetype):
+    return mimetype.startswith(COMPRESSIBLE_TYPES)
+
+
+def _variants(body):
+    variants = {}
+    if brotli is not None:
+        variants['br'] = brotli.compress(body, quality=11)
+    variants['gzip'] = gzip.compress(body, compresslevel=9, mtime=0)
+    return {encoding: data for encoding, data in variants.items() if len(data) < len(body) * 0.9}
+
+
+class StaticAssets:
+    """In-memory manifest of a frontend build directory"""
+
+    def __init__(self, root):
+        self.root = root
+        self.assets = {}
+        self.hashed = set()
+        self.index = None
+        self.stats = {'bytes': 0, 'compressed_bytes': 0, 'files': 0}
+        if os.path.isdir(root):
+            self._load()
+        else:
+            print(f"Frontend build not found at {root}; only the API is served")
+
+    def _load(self):
+        try:
+            with open(os.path.join(self.root, 'asset-manifest.json')) as f:
+                manifest = json.load(f)
+            self.hashed = {url.lstrip('/') for url in manifest.get('files', {}).values()
+                           if url.lstrip('/').startswith('static/')}
+        except (OSError, ValueError) as e:
+            print(f"Could not read asset-manifest.json, no assets will be cached as immutable: {e}")
+
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                full = os.path.join(directory, name)
+                path = os.path.relpath(full, self.root).replace(os.sep, '/')
+                self.assets[path] = self._index_file(path, full)
+        self.index = self.assets.get('index.html')
+        self.stats['files'] = len(self.assets)
+
+    def _index_file(self, path, full):
+        # Source maps are JSON but unknown to mimetypes
+        mimetype = 'application/json' if path.endswith('.map') else mimetypes.guess_type(path)[0]
+        mimetype = mimetype or 'application/octet-stream'
+        if mimetype.startswith('text/') or mimetype == 'application/javascript':
+            mimetype += '; charset=utf-8'
+        cache_control = IMMUTABLE_CACHE_CONTROL if path in self.hashed else REVALIDATE_CACHE_CONTROL
+        size = os.path.getsize(full)
+
+        digest = hashlib.sha1()
+        body = None
+        with open(full, 'rb') as f:
+            if size <= MAX_MEMORY_BYTES:
+                body = f.read()
+                digest.update(body)
+            else:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    digest.update(chunk)
+
+        variants = {}
+        if body is not None and size >= MIN_COMPRESS_BYTES and _compressible(mimetype):
+            variants = _variants(body)
+        self.stats['bytes'] += size
+        self.stats['compressed_bytes'] += sum(len(v) for v in variants.values())
+        return StaticAsset(path, mimetype, digest.hexdigest()[:20], cache_control, body, variants, size)
+
+    def find(self, path):
+        """The asset for a request path, index.html for client-side routes, or None.
+
+        Missing files under static/ are not answered with index.html: a
+        bundle from an older deploy should 404 rather than be parsed as HTML.
+        """
+        asset = self.assets.get(path)
+        if asset is None and not path.startswith('static/'):
+            asset = self.index
+        return asset
+
+    def snapshot(self):
+        """Sizes of the indexed build, for the debug endpoint"""
+        return {**self.stats, 'root': self.root, 'brotli': brotli is not None}
@@ -0,0 +1,153 @@
+import threading
+import time
+
+import requests
+
+from db import get_user_tokens, update_user_tokens
+
+STRAVA_TOKEN_URL = 'https://www.strava.com/oauth/token'
+
+
+class StravaTokenError(Exception):
+    """Strava could not be reached or refused to refresh an athlete's token"""
+
+
+class StravaTokenManager:
+    """Per-athlete Strava access tokens, cached in memory and refreshed single-flight.
+
+    Each athlete has their own lock: when a token is stale one thread does
+    the refresh while the others wait and reuse the result, so a rotated
+    refresh token is never used twice. Before refreshing, the stored tokens
+    are re-read in case another worker process refreshed them first.
+
+    A background scheduler refreshes the tokens of recently active athletes
+    shortly before they expire, so request paths normally find a valid
+    token in memory.
+    """
+
+    def __init__(self, client_id, client_secret, http, refresh_margin=60, token_url=STRAVA_TOKEN_URL):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.http = http
+        self.refresh_margin = refresh_margin
+        self.token_url = token_url
+        # athlete_id -> (token, expires_at), each pair swapped as one tuple
+        self._cached = {}
+        # athlete_id -> unix time the token was last asked for
+        self._last_used = {}
+        # athlete_id -> unix time before which the scheduler leaves a failing refresh alone
+        self._retry_at = {}
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        self._stop = threading.Event()
+        self._scheduler = None
+        self.refresh_count = 0
+
+    def _lock_for(self, athlete_id):
+        with self._locks_guard:
+            return self._locks.setdefault(athlete_id, threading.Lock())
+
+    def _fresh_token(self, athlete_id, margin):
+        token, expires_at = self._cached.get(athlete_id, (None, 0))
+        if token is not None and time.time() < expires_at - margin:
+            return token
+        return None
+
+    def get_token(self, athlete_id):
+        """A valid access token, or None if the athlete never connected.
+
+        Raises StravaTokenError when a needed refresh fails.
+        """
+        self._last_used[athlete_id] = time.time()
+        token = self._fresh_token(athlete_id, self.refresh_margin)
+        if token:
+            return token
+
+        with self._lock_for(athlete_id):
+            # Another thread may have refreshed while we waited for the lock
+            token = self._fresh_token(athlete_id, self.refresh_margin)
+            if token:
+                return token
+            return self._load_or_refresh(athlete_id, self.refresh_margin)
+
+    def remember(self, athlete_id, access_token, expires_at):
+        """Cache a token that just came from the OAuth code exchange"""
+        with self._lock_for(athlete_id):
+            self._cached[athlete_id] = (access_token, expires_at)
+            self._retry_at.pop(athlete_id, None)
+
+    def _load_or_refresh(self, athlete_id, margin):
+        row = get_user_tokens(athlete_id)
+        if not row:
+            return None
+        access_token, refresh_token, expires_at = row
+        if access_token and time.time() < expires_at - margin:
+            self._cached[athlete_id] = (access_token, expires_at)
+            return access_token
+        return self._refresh(athlete_id, refresh_token)
+
+    def _refresh(self, athlete_id, refresh_token):
+        try:
+            response = self.http.post(self.token_url, endpoint='strava.oauth.token', data={
+                'client_id': self.client_id,
+                'client_secret': self.client_secret,
+                'grant_type': 'refresh_token',
+                'refresh_token': refresh_token
+            })
+        except requests.RequestException as e:
+            raise StravaTokenError(f'Token refresh failed: {e}') from e
+        if response.status_code != 200:
+            raise StravaTokenError(f'Token refresh answered {response.status_code}')
+
+        data = response.json()
+        update_user_tokens(athlete_id, data['access_token'], data['refresh_token'], data['expires_at'])
+        self._cached[athlete_id] = (data['access_token'], data['expires_at'])
+        self.refresh_count += 1
+        return data['access_token']
+
+    def refresh_expiring(self, lead_seconds, active_seconds=24 * 3600, retry_seconds=900):
+        """Refresh tokens expiring within lead_seconds for athletes used in the last active_seconds.
+
+        Returns how many tokens were refreshed. Failures are logged and the
+        athlete is skipped for retry_seconds; the request path still
+        refreshes on demand in the meantime.
+        """
+        now = time.time()
+        refreshed = 0
+        for athlete_id, last_used in list(self._last_used.items()):
+            if now - last_used > active_seconds:
+                self._last_used.pop(athlete_id, None)
+                self._cached.pop(athlete_id, None)
+                continue
+            if self._fresh_token(athlete_id, lead_seconds) or self._retry_at.get(athlete_id, 0) > now:
+                continue
+            with self._lock_for(athlete_id):
+                if self._fresh_token(athlete_id, lead_seconds):
+                    continue
+                before = self.refresh_count
+                try:
+                    self._load_or_refresh(athlete_id, lead_seconds)
+                except StravaTokenError as e:
+                    print(f"Proactive token refresh failed for {athlete_id}: {e}")
+                    self._retry_at[athlete_id] = now + retry_seconds
+                refreshed += self.refresh_count - before
+        return refreshed
+
+    def _schedule(self, interval, lead_seconds):
+        while not self._stop.wait(interval):
+            try:
+                self.refresh_expiring(lead_seconds)
+            except Exception as e:
+                print(f"Token refresh scheduler error: {e}")
+
+    def start_scheduler(self, interval=60, lead_seconds=600):
+        """Start a daemon thread that calls refresh_expiring every `interval` seconds"""
+        self._scheduler = threading.Thread(target=self._schedule, args=(interval, lead_seconds),
+                                           name='strava-token-refresh', daemon=True)
+        self._scheduler.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._scheduler:
+            self._scheduler.join()
+            self._scheduler = None
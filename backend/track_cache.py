@@ -0,0 +1,115 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+# Returned by TrackMetadataCache.get when nothing is cached for a track.
+# A cached None means Spotify was asked and had no match (negative entry).
+MISSING = object()
+
+
+def normalize_key(name, artist):
+    """Cache key that ignores case and extra whitespace in track/artist names"""
+    def norm(value):
+        return ' '.join((value or '').split()).casefold()
+    return f"{norm(name)}|{norm(artist)}"
+
+
+class TrackMetadataCache:
+    """Two-tier cache for Spotify track metadata.
+
+    Lookups go to a bounded in-process LRU first, then to a SQLite table
+    that survives restarts. Entries expire after ttl_seconds, misses
+    (tracks Spotify has no match for) after negative_ttl_seconds.
+    """
+
+    def __init__(self, db, max_entries=2048, ttl_seconds=30 * 24 * 3600,
+                 negative_ttl_seconds=24 * 3600):
+        self.db = db
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'memory_hits': 0, 'db_hits': 0, 'negative_hits': 0, 'misses': 0, 'stores': 0}
+        self._init_table()
+
+    def _init_table(self):
+        with self.db.transaction() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS track_metadata (
+                    cache_key TEXT PRIMARY KEY,
+                    data TEXT,
+                    fetched_at INTEGER NOT NULL
+                )
+            ''')
+
+    def _expired(self, data, fetched_at, now):
+        ttl = self.ttl_seconds if data is not None else self.negative_ttl_seconds
+        return now - fetched_at > ttl
+
+    def _remember(self, key, data, fetched_at):
+        self._lru[key] = (data, fetched_at)
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+
+    def _count(self, stat):
+        with self._lock:
+            self.stats[stat] += 1
+
+    def get(self, name, artist):
+        """Cached metadata dict, None for a cached miss, or MISSING"""
+        key = normalize_key(name, artist)
+        now = int(time.time())
+
+        with self._lock:
+            entry = self._lru.get(key)
+            if entry is not None:
+                if not self._expired(entry[0], entry[1], now):
+                    self._lru.move_to_end(key)
+                    self.stats['memory_hits'] += 1
+                    if entry[0] is None:
+                        self.stats['negative_hits'] += 1
+                    return entry[0]
+                del self._lru[key]
+
+        row = self.db.connection().execute(
+            'SELECT data, fetched_at FROM track_metadata WHERE cache_key=?', (key,)
+        ).fetchone()
+
+        if row:
+            data = json.loads(row[0]) if row[0] is not None else None
+            if not self._expired(data, row[1], now):
+                with self._lock:
+                    self._remember(key, data, row[1])
+                    self.stats['db_hits'] += 1
+                    if data is None:
+                        self.stats['negative_hits'] += 1
+                return data
+
+        self._count('misses')
+        return MISSING
+
+    def put(self, name, artist, data):
+        """Store metadata for a track, or None to record that Spotify had no match"""
+        key = normalize_key(name, artist)
+        now = int(time.time())
+        with self.db.transaction() as conn:
+            conn.execute('INSERT OR REPLACE INTO track_metadata (cache_key, data, fetched_at) VALUES (?, ?, ?)',
+                         (key, json.dumps(data) if data is not None else None, now))
+        with self._lock:
+            self._remember(key, data, now)
+            self.stats['stores'] += 1
+
+    def snapshot(self):
+        """Counters plus the current LRU size, for the debug endpoint"""
+        with self._lock:
+            lookups = self.stats['memory_hits'] + self.stats['db_hits'] + self.stats['misses']
+            hits = self.stats['memory_hits'] + self.stats['db_hits']
+            return {
+                **self.stats,
+                'lru_size': len(self._lru),
+                'lru_max_entries': self.max_entries,
+                'hit_rate': round(hits / lookups, 4) if lookups else None
+            }
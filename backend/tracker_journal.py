@@ -0,0 +1,100 @@
+import sqlite3
+import time
+
+import requests
+
+# Records per POST to /log-spotify/batch
+UPLOAD_BATCH_SIZE = 200
+# Sent records are kept this long so a short backend rollback can be replayed
+KEEP_SENT_SECONDS = 7 * 24 * 3600
+
+
+class TrackJournal:
+    """Append-only local log of playback samples for the tracker.
+
+    Every sample is committed to SQLite before it is uploaded, so a crash or
+    a backend outage loses nothing: unsent rows stay in the journal and are
+    retried in batches on the next upload.
+
+    Samples carry the tracker account they belong to, so one journal can
+    serve the multi-account tracker service; the single-user tracker leaves
+    it NULL.
+    """
+
+    def __init__(self, path='tracker_journal.db'):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS samples (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                artist TEXT NOT NULL,
+                played_at TEXT NOT NULL,
+                recorded_at REAL NOT NULL,
+                sent INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        columns = [row[1] for row in self.conn.execute('PRAGMA table_info(samples)')]
+        if 'account' not in columns:
+            self.conn.execute('ALTER TABLE samples ADD COLUMN account TEXT')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_samples_sent ON samples (sent, id)')
+        self.conn.commit()
+
+    def append(self, song, account=None):
+        self.append_many([song], account)
+
+    def append_many(self, songs, account=None):
+        now = time.time()
+        with self.conn:
+            self.conn.executemany('''
+                INSERT INTO samples (name, artist, played_at, recorded_at, account) VALUES (?, ?, ?, ?, ?)
+            ''', [(s['name'], s['artist'], s['played_at'], now, account) for s in songs])
+
+    def pending(self, limit=UPLOAD_BATCH_SIZE, account=None):
+        """Oldest unsent samples of one account as (id, song) pairs"""
+        rows = self.conn.execute('''
+            SELECT id, name, artist, played_at FROM samples WHERE sent = 0 AND account IS ? ORDER BY id LIMIT ?
+        ''', (account, limit)).fetchall()
+        return [(r[0], {'name': r[1], 'artist': r[2], 'played_at': r[3]}) for r in rows]
+
+    def pending_accounts(self):
+        """Accounts with unsent samples"""
+        return [r[0] for r in self.conn.execute('SELECT DISTINCT account FROM samples WHERE sent = 0')]
+
+    def pending_count(self):
+        return self.conn.execute('SELECT COUNT(*) FROM samples WHERE sent = 0').fetchone()[0]
+
+    def mark_sent(self, ids):
+        with self.conn:
+            self.conn.executemany('UPDATE samples SET sent = 1 WHERE id = ?', [(i,) for i in ids])
+
+    def prune(self, keep_seconds=KEEP_SENT_SECONDS):
+        with self.conn:
+            self.conn.execute('DELETE FROM samples WHERE sent = 1 AND recorded_at < ?', (time.time() - keep_seconds,))
+
+    def since(self, recorded_after):
+        """Samples recorded after a unix time, oldest first"""
+        rows = self.conn.execute('''
+            SELECT name, artist, played_at FROM samples WHERE recorded_at >= ? ORDER BY id
+        ''', (recorded_after,)).fetchall()
+        return [{'name': r[0], 'artist': r[1], 'played_at': r[2]} for r in rows]
+
+
+def upload_pending(journal, backend_url, session=requests, timeout=10):
+    """Send unsent samples to the backend in batches.
+
+    Returns the number of samples the backend acknowledged. Raises on a
+    network error or non-2xx answer so the caller can back off; whatever was
+    not acknowledged stays pending for the next attempt.
+    """
+    sent = 0
+    while True:
+        batch = journal.pending()
+        if not batch:
+            return sent
+        response = session.post(f"{backend_url}/log-spotify/batch",
+                                json=[song for _, song in batch], timeout=timeout)
+        response.raise_for_status()
+        journal.mark_sent([row_id for row_id, _ in batch])
+        sent += len(batch)
@@ -0,0 +1,56 @@
+"""When the Spotify trackers poll (spotifyTracking.py, and the multi-account service).
+
+While a track plays, the next poll lands just after it should end, so
+each track is sampled about once; while nothing plays, polling backs off
+exponentially. The longest wait while playing stays under the backend's
+play gap, so samples of one long track still join into one play.
+"""
+from datetime import timedelta
+
+from constants import PLAY_GAP_SECONDS
+
+POLL_SECONDS = 45
+# Longest wait between polls while a track plays, with headroom under the play gap
+MAX_PLAYING_POLL = PLAY_GAP_SECONDS - 30
+# Poll this long after the current track should end, to catch the next one
+TRACK_END_MARGIN = 2
+# Idle polling starts at POLL_SECONDS and doubles up to this
+MAX_IDLE_POLL = 15 * 60
+# A longer gap between polls may have missed whole tracks
+MAX_POLL_GAP = MAX_PLAYING_POLL + TRACK_END_MARGIN
+
+
+class PollSchedule:
+    """Poll timing for one Spotify account"""
+
+    __slots__ = ('idle_delay',)
+
+    def __init__(self):
+        self.idle_delay = POLL_SECONDS
+
+    def next_delay(self, current):
+        """Seconds to sleep: just past the end of the current track, or an exponential backoff while idle"""
+        if current is None:
+            delay = self.idle_delay
+            self.idle_delay = min(self.idle_delay * 2, MAX_IDLE_POLL)
+            return delay
+        self.idle_delay = POLL_SECONDS
+        remaining_ms = (current['item'].get('duration_ms') or 0) - (current.get('progress_ms') or 0)
+        return max(1, min(remaining_ms / 1000 + TRACK_END_MARGIN, MAX_PLAYING_POLL))
+
+
+def track_start_sample(song, current, now):
+    """A copy of the first sample of a track backdated to when it started, or None.
+
+    The play then covers the part before this poll. Only tracks that
+    started within MAX_PLAYING_POLL are backdated.
+    """
+    progress_ms = current.get('progress_ms') or 0
+    if 0 < progress_ms <= MAX_PLAYING_POLL * 1000:
+        return {**song, 'played_at': (now - timedelta(milliseconds=progress_ms)).isoformat()}
+    return None
+
+
+def missed_polls(last_poll_at, polled_at):
+    """Whether tracks may have gone unsampled between two polls (unix times)"""
+    return bool(last_poll_at) and polled_at - last_poll_at > MAX_POLL_GAP
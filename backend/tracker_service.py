@@ -0,0 +1,349 @@
+"""Track many Spotify accounts from one asyncio process.
+
+Each account is a small object plus one polling task, so a club of runners
+needs one process instead of one spotifyTracking.py per user. Polling uses
+the single-user tracker's schedule from tracker_schedule.py (wake just
+after the current track ends, back off while idle) with added jitter so
+accounts do not poll in lockstep. All Spotify calls draw from one shared rate budget, and samples
+go to one journal that a single uploader drains in per-account batches.
+
+Accounts come from a JSON file (TRACKER_ACCOUNTS, default
+tracker_accounts.json):
+
+    [{"name": "alice", "refresh_token": "...", "backend_token": "..."}]
+
+refresh_token is the user's Spotify refresh token (from the cache file
+spotifyTracking.py writes after the first login). backend_token is the API
+token shown on their Settings page. Rotated refresh tokens are written back
+to the file.
+
+Usage: python tracker_service.py
+"""
+import asyncio
+import base64
+import json
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import requests
+
+from tracker_journal import TrackJournal
+from tracker_schedule import POLL_SECONDS, PollSchedule, missed_polls, track_start_sample
+
+# Up to this many seconds are added to every wait so accounts drift apart
+POLL_JITTER = 3
+# Spotify calls per second across all accounts, and the burst allowed
+SPOTIFY_CALLS_PER_SECOND = float(os.getenv('TRACKER_CALLS_PER_SECOND', '5'))
+SPOTIFY_BURST = 20
+# Threads doing blocking HTTP for the event loop
+HTTP_CONCURRENCY = int(os.getenv('TRACKER_HTTP_CONCURRENCY', '16'))
+UPLOAD_SECONDS = 30
+MAX_UPLOAD_BACKOFF = 300
+# Refresh access tokens this long before Spotify says they expire
+TOKEN_REFRESH_MARGIN = 60
+
+SPOTIFY_API_URL = 'https://api.spotify.com'
+SPOTIFY_ACCOUNTS_URL = 'https://accounts.spotify.com'
+
+
+class RateBudget:
+    """Token bucket shared by every account's Spotify calls.
+
+    A 429 pauses the whole bucket for its Retry-After, since Spotify rate
+    limits the app, not the user.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._paused_until = 0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds):
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+class Account:
+    """One tracked Spotify user and their polling state"""
+
+    __slots__ = ('name', 'refresh_token', 'backend_token', 'access_token', 'expires_at', 'token_lock',
+                 'last_track', 'schedule', 'last_poll_at', 'api_calls')
+
+    def __init__(self, name, refresh_token, backend_token):
+        self.name = name
+        self.refresh_token = refresh_token
+        self.backend_token = backend_token
+        self.access_token = None
+        self.expires_at = 0
+        self.token_lock = asyncio.Lock()
+        self.last_track = None
+        self.schedule = PollSchedule()
+        self.last_poll_at = None
+        self.api_calls = 0
+
+
+def load_accounts(path):
+    with open(path) as f:
+        return [Account(a['name'], a['refresh_token'], a['backend_token']) for a in json.load(f)]
+
+
+def save_accounts(path, accounts):
+    """Write accounts back (e.g. after a refresh token rotated), atomically"""
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump([{'name': a.name, 'refresh_token': a.refresh_token, 'backend_token': a.backend_token}
+                   for a in accounts], f, indent=2)
+    os.replace(tmp, path)
+
+
+class TrackerService:
+    def __init__(self, accounts, journal, backend_url, client_id, client_secret, budget=None,
+                 api_url=SPOTIFY_API_URL, accounts_url=SPOTIFY_ACCOUNTS_URL, accounts_path=None,
+                 start_jitter=POLL_SECONDS):
+        self.accounts = {a.name: a for a in accounts}
+        self.journal = journal
+        self.backend_url = backend_url
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.budget = budget or RateBudget(SPOTIFY_CALLS_PER_SECOND, SPOTIFY_BURST)
+        self.api_url = api_url
+        self.accounts_url = accounts_url
+        self.accounts_path = accounts_path
+        self.start_jitter = start_jitter
+        self.executor = ThreadPoolExecutor(max_workers=HTTP_CONCURRENCY, thread_name_prefix='tracker-http')
+        self.http = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=HTTP_CONCURRENCY)
+        self.http.mount('http://', adapter)
+        self.http.mount('https://', adapter)
+        self.started = time.time()
+        self.token_refreshes = 0
+        self.samples = 0
+        self.uploaded = 0
+
+    async def _request(self, method, url, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, lambda: self.http.request(method, url, timeout=10, **kwargs))
+
+    # ============ SPOTIFY ============
+
+    async def _token(self, account):
+        """The account's access token, refreshed single-flight when stale"""
+        if account.access_token and time.time() < account.expires_at - TOKEN_REFRESH_MARGIN:
+            return account.access_token
+        async with account.token_lock:
+            if account.access_token and time.time() < account.expires_at - TOKEN_REFRESH_MARGIN:
+                return account.access_token
+            basic = base64.b64encode(f'{self.client_id}:{self.client_secret}'.encode()).decode()
+            await self.budget.acquire()
+            response = await self._request('POST', f'{self.accounts_url}/api/token',
+                                           headers={'Authorization': f'Basic {basic}'},
+                                           data={'grant_type': 'refresh_token',
+                                                 'refresh_token': account.refresh_token})
+            response.raise_for_status()
+            data = response.json()
+            account.access_token = data['access_token']
+            account.expires_at = time.time() + data.get('expires_in', 3600)
+            self.token_refreshes += 1
+            rotated = data.get('refresh_token')
+            if rotated and rotated != account.refresh_token:
+                account.refresh_token = rotated
+                if self.accounts_path:
+                    save_accounts(self.accounts_path, self.accounts.values())
+            return account.access_token
+
+    async def _spotify_get(self, account, path, params=None):
+        """GET a Web API path for the account; returns the JSON body or None for 204"""
+        for attempt in range(2):
+            token = await self._token(account)
+            await self.budget.acquire()
+            account.api_calls += 1
+            response = await self._request('GET', f'{self.api_url}{path}', params=params,
+                                           headers={'Authorization': f'Bearer {token}'})
+            if response.status_code == 429:
+                self.budget.pause(int(response.headers.get('Retry-After', 1)))
+                continue
+            if response.status_code == 401 and attempt == 0:
+                account.access_token = None
+                continue
+            response.raise_for_status()
+            return response.json() if response.status_code != 204 and response.content else None
+        response.raise_for_status()
+        return None
+
+    async def poll(self, account):
+        """Sample the account's playback once; returns the playback state, or None when idle"""
+        current = await self._spotify_get(account, '/v1/me/player')
+        now = datetime.now(timezone.utc)
+        if not (current and current.get('is_playing') and current.get('item')):
+            account.last_track = None
+            return None
+
+        item = current['item']
+        song = {'name': item['name'], 'artist': item['artists'][0]['name'], 'played_at': now.isoformat()}
+        songs = [song]
+        track = item.get('id') or (song['name'], song['artist'])
+        if track != account.last_track:
+            account.last_track = track
+            start = track_start_sample(song, current, now)
+            if start:
+                songs.insert(0, start)
+        self.journal.append_many(songs, account.name)
+        self.samples += len(songs)
+        return current
+
+    async def fill_gaps(self, account, since):
+        """Journal tracks played after `since` (unix time) that polling may have missed"""
+        recent = await self._spotify_get(account, '/v1/me/player/recently-played',
+                                         {'limit': 50, 'after': int(since * 1000)})
+        songs = [{'name': i['track']['name'], 'artist': i['track']['artists'][0]['name'],
+                  'played_at': i['played_at']} for i in (recent or {}).get('items', [])]
+        if songs:
+            self.journal.append_many(songs, account.name)
+            self.samples += len(songs)
+
+    async def run_account(self, account):
+        await asyncio.sleep(random.uniform(0, self.start_jitter))
+        while True:
+            polled_at = time.time()
+            current = None
+            try:
+                current = await self.poll(account)
+                if missed_polls(account.last_poll_at, polled_at):
+                    await self.fill_gaps(account, account.last_poll_at)
+                account.last_poll_at = polled_at
+            except Exception as e:
+                # One account's failure must not end its task, which would stop the service
+                print(f"❌ {account.name}: error reading playback: {e}")
+            await asyncio.sleep(account.schedule.next_delay(current) + random.uniform(0, POLL_JITTER))
+
+    # ============ UPLOADS ============
+
+    async def upload_account(self, account):
+        """Send one account's pending samples in batches; returns how many the backend acknowledged"""
+        sent = 0
+        while True:
+            batch = self.journal.pending(account=account.name)
+            if not batch:
+                return sent
+            response = await self._request('POST', f'{self.backend_url}/log-spotify/batch',
+                                           json=[song for _, song in batch],
+                                           headers={'Authorization': f'Bearer {account.backend_token}'})
+            response.raise_for_status()
+            self.journal.mark_sent([row_id for row_id, _ in batch])
+            sent += len(batch)
+            self.uploaded += len(batch)
+
+    async def upload_once(self):
+        """Send every account's pending samples, one batch request at a time.
+
+        An account whose upload fails (say its backend token was revoked)
+        keeps its samples pending and is skipped, so the accounts after it
+        still upload. Returns how many samples the backend acknowledged;
+        raises the first error when no account got anything through, so
+        the caller backs off while the backend is down.
+        """
+        sent = 0
+        error = None
+        for name in self.journal.pending_accounts():
+            account = self.accounts.get(name)
+            if account is None:
+                # Samples from an account that was removed from the file
+                continue
+            try:
+                sent += await self.upload_account(account)
+            except Exception as e:
+                print(f"❌ {name}: error sending to backend, skipping this account: {e}")
+                error = error or e
+        if error and not sent:
+            raise error
+        return sent
+
+    async def upload_loop(self, interval=UPLOAD_SECONDS):
+        backoff = interval
+        while True:
+            await asyncio.sleep(backoff)
+            try:
+                sent = await self.upload_once()
+                if sent:
+                    print(f"✅ Sent {sent} samples to backend.")
+                backoff = interval
+            except Exception as e:
+                backoff = min(backoff * 2, MAX_UPLOAD_BACKOFF)
+                print(f"❌ Error sending to backend ({self.journal.pending_count()} pending, "
+                      f"retrying in {backoff}s): {e}")
+
+    # ============ SERVICE ============
+
+    def stats(self):
+        hours = max((time.time() - self.started) / 3600, 1 / 3600)
+        calls = sum(a.api_calls for a in self.accounts.values())
+        return {
+            'accounts': len(self.accounts),
+            'api_calls': calls,
+            'api_calls_per_account_hour': round(calls / hours / max(len(self.accounts), 1), 1),
+            'token_refreshes': self.token_refreshes,
+            'samples': self.samples,
+            'uploaded': self.uploaded,
+            'pending': self.journal.pending_count()
+        }
+
+    async def run(self, upload_interval=UPLOAD_SECONDS):
+        tasks = [asyncio.create_task(self.run_account(a), name=f'poll-{a.name}') for a in self.accounts.values()]
+        tasks.append(asyncio.create_task(self.upload_loop(upload_interval), name='upload'))
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        self.http.close()
+
+
+def main():
+    from dotenv import load_dotenv
+    load_dotenv()
+    accounts_path = os.getenv('TRACKER_ACCOUNTS', 'tracker_accounts.json')
+    service = TrackerService(
+        load_accounts(accounts_path),
+        TrackJournal(os.getenv('TRACKER_JOURNAL', 'tracker_journal.db')),
+        os.getenv('BACKEND_URL'),
+        os.getenv('SPOTIFY_CLIENT_ID'),
+        os.getenv('SPOTIFY_CLIENT_SECRET'),
+        accounts_path=accounts_path
+    )
+    print(f"🎧 Tracking {len(service.accounts)} Spotify accounts...")
+    service.journal.prune()
+    try:
+        asyncio.run(service.run())
+    except KeyboardInterrupt:
+        print("\n🛑 Tracker service stopped.")
+        print(f"📊 {json.dumps(service.stats())}")
+    finally:
+        service.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -3,15 +3,37 @@ import { NextResponse } from 'next/server';
 
 const BACKEND_URL = process.env.BACKEND_URL || 'http://localhost:5000';
 
-export async function GET() {
+// Identity and validators passed through so the backend knows the runner
+// and can answer 304 Not Modified
+const CONDITIONAL_HEADERS = ['authorization', 'cookie', 'if-none-match', 'if-modified-since'];
+const VALIDATOR_HEADERS = ['etag', 'last-modified', 'cache-control'];
+
+export async function GET(request: Request) {
   try {
+    const headers: Record<string, string> = {
+      'Content-Type': 'application/json',
+    };
+    for (const name of CONDITIONAL_HEADERS) {
+      const value = request.headers.get(name);
+      if (value) headers[name] = value;
+    }
+
     const response = await fetch(`${BACKEND_URL}/api/last-run`, {
       method: 'GET',
-      headers: {
-        'Content-Type': 'application/json',
-      },
+      headers,
+      cache: 'no-store',
     });
 
+    const passthrough: Record<string, string> = {};
+    for (const name of VALIDATOR_HEADERS) {
+      const value = response.headers.get(name);
+      if (value) passthrough[name] = value;
+    }
+
+    if (response.status === 304) {
+      return new NextResponse(null, { status: 304, headers: passthrough });
+    }
+
     if (!response.ok) {
       return NextResponse.json(
         { error: 'Failed to fetch last run data' }, 
@@ -20,7 +42,7 @@ export async function GET() {
     }
 
     const runData = await response.json();
-    return NextResponse.json(runData);
+    return NextResponse.json(runData, { headers: passthrough });
   } catch (error) {
     console.error('Error fetching last run data:', error);
     return NextResponse.json(
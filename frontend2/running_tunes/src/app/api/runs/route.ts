@@ -3,15 +3,39 @@ import { NextResponse } from 'next/server';
 
 const BACKEND_URL = process.env.BACKEND_URL || 'http://localhost:5000';
 
-export async function GET() {
+// Identity and validators passed through so the backend knows the runner
+// and can answer 304 Not Modified
+const CONDITIONAL_HEADERS = ['authorization', 'cookie', 'if-none-match', 'if-modified-since'];
+const VALIDATOR_HEADERS = ['etag', 'last-modified', 'cache-control'];
+
+export async function GET(request: Request) {
   try {
-    const response = await fetch(`${BACKEND_URL}/api/runs`, {
+    const headers: Record<string, string> = {
+      'Content-Type': 'application/json',
+    };
+    for (const name of CONDITIONAL_HEADERS) {
+      const value = request.headers.get(name);
+      if (value) headers[name] = value;
+    }
+
+    // Forward ?cursor= and ?limit= so pages are served by the backend
+    const { search } = new URL(request.url);
+    const response = await fetch(`${BACKEND_URL}/api/runs${search}`, {
       method: 'GET',
-      headers: {
-        'Content-Type': 'application/json',
-      },
+      headers,
+      cache: 'no-store',
     });
 
+    const passthrough: Record<string, string> = {};
+    for (const name of VALIDATOR_HEADERS) {
+      const value = response.headers.get(name);
+      if (value) passthrough[name] = value;
+    }
+
+    if (response.status === 304) {
+      return new NextResponse(null, { status: 304, headers: passthrough });
+    }
+
     if (!response.ok) {
       return NextResponse.json(
         { error: 'Failed to fetch runs data' }, 
@@ -20,7 +44,7 @@ export async function GET() {
     }
 
     const runsData = await response.json();
-    return NextResponse.json(runsData);
+    return NextResponse.json(runsData, { headers: passthrough });
   } catch (error) {
     console.error('Error fetching runs data:', error);
     return NextResponse.json(
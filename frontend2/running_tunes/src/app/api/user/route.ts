@@ -3,13 +3,22 @@ import { NextResponse } from 'next/server';
 
 const BACKEND_URL = process.env.BACKEND_URL || 'http://localhost:5000';
 
-export async function GET() {
+// Identity headers passed through so the backend knows which runner is asking
+const IDENTITY_HEADERS = ['authorization', 'cookie'];
+
+export async function GET(request: Request) {
   try {
+    const headers: Record<string, string> = {
+      'Content-Type': 'application/json',
+    };
+    for (const name of IDENTITY_HEADERS) {
+      const value = request.headers.get(name);
+      if (value) headers[name] = value;
+    }
+
     const response = await fetch(`${BACKEND_URL}/api/user`, {
       method: 'GET',
-      headers: {
-        'Content-Type': 'application/json',
-      },
+      headers,
     });
 
     if (!response.ok) {
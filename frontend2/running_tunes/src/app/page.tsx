@@ -12,6 +12,7 @@ interface Song {
   name: string;
   artist: string;
   played_at: string;
+  duration?: number;
   cover_art?: string;
   spotify_url?: string;
   preview_url?: string;
@@ -40,6 +41,7 @@ interface UserData {
   city?: string;
   state?: string;
   country?: string;
+  api_token?: string;
 }
 
 type PageType = 'home' | 'last-run' | 'all-runs' | 'settings';
@@ -52,6 +54,8 @@ const apiCall = async (endpoint: string, options: RequestInit = {}) => {
     headers: {
       'Content-Type': 'application/json',
     },
+    // Send the backend's session cookie so it knows which runner this is
+    credentials: 'include',
     ...options,
   };
 
@@ -74,6 +78,8 @@ export default function Home() {
   const [status, setStatus] = useState('Loading...');
   const [lastRun, setLastRun] = useState<Run | null>(null);
   const [allRuns, setAllRuns] = useState<Run[]>([]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState<string | null>(null);
   const [currentPage, setCurrentPage] = useState<PageType>('home');
@@ -123,12 +129,28 @@ export default function Home() {
     try {
       const data = await apiCall('/api/runs');
       setAllRuns(data.runs || []);
+      setNextCursor(data.next_cursor || null);
     } catch (err) {
       console.error('Error loading all runs:', err);
       setError('Failed to load runs data');
     }
   };
 
+  const loadMoreRuns = async () => {
+    if (!nextCursor) return;
+    try {
+      setLoadingMore(true);
+      const data = await apiCall(`/api/runs?cursor=${encodeURIComponent(nextCursor)}`);
+      setAllRuns(runs => [...runs, ...(data.runs || [])]);
+      setNextCursor(data.next_cursor || null);
+    } catch (err) {
+      console.error('Error loading more runs:', err);
+      setError('Failed to load runs data');
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   useEffect(() => {
     if (currentPage === 'all-runs' && user) {
       loadAllRuns();
@@ -563,6 +585,15 @@ export default function Home() {
                   {allRuns.map((run, index) => (
                     <RunCard key={run.id || index} run={run} />
                   ))}
+                  {nextCursor && (
+                    <button
+                      onClick={loadMoreRuns}
+                      disabled={loadingMore}
+                      className="bg-white/10 hover:bg-white/20 text-white py-3 rounded-xl border border-white/20 transition-colors disabled:opacity-50"
+                    >
+                      {loadingMore ? 'Loading...' : 'Load more runs'}
+                    </button>
+                  )}
                 </div>
               ) : (
                 <div className="text-center py-12">
@@ -595,6 +626,16 @@ export default function Home() {
                   </div>
                 </div>
 
+                {user.api_token && (
+                  <div className="bg-white/10 rounded-xl p-4">
+                    <h3 className="text-white font-semibold mb-2">Tracker Token</h3>
+                    <div className="text-white/70 text-sm space-y-1">
+                      <p>Set this as BACKEND_API_TOKEN for your Spotify tracker:</p>
+                      <p className="font-mono break-all text-white/90">{user.api_token}</p>
+                    </div>
+                  </div>
+                )}
+
                 <div className="bg-white/10 rounded-xl p-4">
                   <h3 className="text-white font-semibold mb-2">Backend Connection</h3>
                   <div className="text-white/70 text-sm space-y-1">